@@ -90,9 +90,9 @@ function [puppet] = PuppetScan(path)
         % scan puppet bones
         puppet.bones = ScanBones(fid, nbones, nmeshes);
         
-        % test for end of file
+        % test for end of file (optional trailing sections are ignored)
         data = textscan(fid, '%s', 1);
-        if ~isempty(data{1})
+        if ~isempty(data{1}) && ~strcmp(data{1}{1}, 'type')
             error('format');
         end
         
@@ -298,8 +298,12 @@ function [faces, materials] = ScanPerface(fid, nfaces)
         faces(i, :) = data{i}.' + 1; % convert to 1-indexing
     end
     
-    % triangulate (convert ngons into triangles)
-    [faces, indices] = Triangulate(faces);
+    % triangulate (convert ngons into triangles, triangle exports are kept)
+    if ngon == 3
+        indices = 1 : nfaces;
+    else
+        [faces, indices] = Triangulate(faces);
+    end
     
     % assign material indices
     materials = data{end}(indices).' + 1;
@@ -0,0 +1,567 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke Bench - exporter benchmark on synthetic rigs (no Blender needed)
+#
+# Installs a lightweight stand-in for the 'bpy' and 'mathutils' modules, builds
+# a synthetic armature, and times the 'duke_export.py' export stages. Each stage
+# records wall time, peak traced memory (tracemalloc), and bytes written.
+# Results are written as json.
+#
+# USAGE:
+#   python duke_bench.py [--vertices 10000] [--shapes 4] [--bones 32]
+#     [--weights 2] [--materials 4] [--meshes 2] [--frames 100]
+#     [--stages materials,meshes,...] [--repeat 1] [--output bench.json]
+#
+# NOTE : the stand-in implements only what the exporter uses, with bulk
+# foreach_get access backed by NumPy arrays (like Blender's C collections).
+
+# import
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import numpy as np
+
+
+# stand-in mathutils ==========================================================#
+
+# 4x4 matrix (rows indexed as matrix[row][column])
+class Matrix(object):
+    
+    def __init__(self, rows=None):
+        if rows is None:
+            rows = np.eye(4)
+        self.rows = [list(map(float, r)) for r in rows]
+    
+    def __getitem__(self, i):
+        return self.rows[i]
+    
+    def __len__(self):
+        return 4
+    
+    def __iter__(self):
+        return iter(self.rows)
+    
+    def copy(self):
+        return Matrix(self.rows)
+
+
+# 3d vector
+class Vector(object):
+    
+    def __init__(self, values):
+        self.x, self.y, self.z = map(float, values)
+    
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+
+# stand-in bpy ================================================================#
+
+# collection with name lookup and array-backed foreach_get
+class Collection(object):
+    
+    def __init__(self, items=None, arrays=None, length=None, factory=None):
+        self.items = list(items) if items is not None else None
+        self.arrays = arrays or {}
+        self.length = length
+        self.factory = factory
+    
+    def __len__(self):
+        if self.items is not None:
+            return len(self.items)
+        return self.length
+    
+    def __iter__(self):
+        if self.items is not None:
+            return iter(self.items)
+        return (self.factory(i) for i in range(self.length))
+    
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            for item in self:
+                if item.name == key:
+                    return item
+            raise KeyError(key)
+        if self.items is not None:
+            return self.items[key]
+        return self.factory(key)
+    
+    def foreach_get(self, attr, seq):
+        seq[:] = self.arrays[attr].ravel()
+
+
+# generic data block
+class Block(object):
+    
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+# f-curve (sinusoid)
+class FCurve(object):
+    
+    def __init__(self, data_path, array_index, value, amplitude, rate):
+        self.data_path = data_path
+        self.array_index = array_index
+        self.mute = False
+        self.value = value
+        self.amplitude = amplitude
+        self.rate = rate
+    
+    def evaluate(self, frame):
+        return self.value + self.amplitude * np.sin(self.rate * frame)
+
+
+# scene (frame_set poses the synthetic rig)
+class Scene(object):
+    
+    def __init__(self, name, rig, frames):
+        self.name = name
+        self.rig = rig
+        self.frame_start = 1
+        self.frame_end = frames
+        self.frame_current = 1
+        self.duke = None
+    
+    def frame_set(self, frame):
+        self.frame_current = frame
+        self.rig.pose(frame)
+    
+    def update(self):
+        pass
+
+
+# install stand-in modules
+def install():
+    
+    # bpy
+    bpy = types.ModuleType('bpy')
+    bpy.types = types.SimpleNamespace(PropertyGroup=object, Panel=object,
+        Operator=object, Scene=object)
+    bpy.utils = types.SimpleNamespace(register_module=lambda name : None,
+        unregister_module=lambda name : None)
+    bpy.app = types.SimpleNamespace(version=(2, 79, 0), binary_path='blender')
+    bpy.ops = types.SimpleNamespace(wm=types.SimpleNamespace(
+        save_as_mainfile=lambda filepath, copy=False : None))
+    bpy.data = types.SimpleNamespace(materials=Collection([]),
+        objects=Collection([]), scenes=Collection([]),
+        meshes=types.SimpleNamespace(remove=lambda data : None))
+    bpy.context = types.SimpleNamespace(scene=None, object=None)
+    
+    # bpy.props (properties evaluate to their defaults, the first item for
+    # dynamic enum items)
+    props = types.ModuleType('bpy.props')
+    for name in ('BoolProperty', 'FloatProperty', 'IntProperty',
+        'StringProperty', 'PointerProperty'):
+        setattr(props, name, lambda *args, **kwargs : kwargs.get('default'))
+    props.EnumProperty = lambda *args, **kwargs : (kwargs['items'](None,
+        None)[0][0] if callable(kwargs['items']) else kwargs.get('default'))
+    bpy.props = props
+    
+    # mathutils
+    mathutils = types.ModuleType('mathutils')
+    mathutils.Matrix = Matrix
+    mathutils.Vector = Vector
+    
+    # install
+    sys.modules['bpy'] = bpy
+    sys.modules['bpy.props'] = props
+    sys.modules['mathutils'] = mathutils
+    
+    return bpy
+
+
+# synthetic rig ===============================================================#
+
+# random rigid pose as a Matrix
+def random_pose(rng, scale=1.0):
+    
+    # random rotation (qr of a gaussian matrix) and translation
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    pose = np.eye(4, dtype=np.float32)
+    pose[:3, :3] = q
+    pose[:3, 3] = rng.uniform(-scale, scale, 3)
+    
+    return Matrix(pose)
+
+
+# synthetic armature
+class Rig(object):
+    
+    # build rig
+    def __init__(self, vertices=10000, shapes=4, bones=32, weights=2,
+        materials=4, meshes=2, seed=0):
+        
+        rng = np.random.default_rng(seed)
+        
+        # materials (with duke custom properties)
+        self.materials = []
+        for i in range(materials):
+            properties = {'duke_reflectivity' : float(rng.random()),
+                'duke_density' : float(rng.random())}
+            self.materials.append(Block(name='Material.%03d' % i,
+                id_data=properties))
+        
+        # bones (binary tree, every fifth bone does not deform)
+        self.bones = []
+        for i in range(bones):
+            parent = self.bones[(i - 1) // 2] if i else None
+            bone = Block(use_deform=i % 5 != 4,
+                matrix_local=random_pose(rng), use_inherit_rotation=True,
+                use_inherit_scale=True, use_local_location=True)
+            pose_bone = Block(name='Bone.%03d' % i, bone=bone, parent=parent,
+                children=[], matrix=bone.matrix_local.copy(), constraints=[],
+                rotation_mode='QUATERNION', location=[0.0] * 3,
+                rotation_quaternion=[1.0, 0.0, 0.0, 0.0], scale=[1.0] * 3)
+            pose_bone.path_from_id = (lambda name : lambda prop :
+                'pose.bones["%s"].%s' % (name, prop))(pose_bone.name)
+            if parent is not None:
+                parent.children.append(pose_bone)
+            self.bones.append(pose_bone)
+        
+        # action (location and rotation f-curves for every bone)
+        fcurves = []
+        for b in self.bones:
+            for prop, values in (('location', b.location),
+                ('rotation_quaternion', b.rotation_quaternion)):
+                for j, value in enumerate(values):
+                    fcurves.append(FCurve(b.path_from_id(prop), j, value,
+                        float(rng.uniform(0.0, 0.5)),
+                        float(rng.uniform(0.05, 0.5))))
+        animation_data = Block(action=Block(fcurves=fcurves), drivers=[],
+            nla_tracks=[], action_blend_type='REPLACE')
+        
+        # armature
+        self.armature = Block(name='Armature', type='ARMATURE',
+            matrix_world=Matrix(), children=[], parent=None, constraints=[],
+            animation_data=animation_data,
+            data=Block(animation_data=None),
+            pose=Block(bones=Collection(self.bones)))
+        
+        # meshes
+        for i in range(meshes):
+            self.armature.children.append(self.mesh(rng, 'Mesh.%03d' % i,
+                vertices, shapes, bones, weights))
+    
+    
+    # build mesh
+    def mesh(self, rng, name, nvertices, nshapes, nbones, nweights):
+        
+        # vertices
+        co = rng.uniform(-1.0, 1.0, (nvertices, 3)).astype(np.float32)
+        normal = co / np.linalg.norm(co, axis=1)[:, None]
+        
+        # vertex group weights (distinct groups per vertex)
+        nweights = min(nweights, nbones)
+        groups = np.argsort(rng.random((nvertices, nbones)), axis=1)
+        groups = groups[:, : nweights].astype(np.int32)
+        weights = rng.random((nvertices, nweights)).astype(np.float32)
+        
+        # vertex factory (per-vertex access, groups included)
+        def vertex(i):
+            elements = [Block(group=int(g), weight=float(w))
+                for g, w in zip(groups[i], weights[i])]
+            return Block(index=i, co=Vector(co[i]), normal=Vector(normal[i]),
+                groups=elements)
+        
+        # faces (quads over consecutive vertices, a triangle every third face)
+        nfaces = max(nvertices // 2, 1)
+        totals = np.where(np.arange(nfaces) % 3 == 2, 3, 4).astype(np.int32)
+        starts = np.zeros(nfaces, dtype=np.int32)
+        np.cumsum(totals[: -1], out=starts[1 :])
+        loops = (np.arange(int(totals.sum())) % nvertices).astype(np.int32)
+        slots = rng.integers(0, len(self.materials), nfaces).astype(np.int32)
+        
+        # polygon normals (newell's method) and edges (unique polygon sides)
+        following = np.arange(1, len(loops) + 1)
+        following[starts + totals - 1] = starts
+        a = co[loops].astype(np.float64)
+        b = co[loops[following]].astype(np.float64)
+        newell = np.column_stack(((a[:, 1] - b[:, 1]) * (a[:, 2] + b[:, 2]),
+            (a[:, 2] - b[:, 2]) * (a[:, 0] + b[:, 0]),
+            (a[:, 0] - b[:, 0]) * (a[:, 1] + b[:, 1])))
+        face_normal = np.add.reduceat(newell, starts)
+        face_normal /= np.maximum(np.linalg.norm(face_normal, axis=1),
+            1e-12)[:, None]
+        edges = np.unique(np.sort(np.column_stack((loops, loops[following])),
+            axis=1), axis=0).astype(np.int32)
+        
+        # mesh data
+        data = Block(name=name + '.data')
+        data.vertices = Collection(arrays={'co' : co, 'normal' : normal},
+            length=nvertices, factory=vertex)
+        data.polygons = Collection(length=nfaces, arrays={
+            'loop_start' : starts, 'loop_total' : totals,
+            'material_index' : slots,
+            'normal' : face_normal.astype(np.float32)})
+        data.edges = Collection(length=len(edges), arrays={'vertices' : edges})
+        data.loops = Collection(length=len(loops),
+            arrays={'vertex_index' : loops})
+        data.materials = Collection(self.materials)
+        
+        # shape keys
+        data.shape_keys = None
+        if nshapes:
+            blocks = []
+            for j in range(nshapes):
+                offset = rng.normal(0.0, 0.01, co.shape).astype(np.float32)
+                blocks.append(Block(name='Key %i' % j, data=Collection(
+                    arrays={'co' : co + offset}, length=nvertices)))
+            data.shape_keys = Block(key_blocks=Collection(blocks))
+        
+        # vertex groups (one per bone)
+        vertex_groups = Collection([Block(name=b.name, index=j)
+            for j, b in enumerate(self.bones)])
+        
+        # evaluated mesh (the mesh data itself, nothing is evaluated)
+        def to_mesh(scene, apply_modifiers, settings):
+            return data
+        
+        return Block(name=name, type='MESH', hide=False, data=data,
+            matrix_local=random_pose(rng), matrix_world=Matrix(),
+            vertex_groups=vertex_groups, to_mesh=to_mesh, animation_data=None,
+            constraints=[], parent_type='ARMATURE', parent_bone='')
+    
+    
+    # pose rig at frame (deterministic)
+    def pose(self, frame):
+        rng = np.random.default_rng(frame)
+        self.armature.matrix_world = random_pose(rng, 10.0)
+        for c in self.armature.children:
+            c.matrix_local = random_pose(rng)
+        for b in self.bones:
+            b.matrix = random_pose(rng)
+
+
+# benchmark ===================================================================#
+
+# export stages (name, function(exporter, scene, rig, f, paths))
+def stage_materials(exporter, scene, rig, f, paths):
+    for m in rig.materials:
+        exporter.write_material(f, m)
+
+
+def stage_meshes(exporter, scene, rig, f, paths):
+    table = {m.name : i for i, m in enumerate(rig.materials)}
+    for c in rig.armature.children:
+        exporter.write_mesh(f, c, table)
+
+
+def stage_weights(exporter, scene, rig, f, paths):
+    for c in rig.armature.children:
+        exporter.get_weights(c)
+
+
+def stage_bones(exporter, scene, rig, f, paths):
+    weights = {c.name : exporter.get_weights(c) for c in rig.armature.children}
+    for b in rig.bones:
+        exporter.write_bone(f, b, rig.armature, weights)
+
+
+def stage_topology(exporter, scene, rig, f, paths):
+    table = {m.name : i for i, m in enumerate(rig.materials)}
+    for c in rig.armature.children:
+        exporter.write_topology(f, c, exporter.get_topology(c.data, table))
+
+
+def stage_bake(exporter, scene, rig, f, paths):
+    exporter.bake_animation(scene, rig.armature, rig.bones)
+
+
+def stage_fast_bake(exporter, scene, rig, f, paths):
+    exporter.fast_bake(scene, rig.armature, rig.bones)
+
+
+def stage_tracks(exporter, scene, rig, f, paths):
+    poses = exporter.bake_animation(scene, rig.armature, rig.bones)
+    for j in range(poses.shape[1]):
+        exporter.write_track(f, poses[:, j])
+
+
+def stage_puppet(exporter, scene, rig, f, paths):
+    exporter.write_puppet(scene, rig.armature, rig.bones)
+
+
+def stage_puppet_parallel(exporter, scene, rig, f, paths):
+    scene.duke.animation_enable = False
+    scene.duke.format_workers = os.cpu_count() or 1
+    exporter.export(scene, rig.armature)
+
+
+def stage_animation(exporter, scene, rig, f, paths):
+    exporter.write_animation(scene, rig.armature, rig.bones)
+
+
+def stage_points(exporter, scene, rig, f, paths):
+    scene.duke.animation_enable = False
+    scene.duke.puppet_enable = False
+    scene.duke.points_enable = True
+    exporter.export(scene, rig.armature)
+
+
+def stage_puppet_binary(exporter, scene, rig, f, paths):
+    exporter.write_puppet_binary(scene, rig.armature, rig.bones)
+
+
+def stage_animation_binary(exporter, scene, rig, f, paths):
+    exporter.write_animation_binary(scene, rig.armature, rig.bones)
+
+
+STAGES = [
+    ('materials', stage_materials),
+    ('meshes', stage_meshes),
+    ('weights', stage_weights),
+    ('bones', stage_bones),
+    ('topology', stage_topology),
+    ('bake', stage_bake),
+    ('fast_bake', stage_fast_bake),
+    ('tracks', stage_tracks),
+    ('puppet', stage_puppet),
+    ('puppet_parallel', stage_puppet_parallel),
+    ('animation', stage_animation),
+    ('points', stage_points),
+    ('puppet_binary', stage_puppet_binary),
+    ('animation_binary', stage_animation_binary)
+    ]
+
+
+# run stage (best time of repeats, peak memory, bytes written)
+def run_stage(function, exporter, scene, rig, directory, repeat, defaults):
+    
+    result = {'time' : None, 'peak_memory' : 0, 'bytes' : 0}
+    for _ in range(repeat):
+        
+        # clear outputs
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        paths = [os.path.join(directory, name) for name in
+            ('stage.txt', 'puppet.out', 'animation.out', 'points.json')]
+        scene.duke = Block(**vars(defaults))
+        scene.duke.puppet_path = paths[1]
+        scene.duke.animation_path = paths[2]
+        scene.duke.points_path = paths[3]
+        
+        # run (timed and traced)
+        tracemalloc.start()
+        time0 = time.perf_counter()
+        with open(paths[0], 'w') as f:
+            function(exporter, scene, rig, f, paths)
+        elapsed = time.perf_counter() - time0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        
+        # record
+        if result['time'] is None or elapsed < result['time']:
+            result['time'] = elapsed
+        result['peak_memory'] = max(result['peak_memory'], peak)
+        result['bytes'] = sum(os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory))
+    
+    return result
+
+
+# run benchmark
+def bench(parameters, stages=None, repeat=1):
+    
+    # install stand-in and import exporter (from this directory)
+    bpy = install()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import duke_export
+    
+    # build rig and scene
+    time0 = time.perf_counter()
+    rig = Rig(**{k : v for k, v in parameters.items() if k != 'frames'})
+    setup = time.perf_counter() - time0
+    scene = Scene('Bench', rig, parameters['frames'])
+    defaults = Block(**{k : v for k, v in vars(duke_export.DukeData).items()
+        if not k.startswith('_')})
+    
+    # register data
+    bpy.data.materials = Collection(rig.materials)
+    bpy.data.objects = Collection([rig.armature] + rig.armature.children)
+    bpy.data.scenes = Collection([scene])
+    bpy.context.scene = scene
+    bpy.context.object = rig.armature
+    
+    # run stages
+    exporter = duke_export.DukeExport()
+    directory = tempfile.mkdtemp(prefix='duke_bench_')
+    results = {}
+    try:
+        for name, function in STAGES:
+            if stages is None or name in stages:
+                results[name] = run_stage(function, exporter, scene, rig,
+                    directory, repeat, defaults)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    
+    return {
+        'parameters' : parameters,
+        'repeat'     : repeat,
+        'setup_time' : setup,
+        'stages'     : results,
+        'python'     : platform.python_version(),
+        'numpy'      : np.__version__,
+        'platform'   : platform.platform()
+        }
+
+
+# command line entry point
+def main(argv):
+    
+    # parse arguments
+    parser = argparse.ArgumentParser(prog='duke_bench.py')
+    parser.add_argument('--vertices', type=int, default=10000,
+        help='vertices per mesh')
+    parser.add_argument('--shapes', type=int, default=4,
+        help='shape keys per mesh')
+    parser.add_argument('--bones', type=int, default=32, help='bones')
+    parser.add_argument('--weights', type=int, default=2,
+        help='weights per vertex')
+    parser.add_argument('--materials', type=int, default=4, help='materials')
+    parser.add_argument('--meshes', type=int, default=2, help='meshes')
+    parser.add_argument('--frames', type=int, default=100, help='frames')
+    parser.add_argument('--stages', help='comma separated stages (all)')
+    parser.add_argument('--repeat', type=int, default=1,
+        help='repeats per stage (best time is kept)')
+    parser.add_argument('--output', default='bench.json',
+        help='results path (json)')
+    args = parser.parse_args(argv)
+    
+    # run benchmark
+    parameters = {k : getattr(args, k) for k in ('vertices', 'shapes', 'bones',
+        'weights', 'materials', 'meshes', 'frames')}
+    stages = args.stages.split(',') if args.stages else None
+    report = bench(parameters, stages, args.repeat)
+    
+    # write results
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    # print summary
+    for name, result in report['stages'].items():
+        print('%-18s %9.3fs %12i B peak %12i B written' % (name,
+            result['time'], result['peak_memory'], result['bytes']))
+
+
+# script
+if __name__ == '__main__':
+    main(sys.argv[1 :])
+
+
+#==============================================================================#
+#                                                                              #
+#                                                                              #
+#                                                                              #
+#==============================================================================#
@@ -0,0 +1,247 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke Deform - NumPy puppet deformation engine
+#
+# Computes deformed puppet vertices for many animation frames at once, using
+# puppets and animations loaded by 'duke_reader.py'. Deformation mirrors the
+# MATLAB PuppetDeform.m script:
+#   1) shape key deformation (SKD, relative keys, basis weight is 1 - sum of
+#      the other key weights)
+#   2) mesh to puppet transform (mesh pose)
+#   3) skeletal subspace deformation (SSD, linear blend skinning with bone
+#      poses composed with inverse bone rest poses, and weights normalized per
+#      vertex; vertices without weights collapse to the origin), using the
+#      mesh sparse skinning matrix when exported
+#   4) puppet to world transform (puppet pose)
+# Hidden meshes are not deformed.
+#
+# NOTE : vertices are [frames,v,3] arrays (MATLAB vertices are [3,v] arrays)!
+#
+# USAGE:
+#   import duke_reader, duke_deform
+#   puppet = duke_reader.read_binary('puppet.duke')
+#   animation = duke_reader.read_binary('animation.duke')
+#   meshes = duke_deform.deform(puppet, animation, workers=4)
+#   meshes = duke_deform.deform(puppet, duke_deform.rest_pose(puppet))
+
+# import
+import concurrent.futures
+import numpy as np
+
+
+# invert [...,3,4] poses
+def inverse(A):
+    
+    M = np.linalg.inv(A[..., :3])
+    B = np.empty(A.shape)
+    B[..., :3] = M
+    B[..., 3] = -np.einsum('...ij,...j->...i', M, A[..., 3])
+    
+    return B
+
+
+# compose [...,3,4] poses (A after B)
+def compose(A, B):
+    
+    C = np.empty(np.broadcast(A, B).shape)
+    C[..., :3] = np.einsum('...ij,...jk->...ik', A[..., :3], B[..., :3])
+    C[..., 3] = np.einsum('...ij,...j->...i', A[..., :3], B[..., 3]) + A[..., 3]
+    
+    return C
+
+
+# transform [f,v,3] vertices by [f,3,4] poses
+def xform(A, x):
+    return np.einsum('fij,fvj->fvi', A[:, :, :3], x) + A[:, None, :, 3]
+
+
+# shape key deformation of [k,v,3] shape vertices with [f,k-1] non-basis key
+# weights (None for the basis shape alone)
+def skd(shapes, weights, nframes):
+    
+    # basis shape
+    basis = np.asarray(shapes[0], dtype=np.float64)
+    if weights is None or len(shapes) < 2:
+        return np.repeat(basis[None], nframes, axis=0)
+    
+    # blend shape offsets (equivalent to basis weight 1 - sum of weights)
+    offsets = np.array(shapes[1 :], dtype=np.float64) - basis
+    weights = np.broadcast_to(weights, (nframes, len(shapes) - 1))
+    
+    return basis + np.einsum('fk,kvc->fvc', weights, offsets)
+
+
+# skeletal subspace deformation of [f,v,3] puppet vertices of mesh i with
+# [f,b,3,4] bone poses
+def ssd(bones, A, x, i):
+    
+    # compose bone poses with inverse rest poses
+    rest = np.array([b['A_rest'] for b in bones], dtype=np.float64)
+    A = compose(A, inverse(rest)[None])
+    
+    # normalize weights per vertex (unweighted vertices keep zero weight)
+    total = np.zeros(x.shape[1])
+    for b in bones:
+        np.add.at(total, b['indices'][i], b['weights'][i])
+    total[total == 0.0] = 1.0
+    
+    # blend bone transformed vertices (indices are unique per bone)
+    y = np.zeros(x.shape)
+    for j, b in enumerate(bones):
+        indices = np.asarray(b['indices'][i], dtype=np.int64)
+        if not len(indices):
+            continue
+        w = np.asarray(b['weights'][i], dtype=np.float64) / total[indices]
+        y[:, indices] += w[None, :, None] * xform(A[:, j], x[:, indices])
+    
+    return y
+
+
+# skeletal subspace deformation of [f,v,3] puppet vertices with a sparse
+# skinning matrix (CSR, see duke_reader) and [f,b,3,4] bone poses
+def ssd_skin(bones, skin, A, x):
+    
+    # compose bone poses with inverse rest poses
+    rest = np.array([b['A_rest'] for b in bones], dtype=np.float64)
+    A = compose(A, inverse(rest)[None])
+    
+    # normalize weights per vertex (row)
+    counts = np.diff(skin['pointers'])
+    rows = np.repeat(np.arange(len(counts)), counts)
+    total = np.bincount(rows, skin['weights'], len(counts))
+    total[total == 0.0] = 1.0
+    w = skin['weights'] / total[rows]
+    
+    # transform vertices per nonzero (grouped by bone, so no per nonzero poses
+    # are built)
+    y = np.zeros(x.shape)
+    if len(rows):
+        Y = np.empty((x.shape[0], len(rows), 3))
+        order = np.argsort(skin['bones'], kind='mergesort')
+        nonzeros = np.bincount(skin['bones'], minlength=len(bones))
+        ends = np.cumsum(nonzeros)
+        for j in np.flatnonzero(nonzeros):
+            e = order[ends[j] - nonzeros[j] : ends[j]]
+            Y[:, e] = w[None, e, None] * xform(A[:, j], x[:, rows[e]])
+        
+        # sum nonzeros per vertex (rows are sorted, so each nonempty row sums
+        # from its pointer to the next nonempty row pointer)
+        nonempty = counts > 0
+        y[:, nonempty] = np.add.reduceat(Y, skin['pointers'][: -1][nonempty],
+            axis=1)
+    
+    return y
+
+
+# deform puppet meshes with [f,3,4] puppet poses, [m][f,3,4] mesh poses,
+# [f,b,3,4] bone poses, and [m][f,k-1] shape key weights
+def deform_poses(puppet, A, meshes, bones, weights=None):
+    
+    # deform meshes
+    nframes = len(A)
+    vertices = []
+    for i, mesh in enumerate(puppet['meshes']):
+        
+        # skip hidden meshes
+        if not mesh['visible']:
+            vertices.append(None)
+            continue
+        
+        # shape key deformation
+        shapes = [s['vertices'] for s in mesh['shapes']]
+        x = skd(shapes, weights[i] if weights else None, nframes)
+        
+        # mesh to puppet space
+        x = xform(meshes[i], x)
+        
+        # skeletal subspace deformation
+        if 'skin' in mesh:
+            x = ssd_skin(puppet['bones'], mesh['skin'], bones, x)
+        else:
+            x = ssd(puppet['bones'], bones, x, i)
+        
+        # puppet to world space
+        vertices.append(xform(A, x))
+    
+    return vertices
+
+
+# worker process puppet (sent once per worker, see init_worker())
+worker_puppet = None
+
+
+# start worker process
+def init_worker(puppet):
+    global worker_puppet
+    worker_puppet = puppet
+
+
+# deform frame chunk of the worker puppet (worker process)
+def deform_chunk(args):
+    return deform_poses(worker_puppet, *args)
+
+
+# get rest pose animation (single frame, see PuppetPose.m)
+def rest_pose(puppet):
+    return {
+        'name'   : 'rest',
+        'puppet' : puppet['name'],
+        'frames' : 1,
+        'A'      : np.eye(3, 4)[None],
+        'meshes' : [{'name' : m['name'], 'A' : m['A_rest'][None]}
+            for m in puppet['meshes']],
+        'bones'  : [{'name' : b['name'], 'A' : b['A_rest'][None]}
+            for b in puppet['bones']]
+        }
+
+
+# deform puppet for animation frames (0-based indices, default all); weights
+# are optional per mesh non-basis shape key weights, [k-1] constant or [f,k-1]
+# per frame; returns per mesh [f,v,3] vertices (None for hidden meshes)
+def deform(puppet, animation, frames=None, weights=None, workers=0,
+    chunk=64):
+    
+    # get frame poses
+    if frames is None:
+        frames = np.arange(animation['frames'])
+    frames = np.asarray(frames)
+    A = np.asarray(animation['A'])[frames]
+    meshes = [np.asarray(m['A'])[frames] for m in animation['meshes']]
+    bones = np.stack([np.asarray(b['A'])[frames] for b in animation['bones']],
+        axis=1) if animation['bones'] else np.empty((len(frames), 0, 3, 4))
+    
+    # expand shape key weights to frames
+    if weights is not None:
+        weights = [None if w is None else np.broadcast_to(w,
+            (len(frames), len(m['shapes']) - 1))
+            for w, m in zip(weights, puppet['meshes'])]
+    
+    # split frames into chunks
+    jobs = []
+    for a in range(0, max(len(frames), 1), chunk):
+        s = slice(a, a + chunk)
+        jobs.append((A[s], [m[s] for m in meshes], bones[s],
+            None if weights is None else
+            [None if w is None else w[s] for w in weights]))
+    
+    # deform chunks (serial, or in worker processes sent the puppet once)
+    if workers < 2 or len(jobs) < 2:
+        chunks = [deform_poses(puppet, *job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers,
+            initializer=init_worker, initargs=(puppet,)) as pool:
+            chunks = list(pool.map(deform_chunk, jobs))
+    
+    # merge chunks
+    return [None if c[0] is None else np.concatenate(c)
+        for c in zip(*chunks)]
+
+
+#==============================================================================#
+#                                                                              #
+#                                                                              #
+#                                                                              #
+#==============================================================================#
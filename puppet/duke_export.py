@@ -21,14 +21,168 @@
 #   2) open User Preferences [Ctrl + Alt + U]
 #   3) go to the add-on tab
 #   4) click on the "Install Add-on from File..." button
-#   5) select the 'duke_export.py' file
+#   5) select a zip file of 'duke_export.py' and 'duke_reader.py' (the add-on
+#      imports the key frame pose functions of the reader)
 #   6) check the box next to the "Import-Export: Duke Export" add-on header
 #
+# BATCH:
+#   blender --background --python duke_export.py -- --manifest jobs.json
+#     [--workers n] [--summary summary.json] [--blender path]
+#   Runs the export jobs listed in the manifest across a pool of background
+#   blender processes and writes a json summary of timings, bytes, and
+#   failures. A manifest is a json list of jobs (or {"jobs" : [...]}):
+#     {"blend" : "rig.blend", "armature" : "Rig", "scene" : "Scene",
+#      "puppet_path" : "rig_puppet.txt", "animation_path" : "rig_anim.txt",
+#      "options" : {"file_format" : "BINARY", ...}}
+#   where "scene" and "options" (DukeData settings) are optional, and relative
+#   paths are relative to the manifest.
+#
 # NOTE : names have spaces and periods replaced with underscores when exporting!
 
 # import
+import argparse
 import bpy
-from bpy.props import (BoolProperty, StringProperty, PointerProperty)
+import bz2
+import collections
+import concurrent.futures
+import cProfile
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import multiprocessing
+import os
+import shlex
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import numpy as np
+from bpy.props import (BoolProperty, EnumProperty, FloatProperty, IntProperty,
+    StringProperty, PointerProperty)
+
+
+# import key frame pose functions from the reader (installed next to the
+# add-on, see INSTALLATION; blender does not put script directories on the
+# module path)
+ADDON_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+if ADDON_DIRECTORY not in sys.path:
+    sys.path.append(ADDON_DIRECTORY)
+from duke_reader import (compose_poses, compress_track, decompose_poses,
+    interpolate_poses)
+
+
+# bulk export block size (rows formatted per write, and vertices per export
+# step)
+CHUNK = 65536
+
+
+# finest level of detail clustering grid (a power of two, so the grid bisection
+# always takes log2(LOD_GRID) probes, see decimate())
+LOD_GRID = 2 ** 20
+
+
+# text export file buffer size
+BUFFER = 2 ** 20
+
+
+# text section format version (part of export cache keys; bump when the
+# formatted text of any section changes)
+FORMAT_VERSION = 1
+
+
+# parallel bake worker poll interval (seconds)
+POLL = 0.01
+
+
+# export step yielded while waiting on worker processes (not counted as
+# progress, see DukeExportButton.modal())
+WAITING = 'waiting'
+
+
+# output compressors (name -> extension, open(path, mode, level) function);
+# more can be added with register_compressor() (readers register the matching
+# decompressor with duke_reader.register_decompressor())
+COMPRESSORS = collections.OrderedDict()
+
+
+# register output compressor
+def register_compressor(name, extension, open):
+    COMPRESSORS[name] = (extension, open)
+
+
+register_compressor('GZIP', '.gz',
+    lambda path, mode, level : gzip.open(path, mode, compresslevel=level))
+register_compressor('BZIP2', '.bz2',
+    lambda path, mode, level : bz2.open(path, mode, compresslevel=level))
+register_compressor('LZMA', '.xz',
+    lambda path, mode, level : lzma.open(path, mode, preset=level))
+
+
+# output compression enum items (kept referenced, blender does not copy the
+# strings of dynamic enum items)
+COMPRESSION_ITEMS = []
+
+
+# get output compression enum items (built when read, so compressors
+# registered after the add-on are listed)
+def compression_items(self, context):
+    COMPRESSION_ITEMS[:] = [('NONE', 'None', 'no compression')] + [(k,
+        k.title(), k.lower() + ' compression (' + v[0] + ')')
+        for k, v in COMPRESSORS.items()]
+    return COMPRESSION_ITEMS
+
+
+# get output path (compressor extension appended)
+def output_path(path, compression):
+    if compression in COMPRESSORS:
+        extension = COMPRESSORS[compression][0]
+        if not path.endswith(extension):
+            path += extension
+    return path
+
+
+# get crowd member output path (name inserted before the extension)
+def member_path(path, name):
+    root, extension = os.path.splitext(path)
+    return root + '_' + name + extension
+
+
+# get animation window output path (window index inserted before the
+# extension, see DukeExport.iter_windows())
+def window_path(path, k):
+    return member_path(path, '%04d' % k)
+
+
+# get animation window manifest path (json, next to the animation path)
+def window_manifest(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+# open output file (streams through the compressor, if any)
+def open_output(path, mode, compression='NONE', level=6):
+    if compression in COMPRESSORS:
+        return COMPRESSORS[compression][1](output_path(path, compression),
+            mode + ('t' if 'b' not in mode else ''), level)
+    return open(path, mode, BUFFER if 'b' not in mode else -1)
+
+
+# text export float formats (repr is exact, and matches str() of floats)
+FLOAT_FORMATS = {
+    'REPR' : '%r',
+    'G9'   : '%.9g',
+    'G6'   : '%.6g'
+    }
+
+
+# default parallel bake worker command (fields are formatted per chunk)
+BAKE_COMMAND = ('{binary} --background {blend} --python {script} -- --bake '
+    '--scene {scene} --armatures {armatures} --start {start} --end {end} '
+    '--output {output}')
 
 
 # add-on metadata
@@ -80,6 +234,200 @@ class DukeData(bpy.types.PropertyGroup):
         default='animation.txt',
         subtype='FILE_PATH'
         )
+    
+    # create export file format
+    file_format = EnumProperty(
+        name='export file format',
+        description='export file format',
+        items=[
+            ('TEXT', 'Text', 'text files (PuppetScan, PuppetAnimScan)'),
+            ('BINARY', 'Binary', 'duke binary files (duke_reader.py)')],
+        default='TEXT'
+        )
+    
+    # create text export float format
+    float_format = EnumProperty(
+        name='text export float format',
+        description='text export float format',
+        items=[
+            ('REPR', 'Exact', 'shortest exact representation (repr)'),
+            ('G9', '9 Digits', '9 significant digits (%.9g)'),
+            ('G6', '6 Digits', '6 significant digits (%.6g, smallest)')],
+        default='REPR'
+        )
+    
+    # create evaluated mesh point cache export enable
+    points_enable = BoolProperty(
+        name='export point cache enable',
+        description='export evaluated world space mesh vertices per frame',
+        default=False
+        )
+    
+    # create evaluated mesh point cache header path
+    points_path = StringProperty(
+        name='export point cache path',
+        description='point cache header path (json, meshes are .npy files)',
+        default='points.json',
+        subtype='FILE_PATH'
+        )
+    
+    # create output compression
+    compression = EnumProperty(
+        name='output compression',
+        description='compress output files (appends the extension)',
+        items=compression_items
+        )
+    
+    # create output compression level
+    compression_level = IntProperty(
+        name='output compression level',
+        description='compression level (1=fastest, 9=smallest)',
+        default=6,
+        min=1,
+        max=9
+        )
+    
+    # create face triangulation enable
+    triangulate = BoolProperty(
+        name='face triangulation enable',
+        description='write triangulated faces (ngon 3) instead of polygons',
+        default=False
+        )
+    
+    # create sparse skinning matrix export enable
+    skin_enable = BoolProperty(
+        name='skinning matrix export enable',
+        description='also write per mesh sparse (CSR) vertex-bone weights',
+        default=False
+        )
+    
+    # create mesh level of detail export enable
+    lod_enable = BoolProperty(
+        name='level of detail export enable',
+        description='also write decimated mesh levels of detail',
+        default=False
+        )
+    
+    # create mesh level of detail face ratios
+    lod_ratios = StringProperty(
+        name='level of detail face ratios',
+        description='target face ratios of the levels of detail (0.25 0.05)',
+        default='0.25 0.05'
+        )
+    
+    # create crowd export enable
+    crowd_enable = BoolProperty(
+        name='crowd export enable',
+        description='export all selected armatures (one puppet, one sweep)',
+        default=False
+        )
+    
+    # create mesh topology export enable
+    topology_enable = BoolProperty(
+        name='topology export enable',
+        description='also write mesh edges, vertex face adjacency, and normals',
+        default=False
+        )
+    
+    # create animation bake spill threshold
+    spill_frames = IntProperty(
+        name='bake spill frames',
+        description='bake to a temporary file above this many frames (0=never)',
+        default=0,
+        min=0
+        )
+    
+    # create animation frame window size
+    window_frames = IntProperty(
+        name='animation window frames',
+        description='split animation into files of this many frames (0=never)',
+        default=0,
+        min=0
+        )
+    
+    # create animation keyframe compression enable
+    keys_enable = BoolProperty(
+        name='keyframe compression enable',
+        description='write animation tracks as interpolated keyframes',
+        default=False
+        )
+    
+    # create animation keyframe compression tolerance
+    keys_tolerance = FloatProperty(
+        name='keyframe compression tolerance',
+        description='maximum pose matrix element error of interpolated frames',
+        default=1e-5,
+        min=0.0,
+        precision=6
+        )
+    
+    # create export cache enable
+    cache_enable = BoolProperty(
+        name='export cache enable',
+        description='reuse unchanged puppet sections from the last text '
+            'export',
+        default=False
+        )
+    
+    # create export cache size
+    cache_size = IntProperty(
+        name='export cache size',
+        description='export cache size limit [MB]',
+        default=256,
+        min=1
+        )
+    
+    # create parallel bake number of workers
+    bake_workers = IntProperty(
+        name='bake workers',
+        description='number of background blender processes baking (0=serial)',
+        default=0,
+        min=0
+        )
+    
+    # create text section formatting number of workers
+    format_workers = IntProperty(
+        name='format workers',
+        description='number of processes formatting text sections (0=serial)',
+        default=0,
+        min=0
+        )
+    
+    # create fast bake enable
+    fast_bake = BoolProperty(
+        name='fast bake enable',
+        description='bake bone poses from actions without scene updates',
+        default=False
+        )
+    
+    # create parallel bake worker command
+    bake_command = StringProperty(
+        name='bake worker command',
+        description='parallel bake worker command (empty=background blender)',
+        default=''
+        )
+    
+    # create export profiling enable
+    profile_enable = BoolProperty(
+        name='export profiling enable',
+        description='record per-stage export timings to a json report',
+        default=False
+        )
+    
+    # create export profiling report path
+    profile_path = StringProperty(
+        name='export profiling report path',
+        description='export profiling report path (json)',
+        default='profile.json',
+        subtype='FILE_PATH'
+        )
+    
+    # create export profiling cProfile enable
+    profile_cprofile = BoolProperty(
+        name='export cProfile enable',
+        description='also capture cProfile stats (.prof next to the report)',
+        default=False
+        )
 
 
 # ui panel
@@ -90,6 +438,14 @@ class DukeExportPanel(bpy.types.Panel):
     bl_space_type = 'VIEW_3D'
     bl_region_type = 'UI'
     
+    # last export profiling summary (lines)
+    summary = []
+    
+    # modal export progress (None when idle), status line, and cancel request
+    progress = None
+    status = ''
+    cancel = False
+    
     
     # poll context for selected armature
     @classmethod
@@ -104,8 +460,13 @@ class DukeExportPanel(bpy.types.Panel):
         layout = self.layout
         scene = context.scene
         
-        # widget : export button
-        layout.operator('duke.export', text='Export', icon='EXPORT')
+        # widget : export button (progress and cancel button while running)
+        if self.progress is None:
+            layout.operator('duke.export', text='Export', icon='EXPORT')
+        else:
+            row = layout.row(align=False)
+            row.label(text=self.status, icon='TIME')
+            row.operator('duke.export_cancel', text='Cancel', icon='CANCEL')
         
         # puppet controls row
         row = layout.row(align=False)
@@ -124,269 +485,1446 @@ class DukeExportPanel(bpy.types.Panel):
         
         # widget : export animation path
         row.prop(scene.duke, 'animation_path', text='')
-
-
-# export button
-class DukeExportButton(bpy.types.Operator):
-    
-    # attributes
-    bl_idname = 'duke.export'
-    bl_label = 'Duke Export'
-    
-    
-    # rename for export
-    def rename(self, name):
-        return name.replace(' ', '_').replace('.', '_')
-    
-    
-    # write material
-    def write_material(self, f, material):
         
-        # write material type
-        f.write('type : material\n')
-            
-        # write material name
-        f.write('name : ' + self.rename(material.name) + '\n')
+        # point cache controls row
+        row = layout.row(align=False)
         
-        # write number of custom properties
-        keys = material.id_data.keys()
-        n = sum(k.find('duke_', 0, 5) is not -1 for k in keys)
-        f.write('properties : ' + str(n) + '\n')
+        # widget : export point cache enable
+        row.prop(scene.duke, 'points_enable', icon='MESH_DATA', text='')
         
-        # write material custom properties
-        for k in keys:
-            
-            # continue if not duke property
-            if k.find('duke_', 0, 5) is -1:
-                continue
-            
-            # write property name-value pair
-            name = k.replace('duke_', '')
-            value = material.id_data[k]
-            f.write(self.rename(name) + ' : ' + str(value) + '\n')
+        # widget : export point cache path
+        row.prop(scene.duke, 'points_path', text='')
         
-        # write blank
-        f.write('\n')
-    
-    
-    # write matrix
-    def write_matrix(self, f, matrix):
+        # widget : export file format
+        layout.row().prop(scene.duke, 'file_format', expand=True)
         
-        f.write(str(matrix[0][0]) + ' ')
-        f.write(str(matrix[1][0]) + ' ')
-        f.write(str(matrix[2][0]) + ' ')
-        f.write(str(matrix[0][1]) + ' ')
-        f.write(str(matrix[1][1]) + ' ')
-        f.write(str(matrix[2][1]) + ' ')
-        f.write(str(matrix[0][2]) + ' ')
-        f.write(str(matrix[1][2]) + ' ')
-        f.write(str(matrix[2][2]) + ' ')
-        f.write(str(matrix[0][3]) + ' ')
-        f.write(str(matrix[1][3]) + ' ')
-        f.write(str(matrix[2][3]) + '\n')
-    
-    
-    # write vertex coordinates
-    def write_vertices(self, f, vertices):
+        # widget : text export float format
+        layout.row().prop(scene.duke, 'float_format', expand=True)
         
-        for v in vertices:
-            
-            f.write(str(v.co.x) + ' ')
-            f.write(str(v.co.y) + ' ')
-            f.write(str(v.co.z) + '\n')
-    
-    
-    # write vertex data (excludes coordinates, which are in shape types)
-    def write_vertex_data(self, f, vertices):
+        # compression controls row
+        row = layout.row(align=False)
         
-        # write vertex type
-        f.write('type : vertex\n')
+        # widget : output compression
+        row.prop(scene.duke, 'compression', text='')
         
-        for vertex in vertices:
-            
-            # write color
-            # TODO, but not really needed...
-            
-            # write normal
-            f.write(str(vertex.normal.x) + ' ')
-            f.write(str(vertex.normal.y) + ' ')
-            f.write(str(vertex.normal.z) + '\n')
-            
-            # write uv
-            # TODO, but not really needed...
-            
-        # write blank
-        f.write('\n')
-    
-    
-    # write face data
-    def write_face_data(self, f, faces, materials):
+        # widget : output compression level
+        row.prop(scene.duke, 'compression_level', text='Level')
         
-        # write face type
-        f.write('type : face\n')
+        # keyframe compression controls row
+        row = layout.row(align=False)
         
-        # write max ngon
-        n = max(len(face.vertices) for face in faces)
-        f.write('ngon : ' + str(n) + '\n')
+        # widget : keyframe compression enable
+        row.prop(scene.duke, 'keys_enable', text='Keys')
         
-        for face in faces:
-            
-            # write face vertex indices
-            for vertex in face.vertices:
-                
-                f.write(str(vertex) + ' ')
-            
-            # write trailing dummy indices
-            for i in range(0, n - len(face.vertices)):
-                
-                f.write('-1 ')
-                
-            # write delimiter
-            f.write(', ')
-            
-            # write (global) material index
-            name = materials[face.material_index].name
-            for i in range(0, len(bpy.data.materials)):
-                if name == bpy.data.materials[i].name:
-                    break
-            f.write(str(i) + '\n')
-            
-        # write blank
-        f.write('\n')
-    
-    
-    # write mesh
-    def write_mesh(self, f, mesh):
+        # widget : keyframe compression tolerance
+        row.prop(scene.duke, 'keys_tolerance', text='Tolerance')
         
-        # write mesh type
-        f.write('type : mesh\n')
+        # export cache controls row (text exports only)
+        row = layout.row(align=False)
+        row.enabled = scene.duke.file_format == 'TEXT'
         
-        # write name
-        f.write('name : ' + self.rename(mesh.name) + '\n')
+        # widget : export cache enable
+        row.prop(scene.duke, 'cache_enable', text='Cache')
         
-        # write visibility
-        f.write('visible : ' + str(not mesh.hide) + '\n')
+        # widget : export cache size
+        row.prop(scene.duke, 'cache_size', text='MB')
         
-        # write pose (puppet coordinates)
-        f.write('pose : ')
-        self.write_matrix(f, mesh.matrix_local)
+        # widget : face triangulation enable
+        layout.prop(scene.duke, 'triangulate', text='Triangulate')
         
-        # count shapes
-        try:
-            
-            # shape keys
-            n = len(mesh.data.shape_keys.key_blocks)
-            keys = True
-            
-        except:
-            
-            # no shape keys, just a base mesh (equivalent to a single key)
-            n = 1
-            keys = False
+        # widget : sparse skinning matrix export enable
+        layout.prop(scene.duke, 'skin_enable', text='Skinning Matrix')
         
-        # write number of shape keys
-        f.write('shapes : ' + str(n) + '\n')
+        # widget : mesh topology export enable
+        layout.prop(scene.duke, 'topology_enable', text='Topology')
         
-        # write number of vertices
-        n = len(mesh.data.vertices)
-        f.write('vertices : ' + str(n) + '\n')
+        # level of detail controls row
+        row = layout.row(align=False)
         
-        # write number of faces
-        n = len(mesh.data.polygons)
-        f.write('faces : ' + str(n) + '\n')
+        # widget : mesh level of detail export enable
+        row.prop(scene.duke, 'lod_enable', text='LOD')
         
-        # write blank
-        f.write('\n')
+        # widget : mesh level of detail face ratios
+        row.prop(scene.duke, 'lod_ratios', text='')
         
-        # write shapes
-        if keys:
-            
-            # write keys
-            for shape in mesh.data.shape_keys.key_blocks:
-                
-                # write shape type
-                f.write('type : shape\n')
-                
-                # write name
-                f.write('name : ' + self.rename(shape.name) + '\n')
-                
-                # write vertex coordinates
-                self.write_vertices(f, shape.data)
-                
-                # write blank
-                f.write('\n')
-                
-        else:
-            
-            # write base mesh
-            f.write('type : shape\n')
-            
-            # write name
-            f.write('name : ' + self.rename(mesh.name) + '\n')
-            
-            # write vertices
-            self.write_vertices(f, mesh.data.vertices)
-            
-            # write blank
-            f.write('\n')
+        # widget : crowd export enable
+        layout.prop(scene.duke, 'crowd_enable', text='Crowd (Selected)')
         
-        # write vertex data (excludes coordinates, which are in shape types)
-		# DISABLED
-        #self.write_vertex_data(f, mesh.data.vertices)
+        # widget : animation bake spill threshold
+        layout.prop(scene.duke, 'spill_frames', text='Spill Frames')
         
-        # write face data
-        self.write_face_data(f, mesh.data.polygons, mesh.data.materials)
+        # widget : animation frame window size
+        layout.prop(scene.duke, 'window_frames', text='Window Frames')
         
-    
-    # write kinship
-    def write_kinship(self, f, bone, armature):
+        # widget : parallel bake number of workers
+        layout.prop(scene.duke, 'bake_workers', text='Bake Workers')
         
-        # write parent
-        if bone.parent and bone.parent.bone.use_deform:
-            
-            # parent exists
-            f.write('parent : ' + self.rename(bone.parent.name) + '\n')
-            
-        else:
-            
-            # no parent bone, so make it a child of the armature
-            f.write('parent : ' + self.rename(armature.name) + '\n')
+        # widget : text section formatting number of workers
+        layout.prop(scene.duke, 'format_workers', text='Format Workers')
         
-        # write children
-        n = sum(b.bone.use_deform for b in bone.children)
-        if n:
-            
-            # write number of children
-            f.write('children : ' + str(n) + '\n')
-            
-            # write list of children
-            for i in range(0, len(bone.children)):
-                if bone.children[i].bone.use_deform:
-                    f.write(' ' + self.rename(bone.children[i].name))
-            f.write('\n')
-            
-        else:
-            
-            # no children
-            f.write('children : 0\n')
-    
-    
-    # write bone
-    def write_bone(self, f, bone, armature):
+        # widget : fast bake enable
+        layout.prop(scene.duke, 'fast_bake', text='Fast Bake')
         
-        # skip if not deformation bone
-        # may unlink part of parent-child graph, set parent to arm ature?
-        if not bone.bone.use_deform:
-            return
+        # profiling controls row
+        row = layout.row(align=False)
         
-        # write type
-        f.write('type : bone\n')
+        # widget : export profiling enable
+        row.prop(scene.duke, 'profile_enable', icon='TIME', text='')
         
-        # write name
-        f.write('name : ' + self.rename(bone.name) + '\n')
+        # widget : export profiling report path
+        row.prop(scene.duke, 'profile_path', text='')
         
-        # write parent and children
-        self.write_kinship(f, bone, armature)
+        # widget : export profiling cProfile enable
+        row.prop(scene.duke, 'profile_cprofile', text='cProfile')
+        
+        # last export profiling summary
+        for line in self.summary:
+            layout.label(text=line)
+
+
+# duke binary file writer
+#
+# A duke binary file is a header, a sequence of little-endian array sections,
+# a json section table, and a trailer locating the table:
+#   header  : '<8sI4x' magic, version
+#   section : raw array data, aligned to ALIGN bytes
+#   table   : utf-8 json {'type', 'meta', 'sections' : [{'name', 'dtype',
+#             'shape', 'offset'}]}
+#   trailer : '<QQ8s' table offset, table size, magic
+# The table is written last, so files are written front to back (no seeks).
+class DukeBinaryWriter(object):
+    
+    # format constants
+    MAGIC = b'DUKEBIN\0'
+    VERSION = 1
+    HEADER = '<8sI4x'
+    TRAILER = '<QQ8s'
+    ALIGN = 16
+    
+    
+    # start file
+    def __init__(self, f, type):
+        self.f = f
+        self.type = type
+        self.offset = 0
+        self.sections = []
+        self.write_bytes(struct.pack(self.HEADER, self.MAGIC, self.VERSION))
+    
+    
+    # write raw bytes (tracks offset, so the file need not support tell)
+    def write_bytes(self, data):
+        self.f.write(data)
+        self.offset += len(data)
+    
+    
+    # write array section
+    def write(self, name, array, dtype):
+        run_steps(self.iter_write(name, array, dtype))
+    
+    
+    # write array section (generator, yields between blocks of CHUNK rows)
+    def iter_write(self, name, array, dtype):
+        
+        # convert to little-endian contiguous array
+        array = np.ascontiguousarray(array, dtype=np.dtype(dtype))
+        
+        # align section
+        pad = -self.offset % self.ALIGN
+        self.write_bytes(b'\0' * pad)
+        
+        # record section
+        self.sections.append({
+            'name'   : name,
+            'dtype'  : array.dtype.str,
+            'shape'  : list(array.shape),
+            'offset' : self.offset
+            })
+        
+        # write data (scalars as a single row)
+        rows = array if array.ndim else array.reshape(1)
+        for i in range(0, max(len(rows), 1), CHUNK):
+            if i:
+                yield
+            self.write_bytes(rows[i : i + CHUNK].tobytes())
+    
+    
+    # finish file
+    def close(self, meta):
+        
+        # write section table
+        table = {'type' : self.type, 'meta' : meta, 'sections' : self.sections}
+        data = json.dumps(table).encode('utf-8')
+        offset = self.offset
+        self.write_bytes(data)
+        
+        # write trailer
+        self.write_bytes(struct.pack(self.TRAILER, offset, len(data),
+            self.MAGIC))
+
+
+# bake frame range chunks in parallel worker processes
+#
+# The command template is split into arguments, then each argument is formatted
+# with the fields blend, scene, armatures (json list of names), armature (the
+# first name), start, end, output, and any extra fields given. A worker must
+# save the [frames,tracks,3,4] poses of frames start..end (inclusive) to the
+# .npy file output, with the tracks of all armatures in order, all baked on
+# one frame sweep.
+def bake_chunks(command, blend, scene, armatures, start, end, workers,
+    directory, **fields):
+    return run_steps(iter_bake_chunks(command, blend, scene, armatures, start,
+        end, workers, directory, **fields))
+
+
+# bake frame range chunks (generator, see bake_chunks()); polls the workers,
+# yielding WAITING between polls, and returns the merged poses; workers still
+# running when the generator is closed are killed
+def iter_bake_chunks(command, blend, scene, armatures, start, end, workers,
+    directory, **fields):
+    
+    # split frame range into chunks
+    nframes = end - start + 1
+    n = max(1, min(workers, nframes))
+    bounds = [start + (nframes * i) // n for i in range(n + 1)]
+    
+    jobs = []
+    try:
+        
+        # start workers
+        for i in range(n):
+            
+            # format command
+            output = os.path.join(directory, 'chunk' + str(i) + '.npy')
+            values = dict(fields, blend=blend, scene=scene,
+                armatures=json.dumps(armatures), armature=armatures[0],
+                start=bounds[i], end=bounds[i + 1] - 1, output=output)
+            args = [a.format(**values) for a in shlex.split(command)]
+            
+            # start process (log to file, pipes can fill and block)
+            log = open(os.path.join(directory, 'chunk' + str(i) + '.log'),
+                'w+')
+            process = subprocess.Popen(args, stdout=log,
+                stderr=subprocess.STDOUT)
+            jobs.append((process, log, output, values))
+        
+        # wait for workers
+        while any(process.poll() is None for process, _, _, _ in jobs):
+            time.sleep(POLL)
+            yield WAITING
+        
+        # collect chunks
+        chunks = []
+        failed = []
+        for process, log, output, values in jobs:
+            if process.returncode != 0 or not os.path.exists(output):
+                log.seek(0)
+                failed.append('frames %i-%i:\n%s' % (values['start'],
+                    values['end'], log.read()[-2000 :]))
+            else:
+                chunks.append(np.load(output))
+        
+    finally:
+        
+        # kill unfinished workers and close logs
+        for process, log, _, _ in jobs:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            log.close()
+    
+    # report failures
+    if failed:
+        raise RuntimeError('bake workers failed\n' + '\n'.join(failed))
+    
+    # merge chunks
+    return np.concatenate(chunks)
+
+
+# multiply [...,3,4] poses (A after B)
+def multiply_poses(A, B):
+    
+    C = np.empty(np.broadcast(A, B).shape)
+    C[..., :3] = np.matmul(A[..., :3], B[..., :3])
+    C[..., 3] = np.matmul(A[..., :3], B[..., 3 :])[..., 0] + A[..., 3]
+    
+    return C
+
+
+# invert [...,3,4] poses
+def invert_poses(A):
+    
+    M = np.linalg.inv(A[..., :3])
+    B = np.empty(A.shape)
+    B[..., :3] = M
+    B[..., 3] = -np.matmul(M, A[..., 3 :])[..., 0]
+    
+    return B
+
+
+# get [n,3,3] rotation matrices from [n,k] rotation channels of a blender
+# rotation mode (quaternion w x y z, axis angle a x y z, or euler angles applied
+# in mode order)
+def rotation_matrices(values, mode):
+    
+    # quaternion (normalized, zero is identity)
+    n = len(values)
+    if mode == 'QUATERNION':
+        q = np.array(values, dtype=np.float64)
+        norm = np.sqrt((q ** 2).sum(axis=1))
+        q[norm == 0.0] = (1.0, 0.0, 0.0, 0.0)
+        norm[norm == 0.0] = 1.0
+        return compose_poses(q / norm[:, None], np.ones((n, 3)),
+            np.zeros((n, 3)))[:, :, :3]
+    
+    # axis angle (normalized axis, zero axis is identity)
+    if mode == 'AXIS_ANGLE':
+        a = values[:, 0]
+        u = np.array(values[:, 1 :], dtype=np.float64)
+        norm = np.sqrt((u ** 2).sum(axis=1))
+        a = np.where(norm == 0.0, 0.0, a)
+        norm[norm == 0.0] = 1.0
+        u /= norm[:, None]
+        K = np.zeros((n, 3, 3))
+        K[:, 0, 1], K[:, 0, 2], K[:, 1, 2] = -u[:, 2], u[:, 1], -u[:, 0]
+        K[:, 1, 0], K[:, 2, 0], K[:, 2, 1] = u[:, 2], -u[:, 1], u[:, 0]
+        return (np.eye(3) + np.sin(a)[:, None, None] * K
+            + (1.0 - np.cos(a))[:, None, None] * np.matmul(K, K))
+    
+    # euler angles (first axis of the mode is applied first)
+    R = np.tile(np.eye(3), (n, 1, 1))
+    for axis in mode:
+        i = 'XYZ'.index(axis)
+        j, k = (i + 1) % 3, (i + 2) % 3
+        c, s = np.cos(values[:, i]), np.sin(values[:, i])
+        E = np.tile(np.eye(3), (n, 1, 1))
+        E[:, j, j], E[:, j, k], E[:, k, j], E[:, k, k] = c, -s, s, c
+        R = np.matmul(E, R)
+    
+    return R
+
+
+# parse level of detail face ratios (separated by spaces or commas)
+def parse_ratios(text):
+    
+    ratios = [float(x) for x in text.replace(',', ' ').split()]
+    for ratio in ratios:
+        if not 0.0 < ratio <= 1.0:
+            raise ValueError('LOD ratio %r not in (0, 1]!' % ratio)
+    
+    return ratios
+
+
+# cluster [v,3] vertices of [t,3] triangles on a grid of r cells along the
+# longest bounding box side; returns vertex cluster labels [v], and the
+# triangles kept (non-degenerate, first of duplicates, in order) as indices
+def cluster_grid(co, triangles, r):
+    
+    # label vertices by grid cell
+    lo = co.min(axis=0)
+    extent = max(float((co.max(axis=0) - lo).max()), 1e-12)
+    cells = np.clip(((co - lo) * (r / extent)).astype(np.int64), 0, r - 1)
+    codes = cells[:, 0] + r * (cells[:, 1] + r * cells[:, 2])
+    _, labels = np.unique(codes, return_inverse=True)
+    labels = labels.reshape(-1)
+    
+    # drop collapsed triangles
+    t = labels[triangles]
+    keep = np.flatnonzero((t[:, 0] != t[:, 1]) & (t[:, 1] != t[:, 2]) &
+        (t[:, 2] != t[:, 0]))
+    
+    # drop duplicate triangles (any orientation; the stable sort puts the
+    # first of equal triangles first)
+    t = np.sort(t[keep], axis=1)
+    order = np.lexsort((t[:, 2], t[:, 1], t[:, 0]))
+    t = t[order]
+    first = np.ones(len(t), dtype=bool)
+    first[1 :] = (t[1 :] != t[: -1]).any(axis=1)
+    
+    return labels, keep[np.sort(order[first])]
+
+
+# number of export steps of n vertices (CHUNK vertices per step, at least one)
+def count_chunks(n):
+    return max(-(-n // CHUNK), 1)
+
+
+# decimate a triangle mesh by vertex clustering, to about a ratio of its
+# triangles; the grid resolution is bisected on the triangle count, and each
+# cluster is represented by its vertex closest to the cluster mean; returns
+# representative vertex indices [n] (ascending), the vertex correspondence map
+# [v] (vertex -> representative index), lod triangles [t,3], and their source
+# triangle indices [t]
+def decimate(co, triangles, ratio):
+    return run_steps(iter_decimate(co, triangles, ratio))
+
+
+# decimate a triangle mesh (generator, yields after each grid probe, see
+# decimate() and count_decimate())
+def iter_decimate(co, triangles, ratio):
+    
+    # full resolution
+    nvertices = len(co)
+    if ratio >= 1.0 or not len(triangles):
+        return (np.arange(nvertices, dtype=np.int32),
+            np.arange(nvertices, dtype=np.int32),
+            triangles.astype(np.int32), np.arange(len(triangles)))
+    
+    # find the coarsest grid keeping the target number of triangles
+    co = np.asarray(co, dtype=np.float64)
+    target = max(int(round(ratio * len(triangles))), 1)
+    lo, hi = 1, LOD_GRID
+    while lo < hi:
+        r = (lo + hi) // 2
+        if len(cluster_grid(co, triangles, r)[1]) >= target:
+            hi = r
+        else:
+            lo = r + 1
+        yield
+    labels, source = cluster_grid(co, triangles, lo)
+    
+    # choose cluster representatives (closest to the cluster mean)
+    n = int(labels.max()) + 1
+    counts = np.bincount(labels, minlength=n)
+    mean = np.stack([np.bincount(labels, co[:, k], n) for k in range(3)],
+        axis=1) / counts[:, None]
+    distance = ((co - mean[labels]) ** 2).sum(axis=1)
+    order = np.lexsort((distance, labels))
+    representatives = order[np.r_[0, np.cumsum(counts)[: -1]]]
+    
+    # order lod vertices as their representatives
+    order = np.argsort(representatives)
+    lut = np.empty(n, dtype=np.int32)
+    lut[order] = np.arange(n, dtype=np.int32)
+    
+    return (representatives[order].astype(np.int32), lut[labels],
+        lut[labels[triangles[source]]], source)
+
+
+# count decimation steps (grid probes, none at full resolution, see
+# iter_decimate())
+def count_decimate(ntriangles, ratio):
+    if ratio >= 1.0 or not ntriangles:
+        return 0
+    return LOD_GRID.bit_length() - 1
+
+
+# content hash of values (arrays are hashed by type, shape, and data)
+def digest(values):
+    
+    h = hashlib.sha1()
+    for value in values:
+        if isinstance(value, np.ndarray):
+            h.update(value.dtype.str.encode('utf-8'))
+            h.update(repr(value.shape).encode('utf-8'))
+            h.update(np.ascontiguousarray(value).tobytes())
+        else:
+            h.update(repr(value).encode('utf-8'))
+    
+    return h.hexdigest()
+
+
+# export section cache
+#
+# Maps section keys to (content hash, formatted text) and is stored next to the
+# exported file, as utf-8 json {'version', 'sections' : [[key, hash, text]]}
+# (least recently used first; plain data, so a cache planted in the output
+# directory cannot run code). Sections whose hash is unchanged are reused
+# instead of being formatted again. Hashes include FORMAT_VERSION, so sections
+# are formatted again when the format changes. The least recently used
+# sections are evicted beyond the size limit, and a cache of another version,
+# or malformed, is dropped.
+class DukeCache(object):
+    
+    # load cache
+    def __init__(self, path, size):
+        
+        self.path = path
+        self.size = size
+        self.sections = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        
+        # load sections (a missing, stale, or malformed cache starts empty)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data['version'] == FORMAT_VERSION:
+                for key, hash, text in data['sections']:
+                    if not all(isinstance(x, str) for x in (key, hash, text)):
+                        raise ValueError('Malformed cache entry!')
+                    self.sections[key] = (hash, text)
+        except Exception:
+            self.sections.clear()
+    
+    
+    # look up unchanged section text (None if changed or new); the section is
+    # removed until stored again (see store())
+    def lookup(self, key, hash):
+        
+        entry = self.sections.pop(key, None)
+        if entry is not None and entry[0] == hash:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        
+        return None
+    
+    
+    # store section text (as most recently used)
+    def store(self, key, hash, text):
+        self.sections[key] = (hash, text)
+    
+    
+    # save cache
+    def save(self):
+        
+        # evict least recently used sections
+        total = sum(len(text) for _, text in self.sections.values())
+        while total > self.size and self.sections:
+            _, (_, text) = self.sections.popitem(last=False)
+            total -= len(text)
+        
+        # write (replace atomically, so an interrupted save keeps the old one)
+        data = {'version' : FORMAT_VERSION, 'sections' : [[key, hash, text]
+            for key, (hash, text) in self.sections.items()]}
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(self.path + '.tmp', self.path)
+
+
+# evaluated mesh point cache
+#
+# Streams evaluated (modifiers, drivers, and shape keys applied) world space
+# vertex positions of meshes frame by frame into preallocated memory-mapped
+# float32 [frames,vertices,3] .npy files, one per mesh, named after the header:
+#   {'type' : 'points', 'name', 'puppet', 'start', 'frames', 'space' : 'world',
+#    'meshes' : [{'name', 'visible', 'path', 'vertices'}]}
+# where mesh paths are relative to the header. Mesh vertex counts must not
+# change between frames.
+class DukePointCache(object):
+    
+    # start point caches (files are allocated on the first frame, once vertex
+    # counts are known)
+    def __init__(self, path, scene, meshes, names, meta):
+        self.path = path
+        self.scene = scene
+        self.meshes = meshes
+        self.names = names
+        self.meta = meta
+        self.start = scene.frame_start
+        self.nframes = scene.frame_end - scene.frame_start + 1
+        base = os.path.splitext(path)[0]
+        self.paths = [base + '_' + name + '.npy' for name in names]
+        self.caches = [None] * len(meshes)
+        self.buffer = np.empty(0, dtype=np.float32)
+    
+    
+    # sample frame k (relative to the first frame)
+    def sample(self, k):
+        
+        for i, c in enumerate(self.meshes):
+            
+            # evaluate mesh (temporary mesh datablock)
+            data = c.to_mesh(self.scene, True, 'PREVIEW')
+            try:
+                
+                # allocate cache
+                n = len(data.vertices)
+                if self.caches[i] is None:
+                    self.caches[i] = np.lib.format.open_memmap(self.paths[i],
+                        mode='w+', dtype='<f4', shape=(self.nframes, n, 3))
+                elif self.caches[i].shape[1] != n:
+                    raise ValueError('Mesh \'%s\' vertex count changed!' %
+                        c.name)
+                
+                # get object coordinates in bulk (buffer shared by all meshes)
+                if self.buffer.size < 3 * n:
+                    self.buffer = np.empty(3 * n, dtype=np.float32)
+                co = self.buffer[: 3 * n]
+                data.vertices.foreach_get('co', co)
+                co = co.reshape(n, 3)
+                
+            finally:
+                
+                # free evaluated mesh
+                bpy.data.meshes.remove(data)
+            
+            # transform to world coordinates
+            A = np.array([c.matrix_world[0][:], c.matrix_world[1][:],
+                c.matrix_world[2][:]])
+            self.caches[i][k] = np.dot(co, A[:, :3].T) + A[:, 3]
+    
+    
+    # finish point caches
+    def close(self):
+        
+        # flush caches
+        meshes = []
+        for i, c in enumerate(self.meshes):
+            cache = self.caches[i]
+            if cache is not None:
+                cache.flush()
+            meshes.append({
+                'name'     : self.names[i],
+                'visible'  : not c.hide,
+                'path'     : os.path.basename(self.paths[i]),
+                'vertices' : cache.shape[1] if cache is not None else 0
+                })
+        self.caches = [None] * len(self.meshes)
+        
+        # write header
+        header = dict(self.meta, type='points', start=self.start,
+            frames=self.nframes, space='world', meshes=meshes)
+        with open(self.path, 'w') as f:
+            json.dump(header, f, indent=2)
+
+
+# format rows of an array with a row format (as one string)
+def format_rows(rows, fmt):
+    return (fmt * len(rows)) % tuple(rows.ravel().tolist())
+
+
+# format a batch of literal strings and (rows, fmt) blocks (worker process)
+def format_blocks(blocks):
+    return ''.join(block if isinstance(block, str) else format_rows(*block)
+        for block in blocks)
+
+
+# start text section formatting process pool (None for serial formatting);
+# workers are forked, as blender cannot be spawned as a python interpreter
+def format_pool(workers):
+    if workers < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    try:
+        return concurrent.futures.ProcessPoolExecutor(workers,
+            mp_context=multiprocessing.get_context('fork'))
+    except TypeError:
+        return concurrent.futures.ProcessPoolExecutor(workers)
+
+
+# counting text output file (context manager, closes the file)
+#
+# Stands in for a text output file over a binary file. Text is encoded as
+# utf-8 (with '\n' line ends on every platform), buffered up to BUFFER bytes,
+# and the bytes written are counted, so the uncompressed byte position is known
+# even when the stream cannot tell it (e.g. bz2 and lzma streams are not
+# seekable).
+class DukeCountFile(object):
+    
+    # start counting file
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+        self.blocks = []
+        self.size = 0
+    
+    
+    # write text
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.blocks.append(data)
+        self.size += len(data)
+        self.count += len(data)
+        if self.size >= BUFFER:
+            self.flush()
+    
+    
+    # write buffered bytes
+    def flush(self):
+        self.f.write(b''.join(self.blocks))
+        self.blocks = []
+        self.size = 0
+    
+    
+    # get uncompressed file position (bytes written)
+    def tell(self):
+        return self.count
+    
+    
+    # write buffered bytes and close file
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.f.close()
+    
+    
+    # enter context
+    def __enter__(self):
+        return self
+    
+    
+    # write buffered bytes and close file
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+# parallel text section formatting file (context manager, closes the file)
+#
+# Stands in for a text output file while sections are written. Literal text
+# and row blocks (see DukeExport.write_rows()) are batched until a batch holds
+# CHUNK rows, batches are formatted by the pool, and formatted batches are
+# written to the file in submission order, so the output is identical to
+# serial formatting. Row blocks are copied when batched (sections may reuse
+# their extraction buffers), and at most depth batches are pending at a time,
+# which bounds memory. Large literals (e.g. cached sections) are written
+# without a round trip through the pool.
+class DukeFormatFile(object):
+    
+    # start formatting file
+    def __init__(self, f, pool, depth):
+        self.f = f
+        self.pool = pool
+        self.depth = depth
+        self.blocks = []
+        self.rows = 0
+        self.queue = collections.deque()
+    
+    
+    # write literal text
+    def write(self, text):
+        if len(text) < CHUNK:
+            self.blocks.append(text)
+        else:
+            self.submit()
+            self.queue.append(text)
+    
+    
+    # write rows of an array with a row format
+    def write_rows(self, rows, fmt):
+        self.blocks.append((np.array(rows), fmt))
+        self.rows += len(rows)
+        if self.rows >= CHUNK:
+            self.submit()
+    
+    
+    # submit batch, then write finished batches in order (waits for the first
+    # while too many are pending)
+    def submit(self):
+        
+        # submit batch
+        if self.blocks:
+            self.queue.append(self.pool.submit(format_blocks, self.blocks))
+        self.blocks = []
+        self.rows = 0
+        
+        # write finished batches
+        while self.queue:
+            text = self.queue[0]
+            if not isinstance(text, str):
+                if not text.done() and len(self.queue) <= self.depth:
+                    break
+                text = text.result()
+            self.f.write(text)
+            self.queue.popleft()
+    
+    
+    # write all pending batches
+    def wait(self):
+        self.submit()
+        while self.queue:
+            text = self.queue.popleft()
+            self.f.write(text if isinstance(text, str) else text.result())
+    
+    
+    # get file position (waits for pending batches)
+    def tell(self):
+        self.wait()
+        return self.f.tell()
+    
+    
+    # enter context
+    def __enter__(self):
+        return self
+    
+    
+    # write pending batches (dropped on errors) and close file
+    def __exit__(self, type, value, traceback):
+        try:
+            if type is None:
+                self.wait()
+            else:
+                for text in self.queue:
+                    if not isinstance(text, str):
+                        text.cancel()
+        finally:
+            self.f.close()
+        return False
+
+
+# export stage timer (context manager, see DukeProfiler.stage)
+class DukeStage(object):
+    
+    # create stage timer
+    def __init__(self, profiler, name, f, items):
+        self.profiler = profiler
+        self.name = name
+        self.f = f
+        self.items = items
+    
+    
+    # get file position (None if unknown); formatting files are counted at the
+    # file beneath them, without waiting for pending batches (so the bytes of
+    # a batch count for the stage it is written in)
+    def tell(self):
+        f = self.f.f if isinstance(self.f, DukeFormatFile) else self.f
+        try:
+            return f.tell()
+        except (AttributeError, OSError):
+            return None
+    
+    
+    # start timing
+    def __enter__(self):
+        self.offset = self.tell()
+        self.time0 = time.perf_counter()
+        self.idle0 = self.profiler.idle()
+        return self
+    
+    
+    # stop timing (excluding time paused between export steps) and record
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.time0
+        elapsed -= self.profiler.idle() - self.idle0
+        offset = self.tell()
+        nbytes = 0
+        if offset is not None and self.offset is not None:
+            nbytes = offset - self.offset
+        self.profiler.record(self.name, elapsed, self.items, nbytes)
+        return False
+
+
+# export profiler
+#
+# Records wall time, calls, items processed, and bytes written per named stage
+# (and optionally a cProfile capture of the whole export). Stages are timed by
+# wrapping work in 'with profiler.stage(name, f, items):', where bytes written
+# are measured from the position of file f. The profiler is paused while the
+# ui runs between export steps (see DukeExport.iter_export()), and paused time
+# is excluded from the stages and the total.
+class DukeProfiler(object):
+    
+    # create profiler
+    def __init__(self, cprofile=False):
+        self.stages = collections.OrderedDict()
+        self.profile = cProfile.Profile() if cprofile else None
+        self.time = 0.0
+        self.paused = 0.0
+        self.time_paused = None
+    
+    
+    # time a stage
+    def stage(self, name, f=None, items=0):
+        return DukeStage(self, name, f, items)
+    
+    
+    # record a stage call
+    def record(self, name, elapsed, items, nbytes):
+        stats = self.stages.setdefault(name, [0.0, 0, 0, 0])
+        stats[0] += elapsed
+        stats[1] += 1
+        stats[2] += items
+        stats[3] += nbytes
+    
+    
+    # start export
+    def start(self):
+        self.time0 = time.perf_counter()
+        self.idle0 = self.idle()
+        if self.profile is not None:
+            self.profile.enable()
+    
+    
+    # stop export
+    def stop(self):
+        if self.time_paused is not None:
+            self.resume()
+        if self.profile is not None:
+            self.profile.disable()
+        self.time += (time.perf_counter() - self.time0 -
+            (self.idle() - self.idle0))
+    
+    
+    # pause export (between export steps)
+    def pause(self):
+        if self.profile is not None:
+            self.profile.disable()
+        self.time_paused = time.perf_counter()
+    
+    
+    # resume export
+    def resume(self):
+        self.paused += time.perf_counter() - self.time_paused
+        self.time_paused = None
+        if self.profile is not None:
+            self.profile.enable()
+    
+    
+    # get total time paused (so far)
+    def idle(self):
+        if self.time_paused is None:
+            return self.paused
+        return self.paused + time.perf_counter() - self.time_paused
+    
+    
+    # get report
+    def report(self):
+        stages = collections.OrderedDict()
+        for name, (elapsed, calls, items, nbytes) in self.stages.items():
+            stages[name] = {'time' : elapsed, 'calls' : calls,
+                'items' : items, 'bytes' : nbytes}
+        return {'time' : self.time, 'stages' : stages}
+    
+    
+    # get summary lines (slowest stages first)
+    def summary(self, n=6):
+        lines = ['Total %.3fs' % self.time]
+        stages = sorted(self.stages.items(), key=lambda s : -s[1][0])
+        for name, (elapsed, calls, items, nbytes) in stages[: n]:
+            lines.append('%s %.3fs  %ix  %i items  %i B' % (name, elapsed,
+                calls, items, nbytes))
+        return lines
+    
+    
+    # save json report (and cProfile stats next to it, as .prof)
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        if self.profile is not None:
+            self.profile.dump_stats(os.path.splitext(path)[0] + '.prof')
+
+
+# null export profiler (negligible overhead when profiling is disabled)
+class DukeNullProfiler(object):
+    
+    # time a stage (does nothing)
+    def stage(self, name, f=None, items=0):
+        return self
+    
+    
+    # start stage (does nothing)
+    def __enter__(self):
+        return self
+    
+    
+    # stop stage (does nothing)
+    def __exit__(self, *exc):
+        return False
+    
+    
+    # start export (does nothing)
+    def start(self):
+        pass
+    
+    
+    # stop export (does nothing)
+    def stop(self):
+        pass
+    
+    
+    # pause export (does nothing)
+    def pause(self):
+        pass
+    
+    
+    # resume export (does nothing)
+    def resume(self):
+        pass
+    
+    
+    # get summary lines (none)
+    def summary(self, n=6):
+        return []
+
+
+# run export steps generator to completion, returning its result (see
+# DukeExport.iter_export())
+def run_steps(steps):
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+# exporter (writes puppet and animation data)
+class DukeExport(object):
+    
+    # profiler (replaced for each export, see export())
+    profiler = DukeNullProfiler()
+    
+    # text float format (set for each export, see export())
+    fmt = '%r'
+    
+    # triangulate faces (set for each export, see export())
+    triangulate = False
+    
+    # text section formatting pool and its pending batch limit (set for each
+    # export, see export())
+    pool = None
+    depth = 0
+    
+    
+    # rename for export
+    def rename(self, name):
+        return name.replace(' ', '_').replace('.', '_')
+    
+    
+    # get material custom properties (name-value pairs of 'duke_' properties)
+    def get_properties(self, material):
+        
+        properties = []
+        for k in material.id_data.keys():
+            
+            # continue if not duke property
+            if k.find('duke_', 0, 5) == -1:
+                continue
+            
+            # get property name-value pair
+            name = k.replace('duke_', '')
+            properties.append((self.rename(name), material.id_data[k]))
+        
+        return properties
+    
+    
+    # write material
+    def write_material(self, f, material):
+        
+        # write material type
+        f.write('type : material\n')
+            
+        # write material name
+        f.write('name : ' + self.rename(material.name) + '\n')
+        
+        # write number of custom properties
+        properties = self.get_properties(material)
+        f.write('properties : ' + str(len(properties)) + '\n')
+        
+        # write material custom properties
+        for name, value in properties:
+            f.write(name + ' : ' + str(value) + '\n')
+        
+        # write blank
+        f.write('\n')
+    
+    
+    # get pose as a [3,4] array (transformation matrix, translation vector)
+    def get_pose(self, matrix):
+        return np.array([matrix[0][:], matrix[1][:], matrix[2][:]])
+    
+    
+    # write matrix (column-major, as a single record)
+    def write_matrix(self, f, matrix):
+        
+        values = tuple(matrix[i][j] for j in range(4) for i in range(3))
+        f.write(' '.join([self.fmt] * 12) % values + '\n')
+    
+    
+    # write rows of an array with a row format (bulk export)
+    def write_rows(self, f, rows, fmt):
+        
+        # write in blocks to bound the size of formatted strings (formatted in
+        # parallel by formatting files, see DukeFormatFile)
+        for i in range(0, len(rows), CHUNK):
+            block = rows[i : i + CHUNK]
+            if hasattr(f, 'write_rows'):
+                f.write_rows(block, fmt)
+            else:
+                f.write(format_rows(block, fmt))
+    
+    
+    # get vertex coordinates as a [n,3] array
+    def get_coordinates(self, vertices, buffer=None):
+        
+        # (re)allocate buffer
+        n = len(vertices)
+        if buffer is None or buffer.size < 3 * n:
+            buffer = np.empty(3 * n, dtype=np.float32)
+        
+        # get coordinates in bulk (float32 matches blender storage)
+        co = buffer[: 3 * n]
+        vertices.foreach_get('co', co)
+        
+        return co.reshape(n, 3)
+    
+    
+    # write vertex coordinates
+    def write_vertices(self, f, vertices, buffer=None):
+        run_steps(self.iter_vertices(f, vertices, buffer))
+    
+    
+    # write vertex coordinates (generator, yields between blocks of CHUNK
+    # vertices, see count_chunks())
+    def iter_vertices(self, f, vertices, buffer=None):
+        
+        # fallback for collections without bulk access (per-vertex path)
+        if not hasattr(vertices, 'foreach_get'):
+            
+            fmt = ' '.join([self.fmt] * 3) + '\n'
+            for i, v in enumerate(vertices):
+                if i and not i % CHUNK:
+                    yield
+                f.write(fmt % (v.co.x, v.co.y, v.co.z))
+            
+            return
+        
+        # get coordinates in bulk
+        co = self.get_coordinates(vertices, buffer)
+        
+        # write coordinates (repr of float32 values matches str(v.co.x))
+        fmt = ' '.join([self.fmt] * 3) + '\n'
+        for i in range(0, len(co), CHUNK):
+            if i:
+                yield
+            self.write_rows(f, co[i : i + CHUNK], fmt)
+    
+    
+    # write vertex data (excludes coordinates, which are in shape types)
+    def write_vertex_data(self, f, vertices):
+        
+        # write vertex type
+        f.write('type : vertex\n')
+        
+        for vertex in vertices:
+            
+            # write color
+            # TODO, but not really needed...
+            
+            # write normal
+            f.write(str(vertex.normal.x) + ' ')
+            f.write(str(vertex.normal.y) + ' ')
+            f.write(str(vertex.normal.z) + '\n')
+            
+            # write uv
+            # TODO, but not really needed...
+            
+        # write blank
+        f.write('\n')
+    
+    
+    # get face vertex indices ([f,ngon], padded with -1) and material indices
+    def get_faces(self, data, table):
+        
+        # triangulated faces
+        if self.triangulate:
+            return self.get_triangles(data, table)
+        
+        # get polygon loops and material slots in bulk
+        nfaces = len(data.polygons)
+        starts = np.empty(nfaces, dtype=np.int32)
+        totals = np.empty(nfaces, dtype=np.int32)
+        slots = np.empty(nfaces, dtype=np.int32)
+        data.polygons.foreach_get('loop_start', starts)
+        data.polygons.foreach_get('loop_total', totals)
+        data.polygons.foreach_get('material_index', slots)
+        loops = np.empty(len(data.loops), dtype=np.int32)
+        data.loops.foreach_get('vertex_index', loops)
+        
+        # gather face vertex indices padded to max ngon
+        ngon = int(totals.max()) if nfaces else 0
+        columns = np.arange(ngon)
+        mask = columns < totals[:, None]
+        faces = np.full((nfaces, ngon), -1, dtype=np.int32)
+        faces[mask] = loops[(starts[:, None] + columns)[mask]]
+        
+        return faces, self.get_materials(data, table, slots)
+    
+    
+    # map material slots to global material indices (unresolved -> last)
+    def get_materials(self, data, table, slots):
+        
+        default = len(table) - 1
+        lut = [table.get(m.name, default) if m is not None else default
+            for m in data.materials]
+        lut = np.array(lut + [default], dtype=np.int32)
+        
+        return lut[np.minimum(slots, len(lut) - 1)]
+    
+    
+    # get triangulated faces ([t,3] vertex indices) and (global) material
+    # indices, from loop triangles (blender 2.8+) or fan triangulated polygons
+    # (as PuppetScan.m does)
+    def get_triangles(self, data, table):
+        
+        # get polygon material slots in bulk
+        slots = np.empty(len(data.polygons), dtype=np.int32)
+        data.polygons.foreach_get('material_index', slots)
+        
+        # get triangles
+        triangles, polygons = self.get_loop_triangles(data)
+        
+        return triangles, self.get_materials(data, table, slots)[polygons]
+    
+    
+    # get [t,3] triangle vertex indices and their polygon indices
+    def get_loop_triangles(self, data):
+        
+        # loop triangles (triangle vertices and polygons in bulk)
+        nfaces = len(data.polygons)
+        if hasattr(data, 'loop_triangles'):
+            data.calc_loop_triangles()
+            n = len(data.loop_triangles)
+            triangles = np.empty(3 * n, dtype=np.int32)
+            polygons = np.empty(n, dtype=np.int32)
+            data.loop_triangles.foreach_get('vertices', triangles)
+            data.loop_triangles.foreach_get('polygon_index', polygons)
+            triangles = triangles.reshape(n, 3)
+        
+        # fan triangulation (triangles (0, j + 1, j + 2) of each polygon)
+        else:
+            starts = np.empty(nfaces, dtype=np.int32)
+            totals = np.empty(nfaces, dtype=np.int32)
+            data.polygons.foreach_get('loop_start', starts)
+            data.polygons.foreach_get('loop_total', totals)
+            loops = np.empty(len(data.loops), dtype=np.int32)
+            data.loops.foreach_get('vertex_index', loops)
+            counts = np.maximum(totals - 2, 0)
+            polygons = np.repeat(np.arange(nfaces, dtype=np.int32), counts)
+            j = np.arange(len(polygons)) - np.repeat(np.cumsum(counts) - counts,
+                counts)
+            first = starts[polygons]
+            triangles = np.column_stack((loops[first], loops[first + j + 1],
+                loops[first + j + 2]))
+        
+        return triangles, polygons
+    
+    
+    # write face data (faces from get_faces(), if already gathered)
+    def write_face_data(self, f, data, table, faces=None):
+        
+        # write face type
+        f.write('type : face\n')
+        
+        # get faces
+        if faces is None:
+            faces = self.get_faces(data, table)
+        faces, materials = faces
+        
+        # write max ngon
+        n = faces.shape[1]
+        f.write('ngon : ' + str(n) + '\n')
+        
+        # write face vertex indices, delimiter, and (global) material index
+        rows = np.column_stack((faces, materials))
+        self.write_rows(f, rows, '%d ' * n + ', %d\n')
+        
+        # write blank
+        f.write('\n')
+    
+    
+    # get mesh shapes as (name, vertices) pairs
+    def get_shapes(self, mesh):
+        
+        try:
+            
+            # shape keys
+            return [(s.name, s.data) for s in mesh.data.shape_keys.key_blocks]
+            
+        except:
+            
+            # no shape keys, just a base mesh (equivalent to a single key)
+            return [(mesh.name, mesh.data.vertices)]
+    
+    
+    # write mesh
+    def write_mesh(self, f, mesh, table):
+        run_steps(self.iter_mesh(f, mesh, table))
+    
+    
+    # write mesh (generator, yields after each shape, and between blocks of
+    # CHUNK shape vertices)
+    def iter_mesh(self, f, mesh, table):
+        
+        # write mesh type
+        f.write('type : mesh\n')
+        
+        # write name
+        f.write('name : ' + self.rename(mesh.name) + '\n')
+        
+        # write visibility
+        f.write('visible : ' + str(not mesh.hide) + '\n')
+        
+        # write pose (puppet coordinates)
+        f.write('pose : ')
+        self.write_matrix(f, mesh.matrix_local)
+        
+        # get shapes
+        shapes = self.get_shapes(mesh)
+        
+        # write number of shape keys
+        f.write('shapes : ' + str(len(shapes)) + '\n')
+        
+        # write number of vertices
+        n = len(mesh.data.vertices)
+        f.write('vertices : ' + str(n) + '\n')
+        
+        # write number of faces (triangles if triangulated)
+        faces = self.get_faces(mesh.data, table)
+        f.write('faces : ' + str(len(faces[0])) + '\n')
+        
+        # write blank
+        f.write('\n')
+        
+        # allocate coordinate buffer (shared by all shapes)
+        buffer = np.empty(3 * len(mesh.data.vertices), dtype=np.float32)
+        
+        # write shapes
+        for name, vertices in shapes:
+            
+            # write shape type
+            f.write('type : shape\n')
+            
+            # write name
+            f.write('name : ' + self.rename(name) + '\n')
+            
+            # write vertex coordinates
+            yield from self.iter_vertices(f, vertices, buffer)
+            
+            # write blank
+            f.write('\n')
+            yield
+        
+        # write vertex data (excludes coordinates, which are in shape types)
+		# DISABLED
+        #self.write_vertex_data(f, mesh.data.vertices)
+        
+        # write face data
+        self.write_face_data(f, mesh.data, table, faces)
+        
+    
+    # write mesh instance (mesh sharing the shapes and faces of the mesh
+    # section key, see iter_crowd())
+    def write_mesh_instance(self, f, mesh, key):
+        
+        # write mesh type
+        f.write('type : mesh\n')
+        
+        # write name
+        f.write('name : ' + self.rename(mesh.name) + '\n')
+        
+        # write visibility
+        f.write('visible : ' + str(not mesh.hide) + '\n')
+        
+        # write pose (puppet coordinates)
+        f.write('pose : ')
+        self.write_matrix(f, mesh.matrix_local)
+        
+        # write instanced mesh section key
+        f.write('instance : ' + key + '\n')
+        
+        # write blank
+        f.write('\n')
+    
+    
+    # get kinship (parent name, deformation children names)
+    def get_kinship(self, bone, armature):
+        
+        # get parent
+        if bone.parent and bone.parent.bone.use_deform:
+            
+            # parent exists
+            parent = self.rename(bone.parent.name)
+            
+        else:
+            
+            # no parent bone, so make it a child of the armature
+            parent = self.rename(armature.name)
+        
+        # get children
+        children = [self.rename(b.name) for b in bone.children
+            if b.bone.use_deform]
+        
+        return parent, children
+    
+    
+    # write kinship
+    def write_kinship(self, f, bone, armature):
+        
+        # get kinship
+        parent, children = self.get_kinship(bone, armature)
+        
+        # write parent
+        f.write('parent : ' + parent + '\n')
+        
+        # write children
+        if children:
+            
+            # write number of children
+            f.write('children : ' + str(len(children)) + '\n')
+            
+            # write list of children
+            f.write(''.join(' ' + name for name in children) + '\n')
+            
+        else:
+            
+            # no children
+            f.write('children : 0\n')
+    
+    
+    # get vertex group weight entries in vertex order (vertex indices, group
+    # indices, weights)
+    def get_groups(self, mesh):
+        return run_steps(self.iter_groups(mesh))
+    
+    
+    # get vertex group weight entries (generator, yields between blocks of
+    # CHUNK vertices, see count_chunks())
+    def iter_groups(self, mesh):
+        
+        # gather weight entries in a single pass over vertices
+        indices = []
+        groups = []
+        values = []
+        for i, v in enumerate(mesh.data.vertices):
+            if i and not i % CHUNK:
+                yield
+            for g in v.groups:
+                indices.append(i)
+                groups.append(g.group)
+                values.append(g.weight)
+        
+        return (np.array(indices, dtype=np.int32),
+            np.array(groups, dtype=np.int32),
+            np.array(values, dtype=np.float32))
+    
+    
+    # get vertex group weights as an inverted index (group -> vertices, weights)
+    def get_weights(self, mesh, entries=None):
+        
+        # get weight entries
+        if entries is None:
+            entries = self.get_groups(mesh)
+        indices, groups, values = entries
+        
+        # sort entries by group (stable, so vertex indices stay ascending)
+        order = np.argsort(groups, kind='mergesort')
+        indices = indices[order]
+        values = values[order]
+        
+        # compute group offsets (group i is indices[offsets[i]:offsets[i+1]])
+        counts = np.bincount(groups, minlength=len(mesh.vertex_groups))
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1 :])
+        
+        return offsets, indices, values
+    
+    
+    # write bone
+    def write_bone(self, f, bone, armature, weights):
+        
+        # skip if not deformation bone
+        # may unlink part of parent-child graph, set parent to arm ature?
+        if not bone.bone.use_deform:
+            return
+        
+        # write type
+        f.write('type : bone\n')
+        
+        # write name
+        f.write('name : ' + self.rename(bone.name) + '\n')
+        
+        # write parent and children
+        self.write_kinship(f, bone, armature)
         
         # write bone rest pose (object coordinates)
         f.write('pose : ')
@@ -411,17 +1949,17 @@ class DukeExportButton(bpy.types.Operator):
             # write weights
             try:
                 
-                # write number of weights
+                # look up bone weight group in mesh inverted index
                 i = c.vertex_groups[bone.name].index
-                n = sum(g.group == i for v in c.data.vertices for g in v.groups)
-                f.write('weights : ' + str(n) + '\n')
+                offsets, indices, values = weights[c.name]
+                a, b = offsets[i], offsets[i + 1]
+                
+                # write number of weights
+                f.write('weights : ' + str(b - a) + '\n')
                 
                 # write weight group indices and values
-                bone_vertex_group_index = c.vertex_groups[bone.name].index
-                for i, v in enumerate(c.data.vertices):
-                    for g in v.groups:
-                        if g.group == bone_vertex_group_index:
-                            f.write(str(i) + ' ' + str(g.weight) + '\n')
+                rows = np.column_stack((indices[a : b], values[a : b]))
+                self.write_rows(f, rows, '%d ' + self.fmt + '\n')
                 
             except:
                 
@@ -432,61 +1970,885 @@ class DukeExportButton(bpy.types.Operator):
             f.write('\n')
     
     
+    # get sparse skinning matrix of a mesh in CSR layout (row pointers per
+    # vertex, then deformation bone indices and weights as columns); groups of
+    # non-deformation bones are dropped
+    def get_skin(self, mesh, deform, entries=None):
+        
+        # get weight entries (in vertex order)
+        if entries is None:
+            entries = self.get_groups(mesh)
+        indices, groups, values = entries
+        
+        # map vertex groups to deformation bone indices (-1 if none)
+        bones = {b.name : j for j, b in enumerate(deform)}
+        n = int(groups.max()) + 1 if len(groups) else 0
+        lut = np.full(n, -1, dtype=np.int32)
+        for g in mesh.vertex_groups:
+            if g.index < n:
+                lut[g.index] = bones.get(g.name, -1)
+        
+        # keep deformation bone entries
+        columns = lut[groups]
+        keep = columns >= 0
+        indices = indices[keep]
+        columns = columns[keep]
+        values = values[keep]
+        
+        # compute row pointers (vertex i is columns[pointers[i]:pointers[i+1]])
+        counts = np.bincount(indices, minlength=len(mesh.data.vertices))
+        pointers = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=pointers[1 :])
+        
+        return pointers, columns, values
+    
+    
+    # write sparse skinning matrix
+    def write_skin(self, f, mesh, skin):
+        
+        # write type
+        f.write('type : skin\n')
+        
+        # write mesh name
+        f.write('name : ' + self.rename(mesh.name) + '\n')
+        
+        # write number of vertices (rows)
+        pointers, columns, values = skin
+        f.write('vertices : ' + str(len(pointers) - 1) + '\n')
+        
+        # write number of weights (entries)
+        f.write('entries : ' + str(len(columns)) + '\n')
+        
+        # write row pointers (single line)
+        f.write(' '.join(map(str, pointers.tolist())) + '\n')
+        
+        # write bone indices and weights
+        rows = np.column_stack((columns, values))
+        self.write_rows(f, rows, '%d ' + self.fmt + '\n')
+        
+        # write blank
+        f.write('\n')
+    
+    
+    # get mesh topology of the exported faces (polygons, or triangles if
+    # triangulated): edges ([e,2] vertex indices), vertex face adjacency (CSR
+    # row pointers, face indices), vertex normals [v,3], and face normals [f,3]
+    def get_topology(self, data, table):
+        
+        # get vertex and polygon normals in bulk
+        nvertices = len(data.vertices)
+        nfaces = len(data.polygons)
+        vertex_normals = np.empty(3 * nvertices, dtype=np.float32)
+        face_normals = np.empty(3 * nfaces, dtype=np.float32)
+        data.vertices.foreach_get('normal', vertex_normals)
+        data.polygons.foreach_get('normal', face_normals)
+        vertex_normals = vertex_normals.reshape(nvertices, 3)
+        face_normals = face_normals.reshape(nfaces, 3)
+        
+        # triangles (unique triangle edges, polygon normals)
+        if self.triangulate:
+            faces, polygons = self.get_loop_triangles(data)
+            face_normals = face_normals[polygons]
+            pairs = np.sort(np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]],
+                faces[:, [2, 0]])), axis=1).astype(np.int64)
+            codes = np.unique(pairs[:, 0] * nvertices + pairs[:, 1])
+            edges = np.column_stack(divmod(codes, nvertices)).astype(np.int32)
+        
+        # polygons (mesh edges in bulk)
+        else:
+            faces, _ = self.get_faces(data, table)
+            edges = np.empty(2 * len(data.edges), dtype=np.int32)
+            data.edges.foreach_get('vertices', edges)
+            edges = edges.reshape(len(data.edges), 2)
+        
+        # vertex face adjacency (faces of each vertex in ascending order)
+        mask = faces >= 0
+        vertices = faces[mask]
+        adjacent = np.nonzero(mask)[0].astype(np.int32)
+        adjacent = adjacent[np.argsort(vertices, kind='mergesort')]
+        counts = np.bincount(vertices, minlength=nvertices)
+        pointers = np.zeros(nvertices + 1, dtype=np.int64)
+        np.cumsum(counts, out=pointers[1 :])
+        
+        return edges, pointers, adjacent, vertex_normals, face_normals
+    
+    
+    # write mesh topology (edges, adjacency, and normals sections)
+    def write_topology(self, f, mesh, topology):
+        
+        # notation
+        name = self.rename(mesh.name)
+        edges, pointers, adjacent, vertex_normals, face_normals = topology
+        
+        # write edges type, mesh name, and number of edges
+        f.write('type : edges\n')
+        f.write('name : ' + name + '\n')
+        f.write('edges : ' + str(len(edges)) + '\n')
+        
+        # write edge vertex indices
+        self.write_rows(f, edges, '%d %d\n')
+        
+        # write blank
+        f.write('\n')
+        
+        # write adjacency type, mesh name, and number of vertices (rows) and
+        # adjacent faces (entries)
+        f.write('type : adjacency\n')
+        f.write('name : ' + name + '\n')
+        f.write('vertices : ' + str(len(pointers) - 1) + '\n')
+        f.write('entries : ' + str(len(adjacent)) + '\n')
+        
+        # write row pointers (single line) and adjacent face indices
+        f.write(' '.join(map(str, pointers.tolist())) + '\n')
+        self.write_rows(f, adjacent[:, None], '%d\n')
+        
+        # write blank
+        f.write('\n')
+        
+        # write normals type, mesh name, and number of vertices and faces
+        f.write('type : normals\n')
+        f.write('name : ' + name + '\n')
+        f.write('vertices : ' + str(len(vertex_normals)) + '\n')
+        f.write('faces : ' + str(len(face_normals)) + '\n')
+        
+        # write vertex normals, then face normals
+        fmt = ' '.join([self.fmt] * 3) + '\n'
+        self.write_rows(f, vertex_normals, fmt)
+        self.write_rows(f, face_normals, fmt)
+        
+        # write blank
+        f.write('\n')
+    
+    
+    # get mesh levels of detail as (ratio, vertices, lut, faces, materials)
+    # tuples, decimated from the triangulated basis mesh (see decimate())
+    def get_lods(self, data, table, ratios):
+        return run_steps(self.iter_lods(data, table, ratios))
+    
+    
+    # get mesh levels of detail (generator, yields after each decimation grid
+    # probe, see iter_decimate())
+    def iter_lods(self, data, table, ratios):
+        
+        # get basis coordinates and triangles
+        co = self.get_coordinates(data.vertices)
+        triangles, materials = self.get_triangles(data, table)
+        
+        # decimate
+        lods = []
+        for ratio in ratios:
+            vertices, lut, faces, source = yield from iter_decimate(co,
+                triangles, ratio)
+            lods.append((ratio, vertices, lut, faces, materials[source]))
+        
+        return lods
+    
+    
+    # write mesh levels of detail (one section per level)
+    def write_lods(self, f, mesh, lods):
+        
+        for level, (ratio, vertices, lut, faces, materials) in enumerate(lods):
+            
+            # write type, mesh name, level, and face ratio
+            f.write('type : lod\n')
+            f.write('name : ' + self.rename(mesh.name) + '\n')
+            f.write('level : ' + str(level + 1) + '\n')
+            f.write('ratio : ' + repr(ratio) + '\n')
+            
+            # write number of vertices and faces (triangles)
+            f.write('vertices : ' + str(len(vertices)) + '\n')
+            f.write('faces : ' + str(len(faces)) + '\n')
+            
+            # write lod vertex mesh vertices and mesh vertex lod vertices
+            # (single lines)
+            f.write(' '.join(map(str, vertices.tolist())) + '\n')
+            f.write(' '.join(map(str, lut.tolist())) + '\n')
+            
+            # write face vertex indices, delimiter, and (global) material index
+            rows = np.column_stack((faces, materials))
+            self.write_rows(f, rows, '%d %d %d , %d\n')
+            
+            # write blank
+            f.write('\n')
+    
+    
+    # fingerprint material
+    def fingerprint_material(self, material):
+        return digest([material.name, self.get_properties(material)])
+    
+    
+    # fingerprint mesh (pose, shapes, faces)
+    def fingerprint_mesh(self, mesh, table):
+        
+        # header data
+        values = [mesh.name, mesh.hide, self.get_pose(mesh.matrix_local)]
+        
+        # shapes
+        buffer = np.empty(3 * len(mesh.data.vertices), dtype=np.float32)
+        for name, vertices in self.get_shapes(mesh):
+            values.append(name)
+            values.append(self.get_coordinates(vertices, buffer))
+        
+        # faces
+        values.extend(self.get_faces(mesh.data, table))
+        
+        return digest(values)
+    
+    
+    # fingerprint bone (kinship, rest pose, weights)
+    def fingerprint_bone(self, bone, armature, weights):
+        
+        # header data
+        values = [bone.name, bone.bone.use_deform,
+            self.get_kinship(bone, armature),
+            self.get_pose(bone.bone.matrix_local)]
+        
+        # weights
+        for c in armature.children:
+            if c.type == 'MESH':
+                offsets, indices, group = weights[c.name]
+                try:
+                    i = c.vertex_groups[bone.name].index
+                    values.append(indices[offsets[i] : offsets[i + 1]])
+                    values.append(group[offsets[i] : offsets[i + 1]])
+                except KeyError:
+                    values.append(None)
+                values.append(c.name)
+        
+        return digest(values)
+    
+    
+    # open output file (compressed as set in the scene)
+    def open_file(self, scene, path, mode):
+        return open_output(path, mode, scene.duke.compression,
+            scene.duke.compression_level)
+    
+    
+    # open text output file (utf-8, counting bytes written, see DukeCountFile,
+    # and formatted in parallel if the export has a formatting pool, see
+    # DukeFormatFile)
+    def open_text(self, scene, path):
+        f = DukeCountFile(self.open_file(scene, path, 'wb'))
+        if self.pool is None:
+            return f
+        return DukeFormatFile(f, self.pool, self.depth)
+    
+    
+    # fingerprint sparse skinning matrix
+    def fingerprint_skin(self, mesh, skin):
+        return digest([mesh.name] + list(skin))
+    
+    
+    # fingerprint mesh topology
+    def fingerprint_topology(self, mesh, topology):
+        return digest([mesh.name] + list(topology))
+    
+    
+    # fingerprint mesh levels of detail
+    def fingerprint_lods(self, mesh, lods):
+        return digest([mesh.name] + [x for lod in lods for x in lod])
+    
+    
+    # write section, through the export cache if enabled
+    def write_section(self, f, cache, key, fingerprint, write, *args):
+        
+        if cache is None:
+            write(f, *args)
+        else:
+            hash = digest([fingerprint(*args), self.fmt, FORMAT_VERSION])
+            text = cache.lookup(key, hash)
+            if text is None:
+                buffer = self.open_section()
+                write(buffer, *args)
+                text = self.section_text(buffer)
+            cache.store(key, hash, text)
+            f.write(text)
+    
+    
+    # write section through the export cache if enabled (generator, runs the
+    # steps of iter_write(f, *args) unless the cached section is unchanged)
+    def iter_section(self, f, cache, key, fingerprint, iter_write, *args):
+        
+        if cache is None:
+            yield from iter_write(f, *args)
+        else:
+            hash = digest([fingerprint(*args), self.fmt, FORMAT_VERSION])
+            text = cache.lookup(key, hash)
+            if text is None:
+                buffer = self.open_section()
+                yield from iter_write(buffer, *args)
+                text = self.section_text(buffer)
+            cache.store(key, hash, text)
+            f.write(text)
+    
+    
+    # open section text buffer (for the export cache; formatted in parallel if
+    # the export has a formatting pool, see DukeFormatFile)
+    def open_section(self):
+        buffer = io.StringIO()
+        if self.pool is None:
+            return buffer
+        return DukeFormatFile(buffer, self.pool, self.depth)
+    
+    
+    # get formatted text of a section buffer (see open_section())
+    def section_text(self, buffer):
+        if isinstance(buffer, DukeFormatFile):
+            buffer.wait()
+            buffer = buffer.f
+        return buffer.getvalue()
+    
+    
     # write puppet
     def write_puppet(self, scene, armature, bones):
+        run_steps(self.iter_puppet(scene, armature, bones))
+    
+    
+    # write puppet (generator, yields after each section and mesh shape)
+    def iter_puppet(self, scene, armature, bones):
+        
+        # get parameters
+        puppet_path = scene.duke.puppet_path
+        
+        # load export cache
+        cache = None
+        if scene.duke.cache_enable:
+            cache = DukeCache(puppet_path + '.cache',
+                scene.duke.cache_size * 2 ** 20)
+        
+        with self.open_text(scene, puppet_path) as f:
+            yield from self.iter_puppet_sections(f, cache, scene, armature,
+                bones)
+        
+        # save export cache
+        if cache is not None:
+            cache.save()
+    
+    
+    # write materials (generator, yields after each material)
+    def iter_materials(self, f, cache):
+        
+        for m in bpy.data.materials:
+            with self.profiler.stage('material', f, 1):
+                self.write_section(f, cache, 'material/' + m.name,
+                    self.fingerprint_material, self.write_material, m)
+            yield
+    
+    
+    # write puppet sections (generator, see iter_puppet()); crowd puppets skip
+    # the materials, and write mesh instances for mesh data already written
+    # (instances maps mesh data names to the section keys writing them)
+    def iter_puppet_sections(self, f, cache, scene, armature, bones,
+        instances=None):
+        
+        # write type
+        f.write('type : puppet\n')
+        
+        # write object name
+        f.write('name : ' + self.rename(armature.name) + '\n')
+        
+        # write number of materials (crowd puppets have no material sections,
+        # their faces index the shared materials of the crowd header)
+        n = len(bpy.data.materials)
+        f.write('materials : ' + str(n) + '\n')
+        if instances is not None:
+            f.write('material sections : crowd\n')
+        
+        # write number of meshes
+        n = sum(c.type == 'MESH' for c in armature.children)
+        f.write('meshes : ' + str(n) + '\n')
+        
+        # write number of deformation bones
+        n = sum(b.bone.use_deform for b in bones)
+        f.write('bones : ' + str(n) + '\n')
+        
+        # write blank
+        f.write('\n')
+        
+        # write materials
+        if instances is None:
+            yield from self.iter_materials(f, cache)
+        
+        # map material names to global material indices
+        table = {m.name : i for i, m in enumerate(bpy.data.materials)}
+        
+        # scope crowd cache keys (bone names repeat across armatures)
+        scope = 'puppet/' + self.rename(armature.name) + '/'
+        prefix = scope if instances is not None else ''
+        
+        # write meshes
+        instanced = set()
+        for c in armature.children:
+            
+            # check child is mesh
+            if c.type != 'MESH':
+                continue
+            
+            # write mesh instance
+            with self.profiler.stage('mesh', f, len(c.data.vertices)):
+                if instances is not None and c.data.name in instances:
+                    self.write_mesh_instance(f, c, instances[c.data.name])
+                    instanced.add(c.name)
+                
+                # write mesh
+                else:
+                    yield from self.iter_section(f, cache,
+                        prefix + 'mesh/' + c.name, self.fingerprint_mesh,
+                        self.iter_mesh, c, table)
+                    if instances is not None:
+                        instances[c.data.name] = (scope + 'mesh/' +
+                            self.rename(c.name))
+            yield
+        
+        # index mesh weights (once per mesh, shared by all bones)
+        entries = {}
+        weights = {}
+        for c in armature.children:
+            if c.type == 'MESH':
+                with self.profiler.stage('weights', None, len(c.data.vertices)):
+                    entries[c.name] = yield from self.iter_groups(c)
+                    weights[c.name] = self.get_weights(c, entries[c.name])
+                yield
+        
+        # write bones
+        for b in bones:
+            with self.profiler.stage('bone', f, 1):
+                self.write_section(f, cache, prefix + 'bone/' + b.name,
+                    self.fingerprint_bone, self.write_bone, b, armature,
+                    weights)
+            yield
+        
+        # write sparse skinning matrices (optional trailing sections)
+        if scene.duke.skin_enable:
+            deform = [b for b in bones if b.bone.use_deform]
+            for c in armature.children:
+                if c.type == 'MESH':
+                    with self.profiler.stage('skin', f, len(c.data.vertices)):
+                        skin = self.get_skin(c, deform, entries[c.name])
+                        self.write_section(f, cache, prefix + 'skin/' + c.name,
+                            self.fingerprint_skin, self.write_skin, c, skin)
+                    yield
+        
+        # write mesh topology (optional trailing sections, mesh instances share
+        # the topology of their mesh data)
+        if scene.duke.topology_enable:
+            for c in armature.children:
+                if c.type == 'MESH':
+                    with self.profiler.stage('topology', f,
+                        len(c.data.vertices)):
+                        if c.name not in instanced:
+                            topology = self.get_topology(c.data, table)
+                            self.write_section(f, cache,
+                                prefix + 'topology/' + c.name,
+                                self.fingerprint_topology, self.write_topology,
+                                c, topology)
+                    yield
+        
+        # write mesh levels of detail (optional trailing sections, mesh
+        # instances share the levels of their mesh data)
+        if scene.duke.lod_enable:
+            ratios = parse_ratios(scene.duke.lod_ratios)
+            for c in armature.children:
+                if c.type == 'MESH':
+                    with self.profiler.stage('lod', f, len(c.data.vertices)):
+                        if c.name not in instanced:
+                            lods = yield from self.iter_lods(c.data, table,
+                                ratios)
+                            self.write_section(f, cache,
+                                prefix + 'lod/' + c.name,
+                                self.fingerprint_lods, self.write_lods, c,
+                                lods)
+                    yield
+    
+    
+    # write crowd puppet (generator, see iter_crowd()); the crowd header and
+    # shared materials, then the puppet sections of each armature
+    def iter_crowd_puppet(self, scene, armatures):
         
         # get parameters
-        puppet_path = scene.duke['puppet_path']
+        puppet_path = scene.duke.puppet_path
+        
+        # load export cache
+        cache = None
+        if scene.duke.cache_enable:
+            cache = DukeCache(puppet_path + '.cache',
+                scene.duke.cache_size * 2 ** 20)
         
-        with open(puppet_path, 'w') as f:
+        with self.open_text(scene, puppet_path) as f:
             
             # write type
-            f.write('type : puppet\n')
+            f.write('type : crowd\n')
             
-            # write object name
-            f.write('name : ' + self.rename(armature.name) + '\n')
+            # write scene name
+            f.write('name : ' + self.rename(scene.name) + '\n')
             
             # write number of materials
             n = len(bpy.data.materials)
             f.write('materials : ' + str(n) + '\n')
             
-            # write number of meshes
-            n = sum(c.type == 'MESH' for c in armature.children)
-            f.write('meshes : ' + str(n) + '\n')
-            
-            # write number of deformation bones
-            n = sum(b.bone.use_deform for b in bones)
-            f.write('bones : ' + str(n) + '\n')
+            # write number of puppets
+            f.write('puppets : ' + str(len(armatures)) + '\n')
             
             # write blank
             f.write('\n')
             
-            # write materials
-            for m in bpy.data.materials:
-                self.write_material(f, m)
+            # write shared materials
+            yield from self.iter_materials(f, cache)
+            
+            # write puppets (mesh data written once)
+            instances = {}
+            for a in armatures:
+                yield from self.iter_puppet_sections(f, cache, scene, a,
+                    a.pose.bones, instances)
+        
+        # save export cache
+        if cache is not None:
+            cache.save()
+    
+    
+    # sweep frames start..end (updates scene only once per frame), calling
+    # each sampler with the frame index relative to the first frame
+    def sweep(self, scene, start, end, samplers):
+        run_steps(self.iter_sweep(scene, start, end, samplers))
+    
+    
+    # sweep frames (generator, yields after each frame)
+    def iter_sweep(self, scene, start, end, samplers):
+        
+        for k in range(end - start + 1):
+            
+            # set scene frame
+            with self.profiler.stage('frame_set', None, 1):
+                scene.frame_set(start + k)
+                scene.update()
+            
+            # sample frame
+            for sample in samplers:
+                sample(k)
+            yield
+    
+    
+    # allocate a [frames,tracks,3,4] pose array (spills to a temporary file for
+    # long frame ranges)
+    def allocate_poses(self, scene, shape):
+        
+        spill = scene.duke.spill_frames
+        if spill and shape[0] > spill:
+            return np.memmap(tempfile.TemporaryFile(), dtype=np.float64,
+                mode='w+', shape=shape)
+        
+        return np.empty(shape)
+    
+    
+    # bake animation into a [frames,tracks,3,4] pose array (efficiently updates
+    # scene only once per frame, also calling any other samplers); tracks are
+    # the armature (w.r.t. world), then meshes and deformation bones (w.r.t.
+    # puppet)
+    def bake_animation(self, scene, armature, bones, start=None, end=None,
+        samplers=()):
+        return run_steps(self.iter_bake_animation(scene, armature, bones, start,
+            end, samplers))
+    
+    
+    # bake animation (generator, yields after each frame, returns poses)
+    def iter_bake_animation(self, scene, armature, bones, start=None,
+        end=None, samplers=()):
+        
+        # default frame range
+        if start is None:
+            start = scene.frame_start
+        if end is None:
+            end = scene.frame_end
+        
+        # cache poses
+        poses, sample = self.bake_sampler(scene, armature, bones, start, end)
+        yield from self.iter_sweep(scene, start, end, [sample] + list(samplers))
+        
+        return poses
+    
+    
+    # get a [frames,tracks,3,4] pose array for frames start..end and its frame
+    # sampler (see iter_sweep())
+    def bake_sampler(self, scene, armature, bones, start, end):
+        
+        # get tracks
+        meshes = [c for c in armature.children if c.type == 'MESH']
+        deform = [b for b in bones if b.bone.use_deform]
+        
+        # allocate poses
+        nframes = end - start + 1
+        poses = self.allocate_poses(scene,
+            (nframes, 1 + len(meshes) + len(deform), 3, 4))
+        
+        # sample poses (indexed relative to the first frame)
+        def sample(k):
+            
+            # get armature pose
+            poses[k, 0] = self.get_pose(armature.matrix_world)
+            
+            # get mesh poses
+            for j, c in enumerate(meshes, 1):
+                poses[k, j] = self.get_pose(c.matrix_local)
+            
+            # get bone poses
+            for j, b in enumerate(deform, 1 + len(meshes)):
+                poses[k, j] = self.get_pose(b.matrix)
+        
+        return poses, sample
+    
+    
+    # get the reason the fast bake can not reproduce scene evaluation (None if
+    # it can)
+    def fast_bake_blocker(self, scene, armature, bones):
+        
+        # other objects
+        if armature.parent is not None or armature.constraints:
+            return 'armature parent or constraints'
+        for c in armature.children:
+            if c.type == 'MESH' and (c.animation_data or c.constraints):
+                return 'mesh animation or constraints'
+            if c.type == 'MESH' and c.parent_type not in ('OBJECT',
+                'ARMATURE'):
+                return 'mesh bone parent'
+        if armature.data.animation_data:
+            return 'armature data animation'
+        
+        # armature animation (one replacing action, bone channels only)
+        data = armature.animation_data
+        if data:
+            if data.drivers:
+                return 'drivers'
+            if len(data.nla_tracks):
+                return 'nla tracks'
+            if data.action_blend_type != 'REPLACE' or getattr(data,
+                'action_influence', 1.0) != 1.0:
+                return 'action blending'
+            if data.action:
+                for fc in data.action.fcurves:
+                    if not fc.data_path.startswith('pose.bones['):
+                        return 'object animation'
+        
+        # bones (default inheritance only)
+        for b in bones:
+            if b.constraints:
+                return 'bone constraints'
+            if b.rotation_mode not in ('QUATERNION', 'AXIS_ANGLE', 'XYZ',
+                'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX'):
+                return 'bone rotation mode'
+            if not (b.bone.use_inherit_rotation and b.bone.use_inherit_scale
+                and b.bone.use_local_location):
+                return 'bone inheritance'
+        
+        return None
+    
+    
+    # bake animation from the armature action f-curves, without scene updates
+    # (see fast_bake_blocker()); bone poses compose rest poses and channel
+    # transforms down the hierarchy for all frames at once
+    def fast_bake(self, scene, armature, bones):
+        return run_steps(self.iter_fast_bake(scene, armature, bones))
+    
+    
+    # fast bake (generator, yields after evaluating the channels of each bone,
+    # returns poses)
+    def iter_fast_bake(self, scene, armature, bones):
+        
+        # get tracks
+        meshes = [c for c in armature.children if c.type == 'MESH']
+        deform = [b for b in bones if b.bone.use_deform]
+        
+        # evaluate action f-curves (by data path and array index)
+        frames = range(scene.frame_start, scene.frame_end + 1)
+        nframes = len(frames)
+        curves = {}
+        data = armature.animation_data
+        if data and data.action:
+            for fc in data.action.fcurves:
+                if not fc.mute:
+                    curves[fc.data_path, fc.array_index] = fc
+        
+        # get [n,k] channel values (f-curve or current value)
+        def channel(b, prop):
+            path = b.path_from_id(prop)
+            values = np.tile(np.array(getattr(b, prop)[:], dtype=np.float64),
+                (nframes, 1))
+            for i in range(values.shape[1]):
+                if (path, i) in curves:
+                    fc = curves[path, i]
+                    values[:, i] = [fc.evaluate(k) for k in frames]
+            return values
+        
+        # get local pose transforms (rest offset from parent, then channels)
+        rest = {}
+        local = {}
+        for b in bones:
+            rest[b.name] = self.get_pose(b.bone.matrix_local)
+            rotation = {
+                'QUATERNION' : 'rotation_quaternion',
+                'AXIS_ANGLE' : 'rotation_axis_angle'
+                }.get(b.rotation_mode, 'rotation_euler')
+            s = channel(b, 'scale')
+            A = np.empty((nframes, 3, 4))
+            A[:, :, :3] = rotation_matrices(channel(b, rotation),
+                b.rotation_mode) * s[:, None, :]
+            A[:, :, 3] = channel(b, 'location')
+            local[b.name] = A
+            yield
+        
+        # compose poses down the hierarchy (w.r.t. armature)
+        pose = {}
+        def compose(b):
+            if b.name not in pose:
+                if b.parent is None:
+                    pose[b.name] = multiply_poses(rest[b.name], local[b.name])
+                else:
+                    offset = multiply_poses(invert_poses(rest[b.parent.name]),
+                        rest[b.name])
+                    pose[b.name] = multiply_poses(compose(b.parent),
+                        multiply_poses(offset, local[b.name]))
+            return pose[b.name]
+        
+        # assemble tracks (armature and mesh poses are not animated)
+        poses = self.allocate_poses(scene,
+            (nframes, 1 + len(meshes) + len(deform), 3, 4))
+        poses[:, 0] = self.get_pose(armature.matrix_world)
+        for j, c in enumerate(meshes, 1):
+            poses[:, j] = self.get_pose(c.matrix_local)
+        for j, b in enumerate(deform, 1 + len(meshes)):
+            poses[:, j] = compose(b)
+        
+        return poses
+    
+    
+    # bake animation in parallel background blender processes
+    def bake_parallel(self, scene, armature, bones):
+        return run_steps(self.iter_bake_parallel(scene, [armature]))[0]
+    
+    
+    # bake armatures in parallel (generator, yields WAITING while workers run,
+    # see iter_bake_chunks(), and returns the poses of each armature); the file
+    # is saved once, and each worker bakes all armatures on one frame sweep
+    def iter_bake_parallel(self, scene, armatures):
+        
+        # get worker command
+        command = scene.duke.bake_command or BAKE_COMMAND
+        
+        # workers load a copy of the current (possibly unsaved) file
+        directory = tempfile.mkdtemp(prefix='duke_bake_')
+        try:
+            
+            # save copy
+            blend = os.path.join(directory, 'bake.blend')
+            bpy.ops.wm.save_as_mainfile(filepath=blend, copy=True)
+            
+            # bake chunks
+            poses = yield from iter_bake_chunks(command, blend, scene.name,
+                [a.name for a in armatures], scene.frame_start,
+                scene.frame_end, scene.duke.bake_workers, directory,
+                binary=bpy.app.binary_path, script=os.path.abspath(__file__))
+            
+        finally:
+            
+            # clean up
+            shutil.rmtree(directory, ignore_errors=True)
+        
+        # split tracks by armature
+        ntracks = [1 + sum(c.type == 'MESH' for c in a.children)
+            + sum(b.bone.use_deform for b in a.pose.bones) for a in armatures]
+        bounds = np.cumsum([0] + ntracks)
+        return [poses[:, a : b] for a, b in zip(bounds[: -1], bounds[1 :])]
+    
+    
+    # bake armatures on one frame sweep into a [frames,tracks,3,4] pose array,
+    # with the tracks of each armature in order (see bake_chunks())
+    def bake_armatures(self, scene, armatures, start, end):
+        
+        baked = []
+        samplers = []
+        for a in armatures:
+            poses, sample = self.bake_sampler(scene, a, a.pose.bones, start,
+                end)
+            baked.append(poses)
+            samplers.append(sample)
+        self.sweep(scene, start, end, samplers)
+        
+        return np.concatenate(baked, axis=1)
+    
+    
+    # use fast bake (enabled, possible, and no other samplers needing scene
+    # updates)
+    def use_fast_bake(self, scene, armature, bones, samplers=()):
+        return (scene.duke.fast_bake and not samplers
+            and self.fast_bake_blocker(scene, armature, bones) is None)
+    
+    
+    # bake animation (serial, fast, or parallel), calling any other samplers on
+    # the same frame sweep (or a separate one for parallel bakes); generator,
+    # yields after each frame and returns poses
+    def iter_bake(self, scene, armature, bones, samplers=()):
+        
+        nframes = scene.frame_end - scene.frame_start + 1
+        with self.profiler.stage('bake', None, nframes):
+            if scene.duke.bake_workers > 1:
+                poses = (yield from self.iter_bake_parallel(scene,
+                    [armature]))[0]
+                if samplers:
+                    yield from self.iter_sweep(scene, scene.frame_start,
+                        scene.frame_end, samplers)
+                else:
+                    yield
+                return poses
+            elif self.use_fast_bake(scene, armature, bones, samplers):
+                poses = yield from self.iter_fast_bake(scene, armature, bones)
+                yield
+                return poses
+            else:
+                return (yield from self.iter_bake_animation(scene, armature,
+                    bones, samplers=samplers))
+    
+    
+    # write track ([frames,3,4] poses, one matrix per line), or key frames
+    # ('keys : k', then one frame index and matrix per line) if a tolerance
+    # is given
+    def write_track(self, f, poses, tolerance=None):
+        
+        with self.profiler.stage('track', f, len(poses)):
             
-            # write meshes
-            for c in armature.children:
+            # dense track
+            if tolerance is None:
                 
-                # check child is mesh
-                if c.type != 'MESH':
-                    continue
+                # order values as in write_matrix (column-major)
+                rows = poses.transpose(0, 2, 1).reshape(len(poses), 12)
+                self.write_rows(f, rows, ' '.join([self.fmt] * 12) + '\n')
                 
-                # write mesh
-                self.write_mesh(f, c)
+                return
             
-            # write bones
-            for b in bones:
-                self.write_bone(f, b, armature)
+            # compress track
+            keys = compress_track(poses, tolerance)
+            f.write('keys : ' + str(len(keys)) + '\n')
+            
+            # write key frame indices and poses
+            rows = poses[keys].transpose(0, 2, 1).reshape(len(keys), 12)
+            rows = np.column_stack((keys, rows))
+            self.write_rows(f, rows, '%d ' + ' '.join([self.fmt] * 12) + '\n')
     
     
     # write animation
-    def write_animation(self, scene, armature, bones):
+    def write_animation(self, scene, armature, bones, samplers=()):
+        run_steps(self.iter_animation(scene, armature, bones, samplers))
+    
+    
+    # write animation (generator, yields after each frame and track); crowd
+    # animations and frame windows give their path and baked poses (see
+    # iter_crowd(), iter_windows()), and track byte offsets are appended to
+    # offsets, if given
+    def iter_animation(self, scene, armature, bones, samplers=(), path=None,
+        poses=None, offsets=None):
         
         # get parameters
-        animation_path = scene.duke['animation_path']
+        animation_path = path or scene.duke.animation_path
         
-        with open(animation_path, 'w') as f:
+        with self.open_text(scene, animation_path) as f:
             
             # write type
             f.write('type : animation\n')
@@ -506,12 +2868,25 @@ class DukeExportButton(bpy.types.Operator):
             f.write('bones : ' + str(nbones) + '\n')
             
             # write number of frames
-            nframes = scene.frame_end - scene.frame_start + 1
+            if poses is None:
+                nframes = scene.frame_end - scene.frame_start + 1
+            else:
+                nframes = len(poses)
             f.write('frames : ' + str(nframes) + '\n')
             
+            # write track encoding (key frames only, dense is implied)
+            tolerance = None
+            if scene.duke.keys_enable:
+                tolerance = scene.duke.keys_tolerance
+                f.write('encoding : keys\n')
+            
             # write blank
             f.write('\n')
             
+            # record track offset
+            if offsets is not None:
+                offsets.append(f.tell())
+            
             # write puppet pose type
             f.write('type : puppet\n')
             
@@ -519,56 +2894,28 @@ class DukeExportButton(bpy.types.Operator):
             f.write('name : ' + self.rename(armature.name) + '\n')
             
             # cache animation data (efficiently updates scene only once)
-            armature_pose = [None] * nframes
-            meshes_pose = [None] * nframes
-            bones_pose = [None] * nframes
-            for i in range(scene.frame_start, scene.frame_end + 1):
-            
-                # set scene frame
-                scene.frame_set(i)
-                scene.update()
-                
-                # get pose
-                armature_pose[i] = armature.matrix_world.copy()
-                
-                # get mesh pose (w.r.t. puppet)
-                meshes_pose[i] = [None] * nmeshes
-                j = 0
-                for c in armature.children:
-                    
-                    # check for meshes
-                    if c.type == 'MESH':
-                        
-                        # get pose
-                        meshes_pose[i][j] = c.matrix_local.copy()
-                        j += 1
-                
-                # get bone pose (w.r.t. puppet)
-                bones_pose[i] = [None] * nbones
-                j = 0
-                for b in bones:
-                    
-                    # check for deformation bones
-                    if b.bone.use_deform:
-                        
-                        # get pose
-                        bones_pose[i][j] = b.matrix.copy()
-                        j += 1
+            if poses is None:
+                poses = yield from self.iter_bake(scene, armature, bones,
+                    samplers)
             
             # write armature pose (w.r.t. world)
-            for i in range(scene.frame_start, scene.frame_end + 1):
-                self.write_matrix(f, armature_pose[i])
+            self.write_track(f, poses[:, 0], tolerance)
+            yield
             
             # write blank
             f.write('\n')
             
             # write mesh pose (w.r.t. puppet)
-            j = 0
+            j = 1
             for c in armature.children:
                 
                 # check for meshes
                 if c.type == 'MESH':
                     
+                    # record track offset
+                    if offsets is not None:
+                        offsets.append(f.tell())
+                    
                     # write mesh type
                     f.write('type : mesh\n')
                     
@@ -576,10 +2923,8 @@ class DukeExportButton(bpy.types.Operator):
                     f.write('name : ' + self.rename(c.name) + '\n')
                     
                     # write mesh track
-                    for i in range(scene.frame_start, scene.frame_end + 1):
-                        
-                        # write pose
-                        self.write_matrix(f, meshes_pose[i][j])
+                    self.write_track(f, poses[:, j], tolerance)
+                    yield
                     
                     # increment
                     j += 1
@@ -588,12 +2933,15 @@ class DukeExportButton(bpy.types.Operator):
                     f.write('\n')
             
             # write bone pose animation
-            j = 0
             for b in bones:
                 
                 # check for deformation bones
                 if b.bone.use_deform:
-                
+                    
+                    # record track offset
+                    if offsets is not None:
+                        offsets.append(f.tell())
+                    
                     # write type
                     f.write('type : bone\n')
                     
@@ -601,10 +2949,8 @@ class DukeExportButton(bpy.types.Operator):
                     f.write('name : ' + self.rename(b.name) + '\n')
                     
                     # write bone track
-                    for i in range(scene.frame_start, scene.frame_end + 1):
-                        
-                        # write pose
-                        self.write_matrix(f, bones_pose[i][j])
+                    self.write_track(f, poses[:, j], tolerance)
+                    yield
                     
                     # increment
                     j += 1
@@ -613,31 +2959,870 @@ class DukeExportButton(bpy.types.Operator):
                     f.write('\n')
     
     
-    # button action
-    def execute(self, context):
+    # write animation in frame windows (generator, see iter_animation())
+    #
+    # Each window is a complete animation file (text or duke binary) of
+    # window_frames frames (the last window may be shorter), named by window
+    # index, and a json manifest next to the animation path locates them:
+    #   {'type' : 'windows', 'name', 'puppet', 'format', 'encoding', 'start',
+    #    'frames', 'window', 'tracks' : [NAME], 'windows' : [{'path', 'first',
+    #    'frames', 'offsets'}]}
+    # where tracks are puppet/NAME, mesh/NAME, and bone/NAME, first is the
+    # 0-based index of the first window frame, offsets are the offsets of the
+    # tracks in the (uncompressed) window file (bytes, seeked to by
+    # duke_reader.read_window()), and window paths are relative to the
+    # manifest.
+    def iter_windows(self, scene, armature, bones, samplers=(), path=None,
+        poses=None):
+        
+        # get parameters
+        animation_path = path or scene.duke.animation_path
+        binary = scene.duke.file_format == 'BINARY'
+        size = scene.duke.window_frames
+        
+        # cache animation data
+        if poses is None:
+            poses = yield from self.iter_bake(scene, armature, bones, samplers)
+        
+        # write windows
+        windows = []
+        for k, first in enumerate(range(0, len(poses), size)):
+            path = window_path(animation_path, k)
+            window = poses[first : first + size]
+            offsets = []
+            if binary:
+                yield from self.iter_animation_binary(scene, armature, bones,
+                    path=path, poses=window, offsets=offsets)
+            else:
+                yield from self.iter_animation(scene, armature, bones,
+                    path=path, poses=window, offsets=offsets)
+            windows.append({
+                'path'    : os.path.basename(output_path(path,
+                    scene.duke.compression)),
+                'first'   : first,
+                'frames'  : len(window),
+                'offsets' : offsets
+                })
+        
+        # get track names
+        tracks = ['puppet/' + self.rename(armature.name)]
+        tracks += ['mesh/' + self.rename(c.name) for c in armature.children
+            if c.type == 'MESH']
+        tracks += ['bone/' + self.rename(b.name) for b in bones
+            if b.bone.use_deform]
+        
+        # write manifest
+        manifest = {
+            'type'     : 'windows',
+            'name'     : self.rename(scene.name),
+            'puppet'   : self.rename(armature.name),
+            'format'   : 'binary' if binary else 'text',
+            'encoding' : 'keys' if scene.duke.keys_enable else 'dense',
+            'start'    : scene.frame_start,
+            'frames'   : len(poses),
+            'window'   : size,
+            'tracks'   : tracks,
+            'windows'  : windows
+            }
+        with open(window_manifest(animation_path), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    
+    
+    # write puppet (duke binary)
+    def write_puppet_binary(self, scene, armature, bones):
+        run_steps(self.iter_puppet_binary(scene, armature, bones))
+    
+    
+    # write puppet (duke binary; generator, yields after each section)
+    def iter_puppet_binary(self, scene, armature, bones):
+        
+        # get parameters
+        puppet_path = scene.duke.puppet_path
+        
+        with self.open_file(scene, puppet_path, 'wb') as f:
+            
+            # start file
+            out = DukeBinaryWriter(f, 'puppet')
+            
+            # get materials
+            materials = yield from self.iter_materials_meta()
+            
+            # write meshes and bones
+            meshes_meta, bones_meta = yield from self.iter_puppet_arrays(f, out,
+                scene, armature, bones)
+            
+            # finish file
+            out.close({
+                'name'      : self.rename(armature.name),
+                'materials' : materials,
+                'meshes'    : meshes_meta,
+                'bones'     : bones_meta
+                })
+    
+    
+    # get materials (custom properties are kept in the section table);
+    # generator, yields after each material and returns the materials
+    def iter_materials_meta(self):
+        
+        materials = []
+        for m in bpy.data.materials:
+            
+            # get custom properties (numbers where possible)
+            properties = {}
+            for name, value in self.get_properties(m):
+                try:
+                    properties[name] = float(value)
+                except (TypeError, ValueError):
+                    properties[name] = str(value)
+            
+            materials.append({
+                'name'       : self.rename(m.name),
+                'properties' : properties
+                })
+            yield
+        
+        return materials
+    
+    
+    # write puppet mesh and bone arrays (duke binary, section names prefixed);
+    # crowd puppets write mesh instances for mesh data already written
+    # (instances maps mesh data names to the section keys writing them);
+    # generator, yields after each section and returns the mesh and bone table
+    # entries
+    def iter_puppet_arrays(self, f, out, scene, armature, bones, prefix='',
+        instances=None):
+        
+        # get meshes and deformation bones
+        meshes = [c for c in armature.children if c.type == 'MESH']
+        bones = [b for b in bones if b.bone.use_deform]
+        
+        # map material names to global material indices
+        table = {m.name : i for i, m in enumerate(bpy.data.materials)}
+        
+        # write meshes
+        meshes_meta = []
+        for i, c in enumerate(meshes):
+            
+            with self.profiler.stage('mesh', f, len(c.data.vertices)):
+                
+                # write pose (puppet coordinates)
+                key = prefix + 'mesh/' + str(i)
+                out.write(key + '/pose', self.get_pose(c.matrix_local), '<f8')
+                
+                # get shapes
+                shapes = self.get_shapes(c)
+                meshes_meta.append({
+                    'name'    : self.rename(c.name),
+                    'visible' : not c.hide,
+                    'shapes'  : [self.rename(name) for name, _ in shapes]
+                    })
+                
+                # mesh instance (shapes and faces of another mesh)
+                if instances is not None and c.data.name in instances:
+                    meshes_meta[-1]['instance'] = instances[c.data.name]
+                    yield
+                    continue
+                if instances is not None:
+                    instances[c.data.name] = key
+                
+                # write shapes
+                n = len(c.data.vertices)
+                buffer = np.empty(3 * n, dtype=np.float32)
+                for j, (name, vertices) in enumerate(shapes):
+                    co = self.get_coordinates(vertices, buffer)
+                    yield from out.iter_write(key + '/shape/' + str(j), co,
+                        '<f4')
+                    yield
+                
+                # write faces
+                faces, indices = self.get_faces(c.data, table)
+                out.write(key + '/faces', faces, '<i4')
+                out.write(key + '/materials', indices, '<i4')
+            yield
+        
+        # index mesh weights (once per mesh, shared by all bones)
+        entries = []
+        weights = []
+        for c in meshes:
+            with self.profiler.stage('weights', None, len(c.data.vertices)):
+                entries.append((yield from self.iter_groups(c)))
+                weights.append(self.get_weights(c, entries[-1]))
+            yield
+        
+        # write bones
+        bones_meta = []
+        for i, b in enumerate(bones):
+            
+            with self.profiler.stage('bone', f, 1):
+                
+                # write bone rest pose (object coordinates)
+                key = prefix + 'bone/' + str(i)
+                out.write(key + '/pose', self.get_pose(b.bone.matrix_local),
+                    '<f8')
+                
+                # write weight groups
+                for j, c in enumerate(meshes):
+                    
+                    # look up bone weight group in mesh inverted index
+                    offsets, indices, values = weights[j]
+                    try:
+                        k = c.vertex_groups[b.name].index
+                        s = slice(offsets[k], offsets[k + 1])
+                    except KeyError:
+                        s = slice(0, 0)
+                    
+                    # write indices and weights
+                    group = key + '/weights/' + str(j)
+                    out.write(group + '/indices', indices[s], '<i4')
+                    out.write(group + '/weights', values[s], '<f4')
+                
+                parent, children = self.get_kinship(b, armature)
+                bones_meta.append({
+                    'name'     : self.rename(b.name),
+                    'parent'   : parent,
+                    'children' : children
+                    })
+            yield
+        
+        # write sparse skinning matrices (optional)
+        if scene.duke.skin_enable:
+            for i, c in enumerate(meshes):
+                with self.profiler.stage('skin', f, len(c.data.vertices)):
+                    skin = self.get_skin(c, bones, entries[i])
+                    key = prefix + 'mesh/' + str(i) + '/skin'
+                    out.write(key + '/pointers', skin[0], '<i8')
+                    out.write(key + '/bones', skin[1], '<i4')
+                    out.write(key + '/weights', skin[2], '<f4')
+                    meshes_meta[i]['skin'] = True
+                yield
+        
+        # write mesh topology (optional, mesh instances share the topology of
+        # their mesh data)
+        if scene.duke.topology_enable:
+            for i, c in enumerate(meshes):
+                with self.profiler.stage('topology', f, len(c.data.vertices)):
+                    if 'instance' not in meshes_meta[i]:
+                        topology = self.get_topology(c.data, table)
+                        key = prefix + 'mesh/' + str(i)
+                        out.write(key + '/edges', topology[0], '<i4')
+                        out.write(key + '/adjacency/pointers', topology[1],
+                            '<i8')
+                        out.write(key + '/adjacency/faces', topology[2], '<i4')
+                        out.write(key + '/normals/vertices', topology[3], '<f4')
+                        out.write(key + '/normals/faces', topology[4], '<f4')
+                        meshes_meta[i]['topology'] = True
+                yield
+        
+        # write mesh levels of detail (optional, mesh instances share the
+        # levels of their mesh data)
+        if scene.duke.lod_enable:
+            ratios = parse_ratios(scene.duke.lod_ratios)
+            for i, c in enumerate(meshes):
+                with self.profiler.stage('lod', f, len(c.data.vertices)):
+                    if 'instance' not in meshes_meta[i]:
+                        lods = yield from self.iter_lods(c.data, table,
+                            ratios)
+                        for k, lod in enumerate(lods):
+                            key = prefix + 'mesh/' + str(i) + '/lod/' + str(k)
+                            out.write(key + '/vertices', lod[1], '<i4')
+                            out.write(key + '/map', lod[2], '<i4')
+                            out.write(key + '/faces', lod[3], '<i4')
+                            out.write(key + '/materials', lod[4], '<i4')
+                    meshes_meta[i]['lods'] = ratios
+                yield
+        
+        return meshes_meta, bones_meta
+    
+    
+    # write crowd puppet (duke binary; generator, see iter_crowd()); puppet p
+    # sections are prefixed 'puppet/p/'
+    def iter_crowd_puppet_binary(self, scene, armatures):
+        
+        # get parameters
+        puppet_path = scene.duke.puppet_path
+        
+        with self.open_file(scene, puppet_path, 'wb') as f:
+            
+            # start file
+            out = DukeBinaryWriter(f, 'crowd')
+            
+            # get shared materials
+            materials = yield from self.iter_materials_meta()
+            
+            # write puppets (mesh data written once)
+            puppets = []
+            instances = {}
+            for i, a in enumerate(armatures):
+                meshes_meta, bones_meta = yield from self.iter_puppet_arrays(f,
+                    out, scene, a, a.pose.bones, 'puppet/' + str(i) + '/',
+                    instances)
+                puppets.append({
+                    'name'   : self.rename(a.name),
+                    'meshes' : meshes_meta,
+                    'bones'  : bones_meta
+                    })
+            
+            # finish file
+            out.close({
+                'name'      : self.rename(scene.name),
+                'materials' : materials,
+                'puppets'   : puppets
+                })
+    
+    
+    # write animation (duke binary)
+    def write_animation_binary(self, scene, armature, bones, samplers=()):
+        run_steps(self.iter_animation_binary(scene, armature, bones, samplers))
+    
+    
+    # write animation (duke binary; generator, yields after each frame and
+    # track); see iter_animation() for path, poses, and offsets
+    def iter_animation_binary(self, scene, armature, bones, samplers=(),
+        path=None, poses=None, offsets=None):
+        
+        # get parameters
+        animation_path = path or scene.duke.animation_path
+        
+        # get meshes and deformation bones
+        meshes = [c for c in armature.children if c.type == 'MESH']
+        deform = [b for b in bones if b.bone.use_deform]
+        
+        # cache animation data
+        if poses is None:
+            poses = yield from self.iter_bake(scene, armature, bones, samplers)
+        
+        # get track names and encoding
+        keys = scene.duke.keys_enable
+        names = ['puppet']
+        names += ['mesh/' + str(j) for j in range(len(meshes))]
+        names += ['bone/' + str(j) for j in range(len(deform))]
+        
+        with self.open_file(scene, animation_path, 'wb') as f:
+            
+            # start file
+            out = DukeBinaryWriter(f, 'animation')
+            
+            # write tracks (puppet w.r.t. world, meshes and bones w.r.t. puppet)
+            for j, name in enumerate(names):
+                
+                with self.profiler.stage('track', f, len(poses)):
+                    
+                    # dense track
+                    if not keys:
+                        out.write(name + '/pose', poses[:, j], '<f8')
+                    
+                    # key frame track
+                    else:
+                        frames = compress_track(poses[:, j],
+                            scene.duke.keys_tolerance)
+                        out.write(name + '/keys', frames, '<i4')
+                        out.write(name + '/pose', poses[frames, j], '<f8')
+                
+                # record track offset (its first section)
+                if offsets is not None:
+                    first = out.sections[-2 if keys else -1]
+                    offsets.append(first['offset'])
+                yield
+            
+            # finish file
+            out.close({
+                'name'     : self.rename(scene.name),
+                'puppet'   : self.rename(armature.name),
+                'frames'   : len(poses),
+                'encoding' : 'keys' if keys else 'dense',
+                'meshes'   : [self.rename(c.name) for c in meshes],
+                'bones'    : [self.rename(b.name) for b in deform]
+                })
+    
+    
+    # export armature (no ui context needed)
+    def export(self, scene, armature):
+        return run_steps(self.iter_export(scene, armature))
+    
+    
+    # export armature (generator, yields after each section, frame, and track;
+    # returns the profiler)
+    def iter_export(self, scene, armature):
         
         # notation
-        scene = context.scene
-        armature = context.object
         bones = armature.pose.bones
         
+        # get text float format
+        self.fmt = FLOAT_FORMATS[scene.duke.float_format]
+        
+        # get face triangulation
+        self.triangulate = scene.duke.triangulate
+        
+        # start profiler (null profiler when disabled)
+        if scene.duke.profile_enable:
+            self.profiler = DukeProfiler(scene.duke.profile_cprofile)
+        else:
+            self.profiler = DukeNullProfiler()
+        
+        # start text section formatting pool (None when serial)
+        self.pool = format_pool(scene.duke.format_workers)
+        self.depth = 2 * scene.duke.format_workers
+        
+        # run export steps, pausing the profiler while the ui runs between
+        # them (not while waiting on workers, which is export time)
+        self.profiler.start()
+        steps = self.iter_write(scene, armature, bones)
+        try:
+            for step in steps:
+                if step is WAITING:
+                    yield step
+                else:
+                    self.profiler.pause()
+                    yield step
+                    self.profiler.resume()
+        finally:
+            steps.close()
+            self.profiler.stop()
+            
+            # stop text section formatting pool
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+        
+        # write profiling report
+        if scene.duke.profile_enable:
+            self.profiler.save(scene.duke.profile_path)
+        
+        return self.profiler
+    
+    
+    # count export steps (see iter_export())
+    def count_steps(self, scene, armature):
+        
+        # notation
+        armatures = self.get_armatures(scene, armature)
+        binary = scene.duke.file_format == 'BINARY'
+        nframes = scene.frame_end - scene.frame_start + 1
+        
+        # puppets (materials, mesh shapes and sections, weights, bones,
+        # skinning matrices, topology, and levels of detail, with shapes and
+        # weights in steps of CHUNK vertices, and decimation in steps of grid
+        # probes); crowd mesh instances are a single step, as are unchanged
+        # cached meshes (so this is an upper bound when the export cache is
+        # enabled)
+        n = 0
+        if scene.duke.puppet_enable:
+            n += len(bpy.data.materials)
+            if scene.duke.lod_enable:
+                ratios = parse_ratios(scene.duke.lod_ratios)
+            written = set()
+            for a in armatures:
+                meshes = [c for c in a.children if c.type == 'MESH']
+                nmeshes = len(meshes)
+                for c in meshes:
+                    nchunks = count_chunks(len(c.data.vertices))
+                    n += nchunks
+                    if not (scene.duke.crowd_enable
+                        and c.data.name in written):
+                        n += len(self.get_shapes(c)) * nchunks
+                        if scene.duke.lod_enable:
+                            n += sum(count_decimate(len(c.data.polygons), r)
+                                for r in ratios)
+                        written.add(c.data.name)
+                if binary:
+                    n += nmeshes + sum(b.bone.use_deform
+                        for b in a.pose.bones)
+                else:
+                    n += nmeshes + len(a.pose.bones)
+                if scene.duke.skin_enable:
+                    n += nmeshes
+                if scene.duke.topology_enable:
+                    n += nmeshes
+                if scene.duke.lod_enable:
+                    n += nmeshes
+        
+        # frames (a single step for parallel bakes, whose waits are not
+        # counted, except single bakes with point caches, which only sweep
+        # them; one per bone and one more for fast bakes)
+        parallel = scene.duke.animation_enable and scene.duke.bake_workers > 1
+        if parallel and (scene.duke.crowd_enable
+            or not scene.duke.points_enable):
+            n += 1
+        if scene.duke.points_enable:
+            n += nframes
+        elif scene.duke.animation_enable and not parallel:
+            fast = [self.use_fast_bake(scene, a, a.pose.bones)
+                for a in armatures]
+            n += sum(len(a.pose.bones) + 1 for a, use_fast in
+                zip(armatures, fast) if use_fast)
+            n += 0 if all(fast) else nframes
+        
+        # tracks (per frame window)
+        if scene.duke.animation_enable:
+            nwindows = 1
+            if scene.duke.window_frames:
+                nwindows = -(-nframes // scene.duke.window_frames)
+            for a in armatures:
+                n += nwindows * (1 + sum(c.type == 'MESH' for c in a.children)
+                    + sum(b.bone.use_deform for b in a.pose.bones))
+        
+        return n
+    
+    
+    # get export output paths
+    def output_paths(self, scene, armature):
+        
+        # notation
+        armatures = self.get_armatures(scene, armature)
+        compression = scene.duke.compression
+        
+        # puppet file
+        paths = []
+        if scene.duke.puppet_enable:
+            paths.append(output_path(scene.duke.puppet_path, compression))
+        
+        # animation files (one animation per crowd armature; frame windows
+        # and their manifest, if windowed)
+        if scene.duke.animation_enable:
+            animation_paths = [scene.duke.animation_path]
+            if scene.duke.crowd_enable:
+                animation_paths = [member_path(scene.duke.animation_path,
+                    self.rename(a.name)) for a in armatures]
+            size = scene.duke.window_frames
+            nframes = scene.frame_end - scene.frame_start + 1
+            for path in animation_paths:
+                if size:
+                    paths.extend(output_path(window_path(path, k),
+                        compression) for k in range(-(-nframes // size)))
+                    paths.append(window_manifest(path))
+                else:
+                    paths.append(output_path(path, compression))
+        
+        # point caches and profiling report
+        if scene.duke.points_enable:
+            base = os.path.splitext(scene.duke.points_path)[0]
+            paths.append(scene.duke.points_path)
+            paths.extend(base + '_' + self.rename(c.name) + '.npy'
+                for a in armatures for c in a.children if c.type == 'MESH')
+        if scene.duke.profile_enable:
+            paths.append(scene.duke.profile_path)
+        
+        return paths
+    
+    
+    # get crowd armatures (the active armature, then other selected armatures;
+    # just the active armature unless crowd export is enabled)
+    def get_armatures(self, scene, armature):
+        
+        armatures = [armature]
+        if scene.duke.crowd_enable:
+            armatures += [o for o in scene.objects if o.type == 'ARMATURE'
+                and o.select and o is not armature]
+        
+        return armatures
+    
+    
+    # write puppet and animation (generator, see iter_export())
+    def iter_write(self, scene, armature, bones):
+        
+        # write crowd
+        if scene.duke.crowd_enable:
+            yield from self.iter_crowd(scene, self.get_armatures(scene,
+                armature))
+            return
+        
+        # choose file format
+        binary = scene.duke.file_format == 'BINARY'
+        
         # write puppet (meshes, shape keys, bones, weights)
-        if scene.duke['puppet_enable']:
-            self.write_puppet(scene, armature, bones)
+        if scene.duke.puppet_enable:
+            if binary:
+                yield from self.iter_puppet_binary(scene, armature, bones)
+            else:
+                yield from self.iter_puppet(scene, armature, bones)
         
-        # write animation (animated pose data for armature, bones, meshes)
-        if scene.duke['animation_enable']:
+        # write animation (animated pose data for armature, bones, meshes) and
+        # point caches (evaluated mesh vertices), on a single frame sweep
+        if scene.duke.animation_enable or scene.duke.points_enable:
             
             # stash current frame
             frame = scene.frame_current
+            try:
+                
+                # start point caches
+                samplers = []
+                if scene.duke.points_enable:
+                    meshes = [c for c in armature.children if c.type == 'MESH']
+                    points = DukePointCache(scene.duke.points_path, scene,
+                        meshes, [self.rename(c.name) for c in meshes], {
+                            'name'   : self.rename(scene.name),
+                            'puppet' : self.rename(armature.name)
+                            })
+                    samplers.append(points.sample)
+                
+                # write animation
+                if not scene.duke.animation_enable:
+                    yield from self.iter_sweep(scene, scene.frame_start,
+                        scene.frame_end, samplers)
+                elif scene.duke.window_frames:
+                    yield from self.iter_windows(scene, armature, bones,
+                        samplers)
+                elif binary:
+                    yield from self.iter_animation_binary(scene, armature,
+                        bones, samplers)
+                else:
+                    yield from self.iter_animation(scene, armature, bones,
+                        samplers)
+                
+                # finish point caches
+                if scene.duke.points_enable:
+                    points.close()
+                
+            finally:
+                
+                # recall current frame (also when cancelled)
+                scene.frame_current = frame
+                scene.update()
+    
+    
+    # write crowd (generator, see iter_export()); one puppet file with shared
+    # materials and each mesh data written once (later meshes using it are
+    # instances), and one animation file per armature, with all armatures baked
+    # on a single frame sweep (or fast baked, where possible, or all baked
+    # together by parallel workers when there are bake workers)
+    def iter_crowd(self, scene, armatures):
+        
+        # choose file format
+        binary = scene.duke.file_format == 'BINARY'
+        
+        # write crowd puppet
+        if scene.duke.puppet_enable:
+            if binary:
+                yield from self.iter_crowd_puppet_binary(scene, armatures)
+            else:
+                yield from self.iter_crowd_puppet(scene, armatures)
+        
+        # write animations and point caches, on a single frame sweep
+        if not (scene.duke.animation_enable or scene.duke.points_enable):
+            return
+        
+        # stash current frame
+        frame = scene.frame_current
+        try:
+            
+            # start point caches (all crowd meshes)
+            samplers = []
+            if scene.duke.points_enable:
+                meshes = [c for a in armatures for c in a.children
+                    if c.type == 'MESH']
+                points = DukePointCache(scene.duke.points_path, scene, meshes,
+                    [self.rename(c.name) for c in meshes], {
+                        'name'   : self.rename(scene.name),
+                        'puppet' : self.rename(scene.name)
+                        })
+                samplers.append(points.sample)
+            
+            # bake poses (parallel and fast bakes now, others sampled on the
+            # sweep)
+            baked = []
+            start = scene.frame_start
+            end = scene.frame_end
+            if scene.duke.animation_enable and scene.duke.bake_workers > 1:
+                with self.profiler.stage('bake', None, end - start + 1):
+                    baked = yield from self.iter_bake_parallel(scene,
+                        armatures)
+                yield
+            elif scene.duke.animation_enable:
+                fast = [self.use_fast_bake(scene, a, a.pose.bones, samplers)
+                    for a in armatures]
+                for a, use_fast in zip(armatures, fast):
+                    if use_fast:
+                        with self.profiler.stage('bake', None, end - start + 1):
+                            baked.append((yield from self.iter_fast_bake(scene,
+                                a, a.pose.bones)))
+                        yield
+                    else:
+                        poses, sample = self.bake_sampler(scene, a,
+                            a.pose.bones, start, end)
+                        baked.append(poses)
+                        samplers.append(sample)
+            
+            # sweep frames once
+            if samplers:
+                with self.profiler.stage('bake', None, end - start + 1):
+                    yield from self.iter_sweep(scene, start, end, samplers)
             
-            # write animation
-            self.write_animation(scene, armature, bones)
+            # write animations (one file per armature)
+            for a, poses in zip(armatures, baked):
+                path = member_path(scene.duke.animation_path,
+                    self.rename(a.name))
+                if scene.duke.window_frames:
+                    yield from self.iter_windows(scene, a, a.pose.bones,
+                        path=path, poses=poses)
+                elif binary:
+                    yield from self.iter_animation_binary(scene, a,
+                        a.pose.bones, path=path, poses=poses)
+                else:
+                    yield from self.iter_animation(scene, a, a.pose.bones,
+                        path=path, poses=poses)
             
-            # recall current frame
+            # finish point caches
+            if scene.duke.points_enable:
+                points.close()
+            
+        finally:
+            
+            # recall current frame (also when cancelled)
             scene.frame_current = frame
             scene.update()
+
+
+# export button
+class DukeExportButton(DukeExport, bpy.types.Operator):
+    
+    # attributes
+    bl_idname = 'duke.export'
+    bl_label = 'Duke Export'
+    
+    
+    # modal export step latency target (seconds)
+    latency = 0.05
+    
+    
+    # button action (scripts, blocking)
+    def execute(self, context):
+        
+        # export selected armature
+        profiler = self.export(context.scene, context.object)
+        
+        # show profiling summary in panel
+        DukeExportPanel.summary = profiler.summary()
+        
+        return {'FINISHED'}
+    
+    
+    # button action (ui, modal)
+    def invoke(self, context, event):
+        
+        # one modal export at a time
+        if DukeExportPanel.progress is not None:
+            self.report({'WARNING'}, 'Duke export already running')
+            return {'CANCELLED'}
+        
+        # start export steps
+        self.scene = context.scene
+        self.frame = context.scene.frame_current
+        self.paths = self.output_paths(context.scene, context.object)
+        self.start = time.time()
+        self.steps = self.iter_export(context.scene, context.object)
+        self.step = 0
+        self.total = max(1, self.count_steps(context.scene, context.object))
+        self.chunk = 1
+        
+        # show progress in panel
+        DukeExportPanel.progress = 0.0
+        DukeExportPanel.status = 'Exporting...'
+        DukeExportPanel.cancel = False
+        
+        # run steps on timer events
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.01, context.window)
+        wm.modal_handler_add(self)
         
+        return {'RUNNING_MODAL'}
+    
+    
+    # modal event handler
+    def modal(self, context, event):
+        
+        # cancel on escape or panel cancel button
+        if event.type == 'ESC' or DukeExportPanel.cancel:
+            self.abort(context)
+            self.report({'INFO'}, 'Duke export cancelled')
+            return {'CANCELLED'}
+        
+        # pass other events through (keeps ui responsive)
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        
+        # run a chunk of steps
+        tic = time.perf_counter()
+        try:
+            for _ in range(self.chunk):
+                if next(self.steps) is not WAITING:
+                    self.step += 1
+        
+        # finished
+        except StopIteration as stop:
+            self.finish(context)
+            DukeExportPanel.summary = stop.value.summary()
+            return {'FINISHED'}
+        
+        # failed
+        except Exception:
+            self.abort(context)
+            self.report({'ERROR'}, traceback.format_exc())
+            return {'CANCELLED'}
+        
+        # adapt chunk size to the latency target
+        toc = time.perf_counter() - tic
+        self.chunk = max(1, min(4 * self.chunk,
+            int(self.latency * self.chunk / max(toc, 1e-6))))
+        
+        # update progress and time remaining
+        progress = min(1.0, self.step / self.total)
+        elapsed = time.time() - self.start
+        eta = elapsed * (1.0 - progress) / max(progress, 1e-6)
+        DukeExportPanel.progress = progress
+        DukeExportPanel.status = '%d%% (%d/%d, ETA %.1fs)' % (
+            100 * progress, self.step, self.total, eta)
+        self.redraw(context)
+        
+        return {'RUNNING_MODAL'}
+    
+    
+    # stop modal export
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        DukeExportPanel.progress = None
+        DukeExportPanel.status = ''
+        DukeExportPanel.cancel = False
+        self.redraw(context)
+    
+    
+    # cancel modal export (closes steps, restoring the frame, and deletes the
+    # partial files it wrote)
+    def abort(self, context):
+        
+        # close export steps
+        try:
+            self.steps.close()
+        except Exception:
+            pass
+        self.finish(context)
+        
+        # delete partial files
+        for path in self.paths:
+            try:
+                if os.path.getmtime(path) >= self.start - 1.0:
+                    os.remove(path)
+            except OSError:
+                pass
+    
+    
+    # redraw 3d view panels
+    def redraw(self, context):
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
+# export cancel button
+class DukeExportCancelButton(bpy.types.Operator):
+    
+    # attributes
+    bl_idname = 'duke.export_cancel'
+    bl_label = 'Cancel Duke Export'
+    
+    
+    # button action
+    def execute(self, context):
+        DukeExportPanel.cancel = True
         return {'FINISHED'}
 
 
@@ -661,9 +3846,204 @@ def unregister():
     bpy.utils.unregister_module(__name__)
 
 
+# load batch manifest (relative paths are relative to the manifest)
+def load_manifest(path):
+    
+    # read jobs
+    with open(path) as f:
+        data = json.load(f)
+    jobs = data['jobs'] if isinstance(data, dict) else data
+    
+    # resolve paths (relative to the manifest, as are option paths)
+    root = os.path.dirname(os.path.abspath(path))
+    for job in jobs:
+        for key in ('blend', 'puppet_path', 'animation_path'):
+            if key in job:
+                job[key] = os.path.join(root, job[key])
+        options = job.get('options', {})
+        for key, value in options.items():
+            if key.endswith('_path') and value:
+                options[key] = os.path.join(root, value)
+    
+    return jobs
+
+
+# run batch export job in this blender process
+def run_job(job):
+    
+    # get scene and armature
+    if 'scene' in job:
+        scene = bpy.data.scenes[job['scene']]
+    else:
+        scene = bpy.context.scene
+    armature = bpy.data.objects[job['armature']]
+    
+    # apply settings (outputs without a path are disabled)
+    for key, value in job.get('options', {}).items():
+        setattr(scene.duke, key, value)
+    for key in ('puppet', 'animation'):
+        if key + '_path' in job:
+            setattr(scene.duke, key + '_path', job[key + '_path'])
+        else:
+            setattr(scene.duke, key + '_enable', False)
+    
+    # export
+    time0 = time.time()
+    exporter = DukeExport()
+    exporter.export(scene, armature)
+    
+    return {
+        'status'      : 'ok',
+        'export_time' : time.time() - time0,
+        'outputs'     : exporter.output_paths(scene, armature)
+        }
+
+
+# run batch manifest jobs across a pool of background blender processes
+def run_manifest(path, workers, summary, binary):
+    
+    # load jobs
+    jobs = load_manifest(path)
+    directory = tempfile.mkdtemp(prefix='duke_batch_')
+    script = os.path.abspath(__file__)
+    
+    # run job in a background blender process
+    def run(i):
+        
+        # write job
+        job = jobs[i]
+        job_path = os.path.join(directory, 'job' + str(i) + '.json')
+        result_path = os.path.join(directory, 'result' + str(i) + '.json')
+        log_path = os.path.join(directory, 'job' + str(i) + '.log')
+        with open(job_path, 'w') as f:
+            json.dump(job, f)
+        
+        # run process
+        args = [binary, '--background', job['blend'], '--python', script,
+            '--', '--job', job_path, '--output', result_path]
+        time0 = time.time()
+        with open(log_path, 'w') as log:
+            code = subprocess.call(args, stdout=log, stderr=subprocess.STDOUT)
+        
+        # record result
+        record = {
+            'blend'    : job['blend'],
+            'armature' : job['armature'],
+            'time'     : time.time() - time0,
+            'status'   : 'failed'
+            }
+        if os.path.exists(result_path):
+            with open(result_path) as f:
+                record.update(json.load(f))
+        if code != 0 and record['status'] == 'ok':
+            record['status'] = 'failed'
+        
+        # record output sizes (all output files of the job, see
+        # DukeExport.output_paths()), or the end of the log for failures
+        if record['status'] == 'ok':
+            record['bytes'] = {}
+            for path in record.pop('outputs', []):
+                if os.path.exists(path):
+                    record['bytes'][path] = os.path.getsize(path)
+        elif 'error' not in record:
+            with open(log_path) as f:
+                record['error'] = f.read()[-2000 :]
+        
+        return record
+    
+    # run jobs
+    time0 = time.time()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            records = list(pool.map(run, range(len(jobs))))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    
+    # write summary
+    report = {
+        'manifest' : os.path.abspath(path),
+        'workers'  : workers,
+        'time'     : time.time() - time0,
+        'jobs'     : records,
+        'failures' : sum(r['status'] != 'ok' for r in records),
+        'bytes'    : sum(sum(r.get('bytes', {}).values()) for r in records)
+        }
+    with open(summary, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    return report
+
+
+# command line entry point
+#   blender --background [file.blend] --python duke_export.py -- [options]
+def main(argv):
+    
+    # parse arguments
+    parser = argparse.ArgumentParser(prog='duke_export.py')
+    parser.add_argument('--bake', action='store_true',
+        help='bake armature poses of a frame range to a .npy file')
+    parser.add_argument('--scene', help='scene name')
+    parser.add_argument('--armature', help='armature object name')
+    parser.add_argument('--armatures',
+        help='armature object names (json list, baked together)')
+    parser.add_argument('--start', type=int, help='first frame')
+    parser.add_argument('--end', type=int, help='last frame (inclusive)')
+    parser.add_argument('--output', help='output path')
+    parser.add_argument('--manifest', help='batch export manifest (json)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+        help='number of batch export processes')
+    parser.add_argument('--summary', help='batch export summary path (json)')
+    parser.add_argument('--blender', default=bpy.app.binary_path,
+        help='blender executable for batch export processes')
+    parser.add_argument('--job', help='batch export job (json, internal)')
+    args = parser.parse_args(argv)
+    
+    # batch export
+    if args.manifest:
+        summary = args.summary
+        if not summary:
+            summary = os.path.splitext(args.manifest)[0] + '_summary.json'
+        report = run_manifest(args.manifest, args.workers, summary,
+            args.blender)
+        sys.exit(1 if report['failures'] else 0)
+    
+    # batch export job
+    if args.job:
+        
+        # run job
+        with open(args.job) as f:
+            job = json.load(f)
+        try:
+            result = run_job(job)
+        except Exception:
+            result = {'status' : 'failed', 'error' : traceback.format_exc()}
+        
+        # write result
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
+        sys.exit(0 if result['status'] == 'ok' else 1)
+    
+    # parallel bake worker (all armatures on one frame sweep)
+    if args.bake:
+        scene = bpy.data.scenes[args.scene]
+        names = [args.armature]
+        if args.armatures:
+            names = json.loads(args.armatures)
+        armatures = [bpy.data.objects[name] for name in names]
+        poses = DukeExport().bake_armatures(scene, armatures, args.start,
+            args.end)
+        np.save(args.output, poses)
+
+
 # script
 if __name__ == '__main__':
+    
+    # register add-on
     register()
+    
+    # run command line options (arguments after '--' are for the script)
+    if '--' in sys.argv:
+        main(sys.argv[sys.argv.index('--') + 1 :])
 
 
 #==============================================================================#
@@ -0,0 +1,1077 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke Reader - Python reader for Duke Export data
+#
+# Loads puppet and animation files written by the 'duke_export.py' Blender
+# add-on into dictionaries of NumPy arrays. Keys mirror the MATLAB puppet and
+# animation structures (see PuppetScan.m, PuppetAnimScan.m), except that:
+#   + vertices are [v,3] arrays (one row per vertex)
+#   + faces are [f,ngon] arrays padded with -1 (not triangulated, unless
+#     exported triangulated as [f,3] arrays)
+#   + poses are [3,4] arrays (A.M = pose[:, :3], A.v = pose[:, 3])
+#   + animation tracks are [frames,3,4] arrays (key frame tracks are expanded,
+#     see expand_track())
+#   + meshes exported with skinning matrices have a 'skin' dictionary of CSR
+#     arrays ('pointers' [v+1], 'bones' [n], 'weights' [n]), where the weights
+#     of vertex i are entries pointers[i] to pointers[i+1]
+#   + meshes exported with topology have a 'topology' dictionary of edges
+#     [e,2], vertex face adjacency CSR arrays ('pointers' [v+1], 'faces' [n]),
+#     'vertex_normals' [v,3], and 'face_normals' [f,3]
+#   + meshes exported with levels of detail have a 'lods' list of dictionaries
+#     ('ratio', 'vertices' [n] mesh vertex of each lod vertex, 'map' [v] lod
+#     vertex of each mesh vertex, 'faces' [t,3], 'materials' [t]); see
+#     lod_puppet()
+#   + crowd files are dictionaries of shared 'materials' and 'puppets'; mesh
+#     instances share the arrays of the first mesh using the same mesh data
+#
+# NOTE : indices are 0-based (MATLAB structures are 1-based)!
+#
+# Compressed files (.gz, .bz2, .xz, see duke_export.COMPRESSORS) are
+# decompressed on the fly. Text files can be streamed section by section with
+# iter_sections().
+#
+# USAGE:
+#   import duke_reader
+#   puppet = duke_reader.read_binary('puppet.duke')
+#   animation = duke_reader.read_binary('animation.duke')
+#   for header, lines in duke_reader.iter_sections('animation.txt.gz'):
+#       poses = duke_reader.parse_rows(lines)
+#   reader = duke_reader.DukeTextReader('animation.txt')
+#   poses = reader.track('bone/Spine')
+#   puppet = duke_reader.read_text('puppet.txt')
+#   points = duke_reader.read_points('points.json')
+#   window = duke_reader.read_window('animation.json', 60)
+#   coarse = duke_reader.lod_puppet(puppet, 1)
+
+# import
+import bisect
+import bz2
+import collections
+import gzip
+import json
+import lzma
+import os
+import struct
+import numpy as np
+
+
+# duke binary format constants (see duke_export.DukeBinaryWriter)
+MAGIC = b'DUKEBIN\0'
+VERSION = 1
+HEADER = '<8sI4x'
+TRAILER = '<QQ8s'
+
+
+# decompressors by file extension (see duke_export.COMPRESSORS); more can be
+# added with register_decompressor()
+DECOMPRESSORS = collections.OrderedDict()
+
+
+# register decompressor (open(path, mode) function) for a file extension
+def register_decompressor(extension, open):
+    DECOMPRESSORS[extension] = open
+
+
+register_decompressor('.gz', gzip.open)
+register_decompressor('.bz2', bz2.open)
+register_decompressor('.xz', lzma.open)
+
+
+# check if file is compressed
+def is_compressed(path):
+    return any(path.endswith(extension) for extension in DECOMPRESSORS)
+
+
+# open file (streams through the decompressor matching its extension, if any)
+def open_file(path, mode='rt'):
+    for extension, open_compressed in DECOMPRESSORS.items():
+        if path.endswith(extension):
+            return open_compressed(path, mode)
+    return open(path, mode)
+
+
+# iterate text file sections; yields (header, lines) for each blank line
+# separated section, where header maps 'key : value' lines in order and lines
+# are the remaining (data) lines; files are streamed, so only one section is
+# held in memory
+def iter_sections(path):
+    
+    with open_file(path, 'rt') as f:
+        
+        # split lines into sections
+        header = collections.OrderedDict()
+        lines = []
+        for line in f:
+            
+            # end of section
+            line = line.rstrip('\n')
+            if not line.strip():
+                if header or lines:
+                    yield header, lines
+                header = collections.OrderedDict()
+                lines = []
+            
+            # header line
+            elif ' : ' in line:
+                key, value = line.split(' : ', 1)
+                header[key] = value
+            
+            # data line
+            else:
+                lines.append(line)
+        
+        # last section (no trailing blank line)
+        if header or lines:
+            yield header, lines
+
+
+# parse data lines into a [lines,columns] array (face material delimiters are
+# dropped)
+def parse_rows(lines, dtype=np.float64):
+    
+    if not lines:
+        return np.empty((0, 0), dtype=dtype)
+    values = ' '.join(lines).replace(',', ' ').split()
+    return np.array(values, dtype=np.float64).astype(dtype).reshape(
+        len(lines), -1)
+
+
+# read duke binary section table and arrays (zero-copy views of the file)
+def read_sections(path, mmap=True):
+    
+    # map (or read) file (compressed files are decompressed into memory)
+    if is_compressed(path):
+        with open_file(path, 'rb') as f:
+            data = np.frombuffer(f.read(), dtype=np.uint8)
+    elif mmap:
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        with open(path, 'rb') as f:
+            data = np.frombuffer(f.read(), dtype=np.uint8)
+    
+    # check header and trailer
+    nheader = struct.calcsize(HEADER)
+    ntrailer = struct.calcsize(TRAILER)
+    if len(data) < nheader + ntrailer:
+        raise ValueError('File \'%s\' incorrect format!' % path)
+    magic, version = struct.unpack_from(HEADER, data, 0)
+    offset, size, end = struct.unpack_from(TRAILER, data, len(data) - ntrailer)
+    if magic != MAGIC or end != MAGIC:
+        raise ValueError('File \'%s\' incorrect format!' % path)
+    if version > VERSION:
+        raise ValueError('File \'%s\' version unsupported!' % path)
+    
+    # read section table
+    table = json.loads(bytes(data[offset : offset + size]).decode('utf-8'))
+    
+    # get section arrays
+    arrays = {}
+    for section in table['sections']:
+        
+        # get layout
+        dtype = np.dtype(section['dtype'])
+        shape = tuple(section['shape'])
+        count = int(np.prod(shape))
+        
+        # view file data
+        if count:
+            array = np.frombuffer(data, dtype, count, section['offset'])
+            arrays[section['name']] = array.reshape(shape)
+        else:
+            arrays[section['name']] = np.empty(shape, dtype)
+    
+    return table, arrays
+
+
+# decompose [n,3,4] poses into rotation quaternions, scales, translations, and
+# shear flags (poses whose scaled axes are not orthogonal)
+def decompose_poses(poses):
+    
+    # split transformation matrix and translation vector
+    M = np.array(poses[:, :, :3], dtype=np.float64)
+    t = poses[:, :, 3]
+    
+    # scale (column norms, sign flipped for reflections)
+    s = np.sqrt((M ** 2).sum(axis=1))
+    s[s == 0.0] = 1.0
+    R = M / s[:, None, :]
+    flip = np.linalg.det(R) < 0.0
+    s[flip, 0] *= -1.0
+    R[flip, :, 0] *= -1.0
+    
+    # shear (normalized axes not orthonormal, which no rotation and scale
+    # reproduces)
+    G = np.matmul(R.transpose(0, 2, 1), R)
+    shear = np.abs(G - np.eye(3)).reshape(len(R), 9).max(axis=1) > 1e-6
+    
+    # rotation matrix to quaternion (w, x, y, z)
+    q = np.empty((len(R), 4))
+    d = np.diagonal(R, axis1=1, axis2=2)
+    q[:, 0] = np.sqrt(np.maximum(0.0, 1.0 + d[:, 0] + d[:, 1] + d[:, 2]))
+    q[:, 1] = np.sqrt(np.maximum(0.0, 1.0 + d[:, 0] - d[:, 1] - d[:, 2]))
+    q[:, 2] = np.sqrt(np.maximum(0.0, 1.0 - d[:, 0] + d[:, 1] - d[:, 2]))
+    q[:, 3] = np.sqrt(np.maximum(0.0, 1.0 - d[:, 0] - d[:, 1] + d[:, 2]))
+    q[:, 1] = np.copysign(q[:, 1], R[:, 2, 1] - R[:, 1, 2])
+    q[:, 2] = np.copysign(q[:, 2], R[:, 0, 2] - R[:, 2, 0])
+    q[:, 3] = np.copysign(q[:, 3], R[:, 1, 0] - R[:, 0, 1])
+    q /= np.sqrt((q ** 2).sum(axis=1))[:, None]
+    
+    return q, s, t, shear
+
+
+# compose [n,3,4] poses from rotation quaternions, scales, and translations
+def compose_poses(q, s, t):
+    
+    # quaternion to rotation matrix
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    R = np.empty((len(q), 3, 3))
+    R[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    R[:, 0, 1] = 2.0 * (x * y - w * z)
+    R[:, 0, 2] = 2.0 * (x * z + w * y)
+    R[:, 1, 0] = 2.0 * (x * y + w * z)
+    R[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    R[:, 1, 2] = 2.0 * (y * z - w * x)
+    R[:, 2, 0] = 2.0 * (x * z - w * y)
+    R[:, 2, 1] = 2.0 * (y * z + w * x)
+    R[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    
+    # assemble poses
+    poses = np.empty((len(q), 3, 4))
+    poses[:, :, :3] = R * s[:, None, :]
+    poses[:, :, 3] = t
+    
+    return poses
+
+
+# interpolate [k,3,4] key poses at given frames (linear translation and scale,
+# slerp rotation, linear 3x4 matrices where either key is sheared)
+def interpolate_poses(keys, poses, frames):
+    
+    # find key segments and segment parameters
+    keys = np.asarray(keys)
+    frames = np.asarray(frames)
+    i = np.clip(np.searchsorted(keys, frames, side='right') - 1, 0,
+        max(len(keys) - 2, 0))
+    j = np.minimum(i + 1, len(keys) - 1)
+    span = np.maximum(keys[j] - keys[i], 1)
+    u = np.clip((frames - keys[i]) / span, 0.0, 1.0)[:, None]
+    
+    # decompose key poses
+    q, s, t, shear = decompose_poses(poses)
+    
+    # slerp rotations (shortest path, lerp when nearly parallel)
+    q0 = q[i]
+    q1 = q[j]
+    dot = (q0 * q1).sum(axis=1)
+    q1[dot < 0.0] *= -1.0
+    dot = np.minimum(np.abs(dot), 1.0)[:, None]
+    theta = np.arccos(dot)
+    sin = np.sin(theta)
+    near = sin < 1e-6
+    sin[near] = 1.0
+    a = np.where(near, 1.0 - u, np.sin((1.0 - u) * theta) / sin)
+    b = np.where(near, u, np.sin(u * theta) / sin)
+    q = a * q0 + b * q1
+    q /= np.sqrt((q ** 2).sum(axis=1))[:, None]
+    
+    # lerp scales and translations
+    s = (1.0 - u) * s[i] + u * s[j]
+    t = (1.0 - u) * t[i] + u * t[j]
+    
+    # lerp sheared segments as matrices
+    result = compose_poses(q, s, t)
+    sheared = shear[i] | shear[j]
+    if sheared.any():
+        u = u[sheared, :, None]
+        result[sheared] = ((1.0 - u) * poses[i[sheared]] +
+            u * poses[j[sheared]])
+    
+    return result
+
+
+# expand key frame track ([k] key frame indices, [k,3,4] key poses) to dense
+# [frames,3,4] poses
+def expand_track(keys, poses, nframes):
+    
+    # constant track
+    if len(keys) == 1:
+        return np.repeat(np.asarray(poses, dtype=np.float64), nframes, axis=0)
+    
+    # interpolate (key frames are exact)
+    dense = interpolate_poses(keys, poses, np.arange(nframes))
+    dense[keys] = poses
+    
+    return dense
+
+
+# compress a [n,3,4] track to key frames (first frame only if constant; the
+# inverse of expand_track(), used by the duke_export add-on); keys are added
+# where interpolation error exceeds the tolerance
+def compress_track(poses, tolerance):
+    
+    # constant track
+    n = len(poses)
+    if n < 2 or np.abs(poses - poses[0]).max() <= tolerance:
+        return np.zeros(1, dtype=np.int32)
+    
+    # split segments at their worst interpolated frame until within tolerance
+    keys = set([0, n - 1])
+    segments = [(0, n - 1)]
+    while segments:
+        
+        # get segment
+        a, b = segments.pop()
+        if b - a < 2:
+            continue
+        
+        # measure interpolation error of interior frames
+        frames = np.arange(a + 1, b)
+        approx = interpolate_poses([a, b], poses[[a, b]], frames)
+        error = np.abs(approx - poses[a + 1 : b]).reshape(len(frames), 12)
+        error = error.max(axis=1)
+        
+        # split segment
+        k = int(np.argmax(error))
+        if error[k] > tolerance:
+            m = a + 1 + k
+            keys.add(m)
+            segments.append((a, m))
+            segments.append((m, b))
+    
+    return np.array(sorted(keys), dtype=np.int32)
+
+
+# assemble puppet from duke binary sections (section names prefixed in crowds,
+# where mesh instances use the shapes, faces, and topology of the mesh section
+# key they name)
+def make_puppet(meta, arrays, prefix=''):
+    
+    # assemble materials
+    materials = []
+    for m in meta['materials']:
+        materials.append({'name' : m['name'], 'duke' : m['properties']})
+    
+    # assemble meshes
+    meshes = []
+    for i, m in enumerate(meta['meshes']):
+        key = prefix + 'mesh/' + str(i)
+        data = m.get('instance', key)
+        shapes = []
+        for j, name in enumerate(m['shapes']):
+            vertices = arrays[data + '/shape/' + str(j)]
+            shapes.append({'name' : name, 'vertices' : vertices})
+        meshes.append({
+            'name'      : m['name'],
+            'visible'   : m['visible'],
+            'A_rest'    : arrays[key + '/pose'],
+            'shapes'    : shapes,
+            'faces'     : arrays[data + '/faces'],
+            'materials' : arrays[data + '/materials']
+            })
+        
+        # sparse skinning matrix (optional)
+        if key + '/skin/pointers' in arrays:
+            meshes[-1]['skin'] = {
+                'pointers' : arrays[key + '/skin/pointers'],
+                'bones'    : arrays[key + '/skin/bones'],
+                'weights'  : arrays[key + '/skin/weights']
+                }
+        
+        # topology (optional)
+        if data + '/edges' in arrays:
+            meshes[-1]['topology'] = {
+                'edges'          : arrays[data + '/edges'],
+                'pointers'       : arrays[data + '/adjacency/pointers'],
+                'faces'          : arrays[data + '/adjacency/faces'],
+                'vertex_normals' : arrays[data + '/normals/vertices'],
+                'face_normals'   : arrays[data + '/normals/faces']
+                }
+        
+        # levels of detail (optional)
+        if 'lods' in m:
+            meshes[-1]['lods'] = [{
+                'ratio'     : ratio,
+                'vertices'  : arrays[data + '/lod/%d/vertices' % k],
+                'map'       : arrays[data + '/lod/%d/map' % k],
+                'faces'     : arrays[data + '/lod/%d/faces' % k],
+                'materials' : arrays[data + '/lod/%d/materials' % k]
+                } for k, ratio in enumerate(m['lods'])]
+    
+    # assemble bones
+    bones = []
+    for i, b in enumerate(meta['bones']):
+        key = prefix + 'bone/' + str(i)
+        groups = [key + '/weights/' + str(j) for j in range(len(meshes))]
+        bones.append({
+            'name'     : b['name'],
+            'parent'   : b['parent'],
+            'children' : b['children'],
+            'A_rest'   : arrays[key + '/pose'],
+            'indices'  : [arrays[g + '/indices'] for g in groups],
+            'weights'  : [arrays[g + '/weights'] for g in groups]
+            })
+    
+    return {
+        'name'      : meta['name'],
+        'materials' : materials,
+        'meshes'    : meshes,
+        'bones'     : bones
+        }
+
+
+# assemble crowd from duke binary sections (puppets share the materials)
+def make_crowd(meta, arrays):
+    
+    materials = make_puppet({'name' : meta['name'], 'meshes' : [],
+        'bones' : [], 'materials' : meta['materials']}, arrays)['materials']
+    puppets = []
+    for i, p in enumerate(meta['puppets']):
+        puppets.append(make_puppet(dict(p, materials=[]), arrays,
+            'puppet/' + str(i) + '/'))
+        puppets[-1]['materials'] = materials
+    
+    return {
+        'name'      : meta['name'],
+        'materials' : materials,
+        'puppets'   : puppets
+        }
+
+
+# assemble animation from duke binary sections
+def make_animation(meta, arrays):
+    
+    # get track poses (expands key frame tracks)
+    def track(name):
+        if meta.get('encoding', 'dense') == 'keys':
+            keys = arrays[name + '/keys']
+            return expand_track(keys, arrays[name + '/pose'], meta['frames'])
+        else:
+            return arrays[name + '/pose']
+    
+    # assemble tracks
+    meshes = []
+    for i, name in enumerate(meta['meshes']):
+        meshes.append({'name' : name, 'A' : track('mesh/' + str(i))})
+    bones = []
+    for i, name in enumerate(meta['bones']):
+        bones.append({'name' : name, 'A' : track('bone/' + str(i))})
+    
+    return {
+        'name'   : meta['name'],
+        'puppet' : meta['puppet'],
+        'frames' : meta['frames'],
+        'A'      : track('puppet'),
+        'meshes' : meshes,
+        'bones'  : bones
+        }
+
+
+# text file section index version (cached indices of other versions are
+# rebuilt)
+INDEX_VERSION = 1
+
+
+# build text file section index
+#
+# Sections are keyed by type and name, with shape, face, and weights sections
+# nested under their mesh or bone (in crowd files, sections following a puppet
+# section are nested under puppet/NAME/, except materials):
+#   puppet/NAME, material/NAME, mesh/NAME, mesh/NAME/shape/NAME, mesh/NAME/face,
+#   bone/NAME, bone/NAME/weights/MESH, animation/NAME, and trailing skin/MESH,
+#   edges/MESH, adjacency/MESH, normals/MESH, lod/MESH/LEVEL sections
+# Each entry holds the section header, and the byte range and number of its
+# data lines (header lines may follow data lines, as bone poses do). Duplicate
+# keys raise a ValueError. Given the (uncompressed) byte offsets of sections,
+# only the sections at the offsets are scanned, each up to its blank line.
+def index_text(path, offsets=None):
+    
+    sections = collections.OrderedDict()
+    owner = ''
+    scope = ''
+    crowd = False
+    
+    # add section to index
+    def close(entry):
+        nonlocal owner, scope, crowd
+        header = entry['header']
+        type = header.get('type')
+        name = header.get('name', '')
+        if type == 'crowd':
+            crowd = True
+            key = type + '/' + name
+        elif type in ('puppet', 'material'):
+            key = type + '/' + name
+            if type == 'puppet' and crowd:
+                scope = key + '/'
+        elif type in ('mesh', 'bone'):
+            owner = key = scope + type + '/' + name
+        elif type in ('shape', 'weights'):
+            key = owner + '/' + type + '/' + name
+        elif type == 'face':
+            key = owner + '/face'
+        elif type == 'lod':
+            key = scope + type + '/' + name + '/' + header.get('level', '')
+        else:
+            key = scope + type + '/' + name
+        
+        # names are exported renamed (see duke_export DukeExport.rename()), so
+        # distinct blender names may collide; reject rather than overwrite
+        if key in sections:
+            raise ValueError('File \'%s\' has duplicate section \'%s\'!' % (
+                path, key))
+        sections[key] = entry
+    
+    # scan lines from a byte offset (only header lines are decoded), to the end
+    # of the file or of the first section
+    def scan(f, offset, first):
+        entry = None
+        for line in f:
+            
+            # end of section
+            n = len(line)
+            if not line.strip():
+                if entry is not None:
+                    close(entry)
+                    if first:
+                        return
+                entry = None
+            
+            # header line (data lines never contain ' : ')
+            elif b' : ' in line:
+                if entry is None:
+                    entry = {'header' : collections.OrderedDict(), 'rows' : 0}
+                key, value = line.decode('utf-8').rstrip('\r\n').split(' : ',
+                    1)
+                entry['header'][key] = value
+                if not entry['rows']:
+                    entry['data'] = entry['end'] = offset + n
+            
+            # data line
+            elif entry is not None:
+                entry['rows'] += 1
+                entry['end'] = offset + n
+            
+            # data line outside a section
+            else:
+                raise ValueError('File \'%s\' incorrect format!' % path)
+            
+            offset += n
+        
+        # last section (no trailing blank line)
+        if entry is not None:
+            close(entry)
+    
+    with open_file(path, 'rb') as f:
+        if offsets is None:
+            scan(f, 0, False)
+        else:
+            for offset in offsets:
+                f.seek(offset)
+                scan(f, offset, True)
+    
+    return sections
+
+
+# indexed text puppet or animation reader
+#
+# Builds a section index on first open (see index_text()), cached next to the
+# file as PATH.index and reused while the file size and modification time are
+# unchanged. Given section byte offsets, only those sections are indexed (and
+# the index is not cached). Section data is read and parsed only when
+# requested.
+class DukeTextReader(object):
+    
+    # open file (loads or builds section index)
+    def __init__(self, path, cache=True, offsets=None):
+        
+        # crowd puppet scope ('puppet/NAME/', see index_text()) of the mesh and
+        # bone section lookups
+        self.scope = ''
+        
+        # decompressed file data (compressed files are decompressed once, on
+        # the first read, as compressed streams seek by decompressing)
+        self.data = None
+        
+        self.path = path
+        stat = os.stat(path)
+        self.stamp = [INDEX_VERSION, stat.st_size, stat.st_mtime]
+        index_path = path + '.index'
+        
+        # index sections at offsets
+        if offsets is not None:
+            cache = False
+        
+        # load cached index
+        self.sections = None
+        if cache:
+            try:
+                with open(index_path) as f:
+                    data = json.load(f,
+                        object_pairs_hook=collections.OrderedDict)
+                if data['stamp'] == self.stamp:
+                    self.sections = data['sections']
+            except (OSError, ValueError, KeyError):
+                pass
+        
+        # build index (and cache it, if possible)
+        if self.sections is None:
+            self.sections = index_text(path, offsets)
+            if cache:
+                try:
+                    with open(index_path + '.tmp', 'w') as f:
+                        json.dump({'stamp' : self.stamp,
+                            'sections' : self.sections}, f)
+                    os.replace(index_path + '.tmp', index_path)
+                except OSError:
+                    pass
+    
+    
+    # get section keys (of a type, if given)
+    def keys(self, type=None):
+        return [k for k, v in self.sections.items()
+            if type is None or v['header'].get('type') == type]
+    
+    
+    # get section header
+    def header(self, key):
+        return self.sections[key]['header']
+    
+    
+    # read section data bytes (sliced from the decompressed data of compressed
+    # files, seeked in plain files)
+    def read(self, key):
+        entry = self.sections[key]
+        if is_compressed(self.path):
+            if self.data is None:
+                with open_file(self.path, 'rb') as f:
+                    self.data = f.read()
+            return self.data[entry['data'] : entry['end']]
+        with open(self.path, 'rb') as f:
+            f.seek(entry['data'])
+            return f.read(entry['end'] - entry['data'])
+    
+    
+    # read section data lines
+    def lines(self, key):
+        return self.read(key).decode('utf-8').splitlines()
+    
+    
+    # read section data as a [lines,columns] array (face material delimiters
+    # are dropped)
+    def rows(self, key, dtype=np.float64):
+        
+        # bulk parse
+        n = self.sections[key]['rows']
+        text = self.read(key).replace(b',', b' ').decode('ascii')
+        values = np.fromstring(text, dtype=np.float64, sep=' ')
+        
+        return values.reshape(n, -1).astype(dtype) if n else values
+    
+    
+    # get section pose as a [3,4] array (header values are column-major)
+    def pose(self, key):
+        values = np.array(self.header(key)['pose'].split(), dtype=np.float64)
+        return values.reshape(4, 3).T
+    
+    
+    # get mesh shape names
+    def shapes(self, mesh):
+        prefix = self.scope + 'mesh/' + mesh + '/shape/'
+        return [k[len(prefix) :] for k in self.sections if k.startswith(prefix)]
+    
+    
+    # get mesh shape vertices as a [v,3] array
+    def shape(self, mesh, shape):
+        return self.rows(self.scope + 'mesh/' + mesh + '/shape/' + shape,
+            np.float32)
+    
+    
+    # get mesh faces ([f,ngon] vertex indices padded with -1, and material
+    # indices)
+    def faces(self, mesh):
+        rows = self.rows(self.scope + 'mesh/' + mesh + '/face', np.int32)
+        if not rows.size:
+            return np.empty((0, 0), dtype=np.int32), rows
+        return rows[:, : -1], rows[:, -1]
+    
+    
+    # get bone weights for a mesh (vertex indices, weights)
+    def weights(self, bone, mesh):
+        rows = self.rows(self.scope + 'bone/' + bone + '/weights/' + mesh)
+        if not rows.size:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        return rows[:, 0].astype(np.int32), rows[:, 1].astype(np.float32)
+    
+    
+    # get mesh sparse skinning matrix (None if not exported)
+    def skin(self, mesh):
+        
+        # check section
+        key = self.scope + 'skin/' + mesh
+        if key not in self.sections:
+            return None
+        
+        # split row pointers (first line) and entries
+        pointers, entries = self.read(key).split(b'\n', 1)
+        entries = np.fromstring(entries.decode('ascii'), sep=' ').reshape(-1, 2)
+        
+        return {
+            'pointers' : np.fromstring(pointers.decode('ascii'), dtype=np.int64,
+                sep=' '),
+            'bones'    : entries[:, 0].astype(np.int32),
+            'weights'  : entries[:, 1].astype(np.float32)
+            }
+    
+    
+    # get mesh topology (None if not exported)
+    def topology(self, mesh):
+        
+        # check sections
+        if self.scope + 'edges/' + mesh not in self.sections:
+            return None
+        
+        # split adjacency row pointers (first line) and adjacent faces
+        pointers, faces = self.read(self.scope + 'adjacency/' + mesh).split(
+            b'\n', 1)
+        
+        # split vertex and face normals
+        key = self.scope + 'normals/' + mesh
+        normals = self.rows(key, np.float32).reshape(-1, 3)
+        n = int(self.header(key)['vertices'])
+        
+        return {
+            'edges'          : self.rows(self.scope + 'edges/' + mesh,
+                np.int32).reshape(-1, 2),
+            'pointers'       : np.fromstring(pointers.decode('ascii'),
+                dtype=np.int64, sep=' '),
+            'faces'          : np.fromstring(faces.decode('ascii'),
+                dtype=np.int64, sep=' ').astype(np.int32),
+            'vertex_normals' : normals[: n],
+            'face_normals'   : normals[n :]
+            }
+    
+    
+    # get mesh levels of detail (None if not exported)
+    def lods(self, mesh):
+        
+        # check sections
+        prefix = self.scope + 'lod/' + mesh + '/'
+        keys = [k for k in self.keys('lod') if k.startswith(prefix)]
+        if not keys:
+            return None
+        
+        # split vertices and map (first lines) and faces
+        lods = []
+        for k in sorted(keys, key=lambda k : int(self.header(k)['level'])):
+            vertices, lut, faces = self.read(k).split(b'\n', 2)
+            faces = np.fromstring(faces.replace(b',', b' ').decode('ascii'),
+                dtype=np.int64, sep=' ').reshape(-1, 4).astype(np.int32)
+            lods.append({
+                'ratio'     : float(self.header(k)['ratio']),
+                'vertices'  : np.fromstring(vertices.decode('ascii'),
+                    dtype=np.int64, sep=' ').astype(np.int32),
+                'map'       : np.fromstring(lut.decode('ascii'),
+                    dtype=np.int64, sep=' ').astype(np.int32),
+                'faces'     : faces[:, : 3],
+                'materials' : faces[:, 3]
+                })
+        
+        return lods
+    
+    
+    # get animation track (puppet/NAME, mesh/NAME, or bone/NAME) as
+    # [frames,3,4] poses (key frame tracks are expanded)
+    def track(self, key):
+        
+        # read poses (values are column-major)
+        rows = self.rows(key)
+        if 'keys' not in self.header(key):
+            return rows.reshape(len(rows), 4, 3).transpose(0, 2, 1)
+        
+        # expand key frames
+        keys = rows[:, 0].astype(np.int64)
+        poses = rows[:, 1 :].reshape(len(rows), 4, 3).transpose(0, 2, 1)
+        nframes = int(self.header(self.keys('animation')[0])['frames'])
+        
+        return expand_track(keys, poses, nframes)
+
+
+# assemble materials from an indexed text file
+def text_materials(reader):
+    
+    # property values are numbers where possible
+    materials = []
+    for key in reader.keys('material'):
+        header = reader.header(key)
+        properties = {}
+        for name, value in list(header.items())[3 :]:
+            try:
+                properties[name] = float(value)
+            except ValueError:
+                properties[name] = value
+        materials.append({'name' : header['name'], 'duke' : properties})
+    
+    return materials
+
+
+# assemble puppet from an indexed text file (meshes and bones in the reader
+# scope); assembled maps mesh section keys to meshes, for crowd mesh instances
+def text_puppet(reader, key, materials, assembled):
+    
+    # meshes
+    meshes = []
+    for k in reader.keys('mesh'):
+        
+        # check scope
+        if not k.startswith(reader.scope):
+            continue
+        
+        # mesh instance (shares the shapes, faces, and topology of a mesh)
+        header = reader.header(k)
+        name = header['name']
+        visible = header['visible'] == 'True'
+        if 'instance' in header:
+            mesh = dict(assembled[header['instance']], name=name,
+                visible=visible, A_rest=reader.pose(k))
+            mesh.pop('skin', None)
+            if reader.skin(name) is not None:
+                mesh['skin'] = reader.skin(name)
+        
+        # mesh
+        else:
+            faces, indices = reader.faces(name)
+            mesh = {
+                'name'      : name,
+                'visible'   : visible,
+                'A_rest'    : reader.pose(k),
+                'shapes'    : [{'name' : s, 'vertices' : reader.shape(name, s)}
+                    for s in reader.shapes(name)],
+                'faces'     : faces,
+                'materials' : indices
+                }
+            if reader.skin(name) is not None:
+                mesh['skin'] = reader.skin(name)
+            if reader.topology(name) is not None:
+                mesh['topology'] = reader.topology(name)
+            if reader.lods(name) is not None:
+                mesh['lods'] = reader.lods(name)
+        
+        assembled[k] = mesh
+        meshes.append(mesh)
+    
+    # bones
+    bones = []
+    for k in reader.keys('bone'):
+        
+        # check scope
+        if not k.startswith(reader.scope):
+            continue
+        
+        header = reader.header(k)
+        groups = [reader.weights(header['name'], m['name'])
+            for m in meshes]
+        bones.append({
+            'name'     : header['name'],
+            'parent'   : header['parent'],
+            'children' : ' '.join(reader.lines(k)).split(),
+            'A_rest'   : reader.pose(k),
+            'indices'  : [g[0] for g in groups],
+            'weights'  : [g[1] for g in groups]
+            })
+    
+    return {
+        'name'      : reader.header(key)['name'],
+        'materials' : materials,
+        'meshes'    : meshes,
+        'bones'     : bones
+        }
+
+
+# get puppet at a level of detail (0 is full resolution; meshes without the
+# level keep full resolution); shapes, weights, and skinning matrices are
+# carried onto lod vertices by vertex correspondence (lod vertex i is mesh
+# vertex lod['vertices'][i]), and lod faces replace the mesh faces
+def lod_puppet(puppet, level):
+    
+    # full resolution
+    if level == 0:
+        return puppet
+    
+    # meshes
+    meshes = []
+    luts = []
+    for m in puppet['meshes']:
+        
+        # keep meshes without the level
+        lods = m.get('lods', [])
+        if level > len(lods):
+            meshes.append(m)
+            luts.append(None)
+            continue
+        
+        # shapes and faces
+        lod = lods[level - 1]
+        vertices = lod['vertices']
+        mesh = {k : v for k, v in m.items() if k not in ('lods', 'topology')}
+        mesh['shapes'] = [{'name' : s['name'],
+            'vertices' : np.asarray(s['vertices'])[vertices]}
+            for s in m['shapes']]
+        mesh['faces'] = lod['faces']
+        mesh['materials'] = lod['materials']
+        
+        # sparse skinning matrix rows of the lod vertices
+        if 'skin' in m:
+            skin = m['skin']
+            counts = np.diff(skin['pointers'])[vertices]
+            pointers = np.zeros(len(vertices) + 1, dtype=np.int64)
+            np.cumsum(counts, out=pointers[1 :])
+            entries = np.arange(pointers[-1]) + np.repeat(
+                skin['pointers'][vertices] - pointers[: -1], counts)
+            mesh['skin'] = {
+                'pointers' : pointers,
+                'bones'    : skin['bones'][entries],
+                'weights'  : skin['weights'][entries]
+                }
+        
+        # mesh vertex to lod vertex lookup (-1 if not a lod vertex)
+        lut = np.full(len(lod['map']), -1, dtype=np.int32)
+        lut[vertices] = np.arange(len(vertices), dtype=np.int32)
+        meshes.append(mesh)
+        luts.append(lut)
+    
+    # bone weights of the lod vertices (indices stay ascending)
+    bones = []
+    for b in puppet['bones']:
+        indices = []
+        weights = []
+        for i, lut in enumerate(luts):
+            if lut is None:
+                indices.append(b['indices'][i])
+                weights.append(b['weights'][i])
+            else:
+                j = lut[b['indices'][i]]
+                indices.append(j[j >= 0])
+                weights.append(np.asarray(b['weights'][i])[j >= 0])
+        bones.append(dict(b, indices=indices, weights=weights))
+    
+    return dict(puppet, meshes=meshes, bones=bones)
+
+
+# read text puppet, crowd, or animation (same structure as read_binary());
+# section byte offsets, if given, are indexed instead of the whole file (see
+# index_text())
+def read_text(path, cache=True, offsets=None):
+    
+    reader = DukeTextReader(path, cache, offsets)
+    if reader.keys('crowd'):
+        
+        # puppets (sharing materials, in their own scope)
+        materials = text_materials(reader)
+        assembled = {}
+        puppets = []
+        for key in reader.keys('puppet'):
+            reader.scope = key + '/'
+            puppets.append(text_puppet(reader, key, materials, assembled))
+        
+        return {
+            'name'      : reader.header(reader.keys('crowd')[0])['name'],
+            'materials' : materials,
+            'puppets'   : puppets
+            }
+    
+    elif reader.keys('puppet') and not reader.keys('animation'):
+        return text_puppet(reader, reader.keys('puppet')[0],
+            text_materials(reader), {})
+    
+    elif reader.keys('animation'):
+        
+        # tracks
+        header = reader.header(reader.keys('animation')[0])
+        return {
+            'name'   : header['name'],
+            'puppet' : header['puppet'],
+            'frames' : int(header['frames']),
+            'A'      : reader.track(reader.keys('puppet')[0]),
+            'meshes' : [{'name' : reader.header(k)['name'],
+                'A' : reader.track(k)} for k in reader.keys('mesh')],
+            'bones'  : [{'name' : reader.header(k)['name'],
+                'A' : reader.track(k)} for k in reader.keys('bone')]
+            }
+    
+    else:
+        raise ValueError('File \'%s\' incorrect format!' % path)
+
+
+# read evaluated mesh point cache (header and memory-mapped [frames,v,3]
+# vertex arrays, see duke_export.DukePointCache)
+def read_points(path, mmap=True):
+    
+    # read header
+    with open(path) as f:
+        header = json.load(f)
+    
+    # load mesh vertices
+    root = os.path.dirname(os.path.abspath(path))
+    for mesh in header['meshes']:
+        mesh['vertices'] = np.load(os.path.join(root, mesh['path']),
+            mmap_mode='r' if mmap else None)
+    
+    return header
+
+
+# read animation frame window manifest (see duke_export iter_windows())
+def read_windows(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# read the animation frame window holding a 0-based frame, from a window
+# manifest; the window animation gets the 0-based index of its 'first' frame
+# (text windows are indexed at the manifest track byte offsets, not scanned)
+def read_window(path, frame, mmap=True):
+    
+    # find window
+    manifest = read_windows(path)
+    windows = manifest['windows']
+    if not 0 <= frame < manifest['frames']:
+        raise IndexError('Frame %d out of range!' % frame)
+    window = windows[bisect.bisect_right([w['first'] for w in windows],
+        frame) - 1]
+    
+    # read window animation
+    root = os.path.dirname(os.path.abspath(path))
+    window_path = os.path.join(root, window['path'])
+    if manifest['format'] == 'binary':
+        animation = read_binary(window_path, mmap)
+    else:
+        animation = read_text(window_path, offsets=[0] + window['offsets'])
+    animation['first'] = window['first']
+    
+    return animation
+
+
+# read duke binary puppet or animation
+def read_binary(path, mmap=True):
+    
+    # read sections
+    table, arrays = read_sections(path, mmap)
+    
+    # assemble by type
+    if table['type'] == 'puppet':
+        return make_puppet(table['meta'], arrays)
+    elif table['type'] == 'animation':
+        return make_animation(table['meta'], arrays)
+    elif table['type'] == 'crowd':
+        return make_crowd(table['meta'], arrays)
+    else:
+        raise ValueError('File \'%s\' incorrect format!' % path)
+
+
+#==============================================================================#
+#                                                                              #
+#                                                                              #
+#                                                                              #
+#==============================================================================#
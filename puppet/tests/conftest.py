@@ -0,0 +1,21 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - pytest configuration
+#
+# Installs the 'duke_bench.py' stand-in bpy and mathutils modules, so that
+# 'duke_export.py' imports without Blender, and puts the add-on directory on
+# the module path.
+
+# import
+import os
+import sys
+
+# add-on directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# stand-in blender modules (before duke_export is imported)
+import duke_bench
+duke_bench.install()
@@ -0,0 +1,90 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - animation bakes (parallel bake chunks)
+
+# import
+import sys
+import numpy as np
+import pytest
+import duke_export
+
+
+# stub bake worker (saves [frames,1,3,4] poses filled with the frame number;
+# fails on the frame range starting at a given frame)
+WORKER = '''
+import sys
+import numpy as np
+start, end, output, fail = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3], \\
+    int(sys.argv[4])
+if start == fail:
+    print('stub worker failed at frame', start)
+    sys.exit(1)
+frames = np.arange(start, end + 1, dtype=np.float64)
+np.save(output, np.broadcast_to(frames[:, None, None, None],
+    (len(frames), 1, 3, 4)))
+'''
+
+
+# bake frames start..end with the stub worker
+def bake(tmp_path, start, end, workers, fail=-1):
+    script = tmp_path / 'worker.py'
+    script.write_text(WORKER)
+    command = '{python} {script} {start} {end} {output} {fail}'
+    return duke_export.bake_chunks(command, 'unused.blend', 'Scene', ['Rig'],
+        start, end, workers, str(tmp_path), python=sys.executable,
+        script=str(script), fail=fail)
+
+
+@pytest.mark.parametrize('start, end, workers', [
+    (1, 10, 3), (5, 5, 4), (0, 99, 7), (1, 3, 8)])
+def test_bake_chunks_merges_frames_in_order(tmp_path, start, end, workers):
+    poses = bake(tmp_path, start, end, workers)
+    assert poses.shape == (end - start + 1, 1, 3, 4)
+    assert np.array_equal(poses[:, 0, 0, 0], np.arange(start, end + 1))
+
+
+def test_bake_chunks_reports_failed_worker(tmp_path):
+    with pytest.raises(RuntimeError) as error:
+        bake(tmp_path, 1, 12, 3, fail=5)
+    assert 'frames 5-8' in str(error.value)
+    assert 'stub worker failed at frame 5' in str(error.value)
+
+
+def test_bake_chunks_pass_all_armatures(tmp_path):
+    
+    # stub worker saving one track per armature (json list argument)
+    script = tmp_path / 'worker.py'
+    script.write_text(
+        'import json, sys\n'
+        'import numpy as np\n'
+        'names = json.loads(sys.argv[1])\n'
+        'np.save(sys.argv[2], np.zeros((2, len(names), 3, 4)))\n')
+    command = '{python} {script} {armatures} {output}'
+    poses = duke_export.bake_chunks(command, 'unused.blend', 'Scene',
+        ['Rig A', 'Rig, B', 'Rig"C'], 1, 8, 2, str(tmp_path),
+        python=sys.executable, script=str(script))
+    assert poses.shape == (4, 3, 3, 4)
+
+
+def test_bake_chunks_poll_and_kill_workers_on_close(tmp_path, monkeypatch):
+    
+    # record started workers
+    processes = []
+    popen = duke_export.subprocess.Popen
+    def start(*args, **kwargs):
+        processes.append(popen(*args, **kwargs))
+        return processes[-1]
+    monkeypatch.setattr(duke_export.subprocess, 'Popen', start)
+    
+    # workers that never finish (waits yield, closing kills them)
+    command = '{python} -c "import time; time.sleep(60)"'
+    steps = duke_export.iter_bake_chunks(command, 'unused.blend', 'Scene',
+        ['Rig'], 1, 8, 2, str(tmp_path), python=sys.executable)
+    assert next(steps) is duke_export.WAITING
+    assert next(steps) is duke_export.WAITING
+    steps.close()
+    assert len(processes) == 2
+    assert all(p.poll() is not None for p in processes)
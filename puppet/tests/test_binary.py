@@ -0,0 +1,203 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - duke binary files (round trip against text files)
+
+# import
+import sys
+import numpy as np
+import pytest
+import duke_bench
+import duke_export
+import duke_reader
+
+
+# first frame (not 0, bakes are indexed relative to it)
+START = 3
+
+
+# scene posing the rig and its mesh world matrices per frame (also on update,
+# as blender re-evaluates the current frame)
+class PointScene(duke_bench.Scene):
+    
+    def frame_set(self, frame):
+        duke_bench.Scene.frame_set(self, frame)
+        for c in self.rig.armature.children:
+            c.matrix_world = c.matrix_local.copy()
+    
+    def update(self):
+        self.frame_set(self.frame_current)
+
+
+# evaluated mesh vertices at a frame (basis coordinates moved by a stand-in
+# modifier)
+def evaluate(data, frame):
+    co = data.vertices.arrays['co']
+    return co + np.float32(0.1 * np.sin(frame)) * co[:, [1, 2, 0]]
+
+
+# export a rig (default settings, with options) and read it back
+def export(tmp_path, monkeypatch, file_format, **options):
+    
+    tmp_path.mkdir()
+    rig = duke_bench.Rig(vertices=40, shapes=2, bones=8, weights=3,
+        materials=3, meshes=2, seed=6)
+    monkeypatch.setattr(sys.modules['bpy'].data, 'materials',
+        duke_bench.Collection(rig.materials))
+    scene = PointScene('Scene', rig, START + 6)
+    scene.frame_start = START
+    scene.frame_set(START)
+    
+    # evaluated meshes (a copy of the mesh vertices, moved per frame)
+    for c in rig.armature.children:
+        c.to_mesh = (lambda data : lambda scene, apply_modifiers, settings :
+            duke_bench.Block(vertices=duke_bench.Collection(arrays={'co' :
+            evaluate(data, scene.frame_current)},
+            length=len(data.vertices))))(c.data)
+    
+    # export
+    scene.duke = duke_bench.Block(**{k : v for k, v in
+        vars(duke_export.DukeData).items() if not k.startswith('_')})
+    extension = '.txt' if file_format == 'TEXT' else '.duke'
+    scene.duke.file_format = file_format
+    scene.duke.puppet_path = str(tmp_path / ('puppet' + extension))
+    scene.duke.animation_path = str(tmp_path / ('animation' + extension))
+    scene.duke.points_path = str(tmp_path / 'points.json')
+    for k, v in options.items():
+        setattr(scene.duke, k, v)
+    duke_export.DukeExport().export(scene, rig.armature)
+    if file_format == 'TEXT':
+        puppet = duke_reader.read_text(scene.duke.puppet_path, cache=False)
+        animation = duke_reader.read_text(scene.duke.animation_path,
+            cache=False)
+    else:
+        puppet = duke_reader.read_binary(scene.duke.puppet_path)
+        animation = duke_reader.read_binary(scene.duke.animation_path)
+    
+    return scene, rig, puppet, animation
+
+
+# assert nested structures are equal (floating point arrays to the text float
+# format)
+def assert_close(x, y, path=''):
+    if isinstance(x, dict):
+        assert set(x) == set(y), path
+        for k in x:
+            assert_close(x[k], y[k], path + '/' + k)
+    elif isinstance(x, list):
+        assert len(x) == len(y), path
+        for i, (u, v) in enumerate(zip(x, y)):
+            assert_close(u, v, path + '/' + str(i))
+    elif isinstance(x, np.ndarray):
+        assert x.shape == y.shape, path
+        if x.dtype.kind == 'f':
+            assert np.allclose(x, y, rtol=1e-6, atol=1e-6), path
+        else:
+            assert np.array_equal(x, y), path
+    else:
+        assert x == y, path
+
+
+def test_binary_matches_text(tmp_path, monkeypatch):
+    
+    _, _, puppet, animation = export(tmp_path / 'text', monkeypatch, 'TEXT',
+        skin_enable=True)
+    _, _, binary_puppet, binary_animation = export(tmp_path / 'binary',
+        monkeypatch, 'BINARY', skin_enable=True)
+    assert_close(binary_puppet, puppet)
+    assert_close(binary_animation, animation)
+
+
+# rows of a pose matrix as a [3,4] array
+def pose(matrix):
+    return np.array([matrix[0][:], matrix[1][:], matrix[2][:]])
+
+
+@pytest.mark.parametrize('file_format', ['TEXT', 'BINARY'])
+@pytest.mark.parametrize('spill_frames', [0, 2])
+def test_bake_is_relative_to_first_frame(tmp_path, monkeypatch, file_format,
+    spill_frames):
+    
+    # record pose array types
+    allocate = duke_export.DukeExport.allocate_poses
+    spilled = []
+    def allocate_poses(self, scene, shape):
+        poses = allocate(self, scene, shape)
+        spilled.append(isinstance(poses, np.memmap))
+        return poses
+    monkeypatch.setattr(duke_export.DukeExport, 'allocate_poses',
+        allocate_poses)
+    
+    scene, rig, puppet, animation = export(tmp_path / 'out', monkeypatch,
+        file_format, spill_frames=spill_frames)
+    assert spilled and all(spilled) == bool(spill_frames)
+    
+    # one track row per frame, row k is frame START + k
+    nframes = scene.frame_end - scene.frame_start + 1
+    assert animation['frames'] == nframes
+    assert animation['A'].shape == (nframes, 3, 4)
+    for k in range(nframes):
+        rig.pose(START + k)
+        assert np.allclose(animation['A'][k], pose(rig.armature.matrix_world),
+            atol=1e-6)
+        for c, mesh in zip(rig.armature.children, animation['meshes']):
+            assert np.allclose(mesh['A'][k], pose(c.matrix_local), atol=1e-6)
+    
+    # memory-mapped (spilled) bakes write the same file
+    if spill_frames:
+        memory = export(tmp_path / 'memory', monkeypatch, file_format,
+            spill_frames=0)[0]
+        with open(scene.duke.animation_path, 'rb') as f:
+            data = f.read()
+        with open(memory.duke.animation_path, 'rb') as f:
+            assert f.read() == data
+
+
+@pytest.mark.parametrize('file_format', ['TEXT', 'BINARY'])
+def test_weights_match_vertex_groups(tmp_path, monkeypatch, file_format):
+    
+    _, rig, puppet, _ = export(tmp_path / 'out', monkeypatch, file_format)
+    rename = duke_export.DukeExport().rename
+    for k, c in enumerate(rig.armature.children):
+        
+        # vertex group entries of each bone (scanned per vertex)
+        entries = {rename(g.name) : ([], []) for g in c.vertex_groups}
+        for v in c.data.vertices:
+            for g in v.groups:
+                name = rename(c.vertex_groups[g.group].name)
+                entries[name][0].append(v.index)
+                entries[name][1].append(g.weight)
+        
+        # bone weights (from the inverted index) are the entries in vertex
+        # order, for every deformation bone
+        for b in puppet['bones']:
+            indices, weights = entries[b['name']]
+            assert indices
+            assert np.array_equal(b['indices'][k], indices)
+            assert np.array_equal(b['weights'][k],
+                np.array(weights, dtype=np.float32))
+
+
+def test_points_match_evaluated_vertices(tmp_path, monkeypatch):
+    
+    scene, rig, _, _ = export(tmp_path / 'out', monkeypatch, 'BINARY',
+        points_enable=True)
+    points = duke_reader.read_points(scene.duke.points_path)
+    nframes = scene.frame_end - scene.frame_start + 1
+    assert points['start'] == START and points['frames'] == nframes
+    
+    # one memory-mapped [frames,v,3] cache per mesh, row k is the evaluated
+    # mesh of frame START + k in world coordinates
+    for c, mesh in zip(rig.armature.children, points['meshes']):
+        vertices = mesh['vertices']
+        assert isinstance(vertices, np.memmap)
+        assert vertices.dtype == np.float32
+        assert vertices.shape == (nframes, len(c.data.vertices), 3)
+        for k in range(nframes):
+            scene.frame_set(START + k)
+            A = pose(c.matrix_world)
+            co = np.dot(evaluate(c.data, START + k), A[:, :3].T) + A[:, 3]
+            assert np.allclose(vertices[k], co, atol=1e-6)
+        assert not np.allclose(vertices[0], vertices[-1])
@@ -0,0 +1,153 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - export section cache
+
+# import
+import json
+import multiprocessing
+import pickle
+import sys
+import duke_bench
+import duke_export
+
+
+# text puppet export of a small rig, with the export cache enabled
+def make_scene(tmp_path, monkeypatch):
+    
+    rig = duke_bench.Rig(vertices=30, shapes=2, bones=6, weights=2,
+        materials=2, meshes=2, seed=0)
+    monkeypatch.setattr(sys.modules['bpy'].data, 'materials',
+        duke_bench.Collection(rig.materials))
+    scene = duke_bench.Scene('Scene', rig, 4)
+    scene.duke = duke_bench.Block(**{k : v for k, v in
+        vars(duke_export.DukeData).items() if not k.startswith('_')})
+    scene.duke.file_format = 'TEXT'
+    scene.duke.puppet_enable = True
+    scene.duke.animation_enable = False
+    scene.duke.skin_enable = True
+    scene.duke.cache_enable = True
+    scene.duke.puppet_path = str(tmp_path / 'puppet.out')
+    
+    return scene, rig
+
+
+# export puppet (returns its text and the saved cache)
+def export(scene, rig, monkeypatch):
+    caches = []
+    save = duke_export.DukeCache.save
+    def record(cache):
+        caches.append(cache)
+        save(cache)
+    monkeypatch.setattr(duke_export.DukeCache, 'save', record)
+    duke_export.DukeExport().export(scene, rig.armature)
+    with open(scene.duke.puppet_path) as f:
+        return f.read(), caches[0]
+
+
+def test_cache_reuses_sections(tmp_path, monkeypatch):
+    
+    scene, rig = make_scene(tmp_path, monkeypatch)
+    first, cache = export(scene, rig, monkeypatch)
+    assert cache.hits == 0
+    second, cache = export(scene, rig, monkeypatch)
+    assert cache.hits == len(cache.sections)
+    assert cache.misses == 0
+    assert second == first
+    
+    # same text as uncached
+    scene.duke.cache_enable = False
+    duke_export.DukeExport().export(scene, rig.armature)
+    with open(scene.duke.puppet_path) as f:
+        assert f.read() == first
+
+
+def test_cache_is_json(tmp_path, monkeypatch):
+    scene, rig = make_scene(tmp_path, monkeypatch)
+    export(scene, rig, monkeypatch)
+    with open(scene.duke.puppet_path + '.cache') as f:
+        data = json.load(f)
+    assert data['version'] == duke_export.FORMAT_VERSION
+    assert all(len(entry) == 3 for entry in data['sections'])
+
+
+def test_cache_ignores_pickles_and_malformed_files(tmp_path, monkeypatch):
+    
+    scene, rig = make_scene(tmp_path, monkeypatch)
+    expected, _ = export(scene, rig, monkeypatch)
+    path = scene.duke.puppet_path + '.cache'
+    
+    # pickled and malformed caches start empty (and are replaced)
+    with open(path, 'wb') as f:
+        pickle.dump({'version' : duke_export.FORMAT_VERSION, 'sections' : {}},
+            f)
+    text, cache = export(scene, rig, monkeypatch)
+    assert cache.hits == 0 and text == expected
+    with open(path, 'w') as f:
+        json.dump({'version' : duke_export.FORMAT_VERSION,
+            'sections' : [['material/Material.000', 'hash', 7]]}, f)
+    text, cache = export(scene, rig, monkeypatch)
+    assert cache.hits == 0 and text == expected
+
+
+def test_cache_format_version_invalidates_sections(tmp_path, monkeypatch):
+    
+    scene, rig = make_scene(tmp_path, monkeypatch)
+    expected, _ = export(scene, rig, monkeypatch)
+    
+    # sections stored under another format version are formatted again
+    with open(scene.duke.puppet_path + '.cache') as f:
+        data = json.load(f)
+    for entry in data['sections']:
+        entry[2] = 'stale\n'
+    with open(scene.duke.puppet_path + '.cache', 'w') as f:
+        json.dump(data, f)
+    monkeypatch.setattr(duke_export, 'FORMAT_VERSION',
+        duke_export.FORMAT_VERSION + 1)
+    text, cache = export(scene, rig, monkeypatch)
+    assert cache.hits == 0 and text == expected
+    
+    # and the version is part of the section hashes
+    with open(scene.duke.puppet_path + '.cache') as f:
+        data = json.load(f)
+    data['version'] -= 1
+    for entry in data['sections']:
+        entry[2] = 'stale\n'
+    with open(scene.duke.puppet_path + '.cache', 'w') as f:
+        json.dump(data, f)
+    monkeypatch.setattr(duke_export, 'FORMAT_VERSION',
+        duke_export.FORMAT_VERSION - 1)
+    text, cache = export(scene, rig, monkeypatch)
+    assert cache.hits == 0 and text == expected
+
+
+def test_pooled_sections_match_serial(tmp_path, monkeypatch):
+    
+    scene, rig = make_scene(tmp_path, monkeypatch)
+    scene.duke.lod_enable = True
+    monkeypatch.setattr(duke_export, 'CHUNK', 16)
+    scene.duke.cache_enable = False
+    duke_export.DukeExport().export(scene, rig.armature)
+    with open(scene.duke.puppet_path) as f:
+        expected = f.read()
+    
+    # record section buffers of cache misses
+    buffers = []
+    open_section = duke_export.DukeExport.open_section
+    def record(exporter):
+        buffers.append(open_section(exporter))
+        return buffers[-1]
+    monkeypatch.setattr(duke_export.DukeExport, 'open_section', record)
+    
+    # pooled, uncached then cached (misses, then hits)
+    scene.duke.format_workers = 2
+    for cache_enable in (False, True, True):
+        scene.duke.cache_enable = cache_enable
+        duke_export.DukeExport().export(scene, rig.armature)
+        with open(scene.duke.puppet_path) as f:
+            assert f.read() == expected
+    assert buffers
+    if 'fork' in multiprocessing.get_all_start_methods():
+        assert all(isinstance(b, duke_export.DukeFormatFile) for b in buffers)
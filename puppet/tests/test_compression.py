@@ -0,0 +1,40 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - output compression (compressor and decompressor registration)
+
+# import
+import gzip
+import duke_export
+import duke_reader
+
+
+def test_registered_compressor_is_listed_and_read(tmp_path, monkeypatch):
+    
+    # register compressor and decompressor (removed after the test)
+    monkeypatch.setitem(duke_export.COMPRESSORS, 'TEST', ('.test',
+        lambda path, mode, level : gzip.open(path, mode, compresslevel=level)))
+    monkeypatch.setitem(duke_reader.DECOMPRESSORS, '.test', gzip.open)
+    
+    # listed by the compression enum items (read when drawn)
+    items = duke_export.compression_items(None, None)
+    assert [item[0] for item in items] == ['NONE'] + list(
+        duke_export.COMPRESSORS)
+    assert items[-1] == ('TEST', 'Test', 'test compression (.test)')
+    
+    # written compressed and read back
+    path = str(tmp_path / 'puppet.out')
+    with duke_export.open_output(path, 'w', 'TEST') as f:
+        f.write('type : puppet\n')
+    assert duke_reader.is_compressed(path + '.test')
+    with duke_reader.open_file(path + '.test') as f:
+        assert f.read() == 'type : puppet\n'
+    with open(path + '.test', 'rb') as f:
+        assert f.read(2) == b'\x1f\x8b'
+
+
+def test_reader_decompresses_every_compressor():
+    for extension, _ in duke_export.COMPRESSORS.values():
+        assert extension in duke_reader.DECOMPRESSORS
@@ -0,0 +1,183 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - crowd export (round trip against single exports)
+
+# import
+import sys
+import numpy as np
+import pytest
+import duke_bench
+import duke_export
+import duke_reader
+
+
+# scene posing every crowd rig per frame (also on update, as blender
+# re-evaluates the current frame)
+class CrowdScene(duke_bench.Scene):
+    
+    def frame_set(self, frame):
+        self.frame_current = frame
+        for k, rig in enumerate(self.rigs):
+            rig.pose(frame + 1000 * k)
+    
+    def update(self):
+        self.frame_set(self.frame_current)
+
+
+# two rig crowd (the second rig's last mesh uses the first rig's mesh data,
+# all rigs share the materials) with default settings
+def make_crowd(tmp_path, monkeypatch, file_format):
+    
+    rigs = [duke_bench.Rig(vertices=40, shapes=2, bones=6, weights=2,
+        materials=3, meshes=2, seed=seed) for seed in (0, 1)]
+    rigs[1].armature.name = 'Second'
+    for c in rigs[1].armature.children:
+        c.name = 'Second' + c.name
+        c.data.name = 'Second' + c.data.name
+        c.data.materials = duke_bench.Collection(rigs[0].materials)
+    rigs[1].armature.children[1].data = rigs[0].armature.children[0].data
+    for rig in rigs:
+        rig.armature.select = True
+    
+    # register data
+    bpy = sys.modules['bpy']
+    monkeypatch.setattr(bpy.data, 'materials',
+        duke_bench.Collection(rigs[0].materials))
+    monkeypatch.setattr(bpy.data, 'objects', duke_bench.Collection([o
+        for rig in rigs for o in [rig.armature] + rig.armature.children]))
+    
+    # scene
+    scene = CrowdScene('Scene', rigs[0], 6)
+    scene.rigs = rigs
+    scene.update()
+    scene.objects = [rig.armature for rig in reversed(rigs)]
+    scene.duke = duke_bench.Block(**{k : v for k, v in
+        vars(duke_export.DukeData).items() if not k.startswith('_')})
+    extension = '.txt' if file_format == 'TEXT' else '.duke'
+    scene.duke.file_format = file_format
+    scene.duke.puppet_enable = True
+    scene.duke.animation_enable = True
+    scene.duke.skin_enable = True
+    scene.duke.puppet_path = str(tmp_path / ('puppet' + extension))
+    scene.duke.animation_path = str(tmp_path / ('animation' + extension))
+    
+    return scene, rigs
+
+
+# read an exported file
+def read(path):
+    if '.txt' in path:
+        return duke_reader.read_text(path, cache=False)
+    return duke_reader.read_binary(path)
+
+
+# assert nested puppet structures are equal
+def assert_equal(x, y, path=''):
+    if isinstance(x, dict):
+        assert set(x) == set(y), path
+        for k in x:
+            assert_equal(x[k], y[k], path + '/' + k)
+    elif isinstance(x, list):
+        assert len(x) == len(y), path
+        for i, (u, v) in enumerate(zip(x, y)):
+            assert_equal(u, v, path + '/' + str(i))
+    elif isinstance(x, np.ndarray):
+        assert np.array_equal(x, y), path
+    else:
+        assert x == y, path
+
+
+# export the crowd, then each rig alone (returns the crowd and single
+# puppet and animation file contents)
+def export_crowd(tmp_path, monkeypatch, file_format):
+    
+    # crowd
+    scene, rigs = make_crowd(tmp_path, monkeypatch, file_format)
+    scene.duke.crowd_enable = True
+    duke_export.DukeExport().export(scene, rigs[0].armature)
+    crowd = read(scene.duke.puppet_path)
+    animations = []
+    for rig in rigs:
+        path = duke_export.member_path(scene.duke.animation_path,
+            rig.armature.name)
+        with open(path, 'rb') as f:
+            animations.append(f.read())
+    
+    # single exports
+    puppets = []
+    singles = []
+    scene.duke.crowd_enable = False
+    for rig in rigs:
+        scene.duke.puppet_path += '.single'
+        scene.duke.animation_path += '.single'
+        duke_export.DukeExport().export(scene, rig.armature)
+        puppets.append(read(scene.duke.puppet_path))
+        with open(scene.duke.animation_path, 'rb') as f:
+            singles.append(f.read())
+    
+    return crowd, animations, puppets, singles
+
+
+@pytest.mark.parametrize('file_format', ['TEXT', 'BINARY'])
+def test_crowd_matches_single_exports(tmp_path, monkeypatch, file_format):
+    
+    crowd, animations, puppets, singles = export_crowd(tmp_path,
+        monkeypatch, file_format)
+    
+    # puppets (shared materials, mesh data written once)
+    assert len(crowd['puppets']) == 2
+    for puppet, single in zip(crowd['puppets'], puppets):
+        assert_equal(puppet, single)
+    assert_equal(crowd['materials'], puppets[0]['materials'])
+    shared = crowd['puppets'][1]['meshes'][1]['faces']
+    assert np.shares_memory(shared, crowd['puppets'][0]['meshes'][0]['faces'])
+    
+    # animations (one per rig)
+    assert animations == singles
+
+
+def test_crowd_text_puppets_note_shared_materials(tmp_path, monkeypatch):
+    scene, rigs = make_crowd(tmp_path, monkeypatch, 'TEXT')
+    scene.duke.crowd_enable = True
+    duke_export.DukeExport().export(scene, rigs[0].armature)
+    reader = duke_reader.DukeTextReader(scene.duke.puppet_path, cache=False)
+    assert len(reader.keys('material')) == 3
+    for key in reader.keys('puppet'):
+        assert reader.header(key)['materials'] == '3'
+        assert reader.header(key)['material sections'] == 'crowd'
+
+
+def test_crowd_parallel_bake_saves_and_sweeps_once(tmp_path, monkeypatch):
+    
+    # serial crowd animations
+    scene, rigs = make_crowd(tmp_path, monkeypatch, 'TEXT')
+    scene.duke.crowd_enable = True
+    duke_export.DukeExport().export(scene, rigs[0].armature)
+    paths = [duke_export.member_path(scene.duke.animation_path,
+        rig.armature.name) for rig in rigs]
+    serial = [open(path, 'rb').read() for path in paths]
+    
+    # workers stand in by baking all armatures in this process
+    saves = []
+    calls = []
+    bpy = sys.modules['bpy']
+    monkeypatch.setattr(bpy.ops.wm, 'save_as_mainfile',
+        lambda filepath, copy=False : saves.append(filepath))
+    def bake_chunks(command, blend, name, armatures, start, end, workers,
+        directory, **fields):
+        calls.append(armatures)
+        yield duke_export.WAITING
+        objects = [bpy.data.objects[a] for a in armatures]
+        return duke_export.DukeExport().bake_armatures(scene, objects, start,
+            end)
+    monkeypatch.setattr(duke_export, 'iter_bake_chunks', bake_chunks)
+    
+    # parallel crowd animations
+    scene.duke.bake_workers = 4
+    duke_export.DukeExport().export(scene, rigs[0].armature)
+    assert len(saves) == 1
+    assert calls == [[rig.armature.name for rig in rigs]]
+    assert [open(path, 'rb').read() for path in paths] == serial
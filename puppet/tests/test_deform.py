@@ -0,0 +1,65 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - deformation (sparse skinning and frame chunks)
+
+# import
+import numpy as np
+import pytest
+import duke_deform
+
+
+# random puppet of one mesh (bone weight groups and the matching sparse
+# skinning matrix, some vertices unweighted) and animation
+def make_puppet(nvertices=200, nbones=6, nframes=50, seed=0):
+    
+    rng = np.random.default_rng(seed)
+    pose = lambda *shape : np.concatenate([np.linalg.qr(rng.normal(
+        size=shape + (3, 3)))[0], rng.normal(size=shape + (3, 1))], axis=-1)
+    
+    # weights (up to three bones per vertex)
+    groups = [[] for _ in range(nbones)]
+    pointers, indices, values = [0], [], []
+    for v in range(nvertices):
+        for j in sorted(rng.choice(nbones, rng.integers(0, 4), replace=False)):
+            w = float(rng.random())
+            groups[j].append((v, w))
+            indices.append(j)
+            values.append(w)
+        pointers.append(len(indices))
+    skin = {'pointers' : np.array(pointers, dtype=np.int64),
+        'bones' : np.array(indices, dtype=np.int32),
+        'weights' : np.array(values, dtype=np.float32)}
+    bones = [{'name' : 'Bone_%i' % j, 'A_rest' : pose(),
+        'indices' : [np.array([v for v, _ in g], dtype=np.int32)],
+        'weights' : [np.array([w for _, w in g], dtype=np.float32)]}
+        for j, g in enumerate(groups)]
+    
+    mesh = {'name' : 'Mesh', 'visible' : True, 'A_rest' : pose(),
+        'shapes' : [{'vertices' : rng.normal(size=(nvertices, 3))}]}
+    puppet = {'name' : 'Puppet', 'meshes' : [mesh], 'bones' : bones}
+    animation = {'frames' : nframes, 'A' : pose(nframes),
+        'meshes' : [{'A' : pose(nframes)}],
+        'bones' : [{'A' : pose(nframes)} for _ in bones]}
+    
+    return puppet, animation, skin
+
+
+def test_sparse_skinning_matches_weight_groups():
+    puppet, animation, skin = make_puppet()
+    expected = duke_deform.deform(puppet, animation)[0]
+    puppet['meshes'][0]['skin'] = skin
+    assert np.allclose(duke_deform.deform(puppet, animation)[0], expected)
+
+
+@pytest.mark.parametrize('workers, chunk', [(0, 7), (0, 64), (2, 16)])
+def test_frame_chunks_match_single_chunk(workers, chunk):
+    puppet, animation, skin = make_puppet()
+    puppet['meshes'][0]['skin'] = skin
+    expected = duke_deform.deform(puppet, animation, chunk=1000)[0]
+    vertices = duke_deform.deform(puppet, animation, workers=workers,
+        chunk=chunk)[0]
+    assert vertices.shape == (50, 200, 3)
+    assert np.allclose(vertices, expected)
@@ -0,0 +1,203 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - fast bake (f-curve evaluation against scene evaluation)
+
+# import
+import numpy as np
+import pytest
+import duke_bench
+import duke_export
+
+
+# rotation modes (channel property, channel count)
+MODES = [
+    ('QUATERNION', 'rotation_quaternion', 4),
+    ('AXIS_ANGLE', 'rotation_axis_angle', 4),
+    ('XYZ', 'rotation_euler', 3),
+    ('ZXY', 'rotation_euler', 3),
+    ('YZX', 'rotation_euler', 3)
+    ]
+
+
+# 4x4 rotation about an axis by an angle (rodrigues)
+def axis_rotation(axis, angle):
+    axis = np.asarray(axis, dtype=np.float64)
+    norm = np.linalg.norm(axis)
+    if norm == 0.0:
+        return np.eye(4)
+    x, y, z = axis / norm
+    K = np.array([[0.0, -z, y], [z, 0.0, -x], [-y, x, 0.0]])
+    M = np.eye(4)
+    M[:3, :3] = np.eye(3) + np.sin(angle) * K + (1.0 - np.cos(angle)) * K @ K
+    return M
+
+
+# 4x4 local channel transform of a pose bone (translation, rotation, scale)
+def channel_matrix(b):
+    
+    # rotation
+    if b.rotation_mode == 'QUATERNION':
+        w, x, y, z = b.rotation_quaternion
+        norm = np.sqrt(w * w + x * x + y * y + z * z)
+        R = axis_rotation((x, y, z), 2.0 * np.arctan2(
+            np.sqrt(x * x + y * y + z * z), w)) if norm else np.eye(4)
+    elif b.rotation_mode == 'AXIS_ANGLE':
+        R = axis_rotation(b.rotation_axis_angle[1 :],
+            b.rotation_axis_angle[0])
+    else:
+        R = np.eye(4)
+        for axis in b.rotation_mode:
+            i = 'XYZ'.index(axis)
+            R = axis_rotation(np.eye(3)[i], b.rotation_euler[i]) @ R
+    
+    # translation and scale
+    T = np.eye(4)
+    T[:3, 3] = b.location
+    S = np.diag(list(b.scale) + [1.0])
+    
+    return T @ R @ S
+
+
+# scene evaluating the rig action bone f-curves per frame (4x4 matrices,
+# parents before children), and moving bone parented meshes with their bones
+class EvaluatedScene(duke_bench.Scene):
+    
+    def frame_set(self, frame):
+        self.frame_current = frame
+        bones = {b.name : b for b in self.rig.bones}
+        for fc in self.rig.armature.animation_data.action.fcurves:
+            if not fc.data_path.startswith('pose.bones['):
+                continue
+            name, prop = fc.data_path[len('pose.bones["') :].split('"].')
+            getattr(bones[name], prop)[fc.array_index] = fc.evaluate(frame)
+        for b in self.rig.bones:
+            rest = np.array(b.bone.matrix_local.rows)
+            if b.parent is None:
+                M = rest @ channel_matrix(b)
+            else:
+                parent_rest = np.array(b.parent.bone.matrix_local.rows)
+                M = (np.array(b.parent.matrix.rows) @
+                    np.linalg.inv(parent_rest) @ rest @ channel_matrix(b))
+            b.matrix = duke_bench.Matrix(M)
+        for c in self.rig.armature.children:
+            if c.parent_type == 'BONE':
+                c.matrix_local = duke_bench.Matrix(np.array(
+                    bones[c.parent_bone].matrix.rows) @ c.bone_offset)
+
+
+# small rig with mixed rotation modes and non-uniform scale f-curves
+def make_scene(frames=24, seed=1):
+    
+    rig = duke_bench.Rig(vertices=8, shapes=0, bones=12, weights=2,
+        materials=1, meshes=1, seed=seed)
+    rng = np.random.default_rng(seed)
+    fcurves = []
+    for i, b in enumerate(rig.bones):
+        mode, rotation, n = MODES[i % len(MODES)]
+        b.rotation_mode = mode
+        b.rotation_quaternion = [1.0, 0.0, 0.0, 0.0]
+        b.rotation_axis_angle = [0.0, 0.0, 1.0, 0.0]
+        b.rotation_euler = [0.0, 0.0, 0.0]
+        for prop, count in (('location', 3), (rotation, n), ('scale', 3)):
+            for j in range(count):
+                value = getattr(b, prop)[j]
+                fcurves.append(duke_bench.FCurve(b.path_from_id(prop), j,
+                    value, float(rng.uniform(0.1, 0.5)),
+                    float(rng.uniform(0.05, 0.5))))
+    rig.armature.animation_data.action.fcurves = fcurves
+    
+    scene = EvaluatedScene('Scene', rig, frames)
+    scene.duke = duke_bench.Block(spill_frames=0, fast_bake=True,
+        bake_workers=1)
+    
+    return scene, rig
+
+
+def test_fast_bake_matches_scene_evaluation():
+    scene, rig = make_scene()
+    exporter = duke_export.DukeExport()
+    assert exporter.fast_bake_blocker(scene, rig.armature, rig.bones) is None
+    fast = exporter.fast_bake(scene, rig.armature, rig.bones)
+    serial = exporter.bake_animation(scene, rig.armature, rig.bones)
+    assert fast.shape == serial.shape
+    assert np.allclose(fast, serial, atol=1e-9)
+
+
+# scene changes that block the fast bake (reason, change)
+def constrain_bone(rig):
+    rig.bones[3].constraints = [duke_bench.Block(type='COPY_ROTATION')]
+
+def add_ik(rig):
+    rig.bones[-1].constraints = [duke_bench.Block(type='IK', chain_count=2)]
+
+def constrain_armature(rig):
+    rig.armature.constraints = [duke_bench.Block(type='CHILD_OF')]
+
+def add_driver(rig):
+    rig.armature.animation_data.drivers = [duke_bench.FCurve(
+        rig.bones[0].path_from_id('location'), 0, 0.0, 1.0, 1.0)]
+
+def add_nla_track(rig):
+    rig.armature.animation_data.nla_tracks = [duke_bench.Block(name='Track')]
+
+def blend_action(rig):
+    rig.armature.animation_data.action_blend_type = 'ADD'
+
+def animate_object(rig):
+    rig.armature.animation_data.action.fcurves.append(
+        duke_bench.FCurve('location', 0, 0.0, 1.0, 1.0))
+
+def skip_inheritance(rig):
+    rig.bones[5].bone.use_inherit_scale = False
+
+BLOCKERS = [
+    ('bone constraints', constrain_bone),
+    ('bone constraints', add_ik),
+    ('armature parent or constraints', constrain_armature),
+    ('drivers', add_driver),
+    ('nla tracks', add_nla_track),
+    ('action blending', blend_action),
+    ('object animation', animate_object),
+    ('bone inheritance', skip_inheritance)
+    ]
+
+
+def test_bone_parented_mesh_bakes_match_scene_evaluation():
+    
+    # parent the mesh to a bone
+    scene, rig = make_scene(frames=8)
+    mesh = rig.armature.children[0]
+    mesh.parent_type = 'BONE'
+    mesh.parent_bone = rig.bones[4].name
+    mesh.bone_offset = np.array(mesh.matrix_local.rows)
+    
+    # blocks the fast bake, the bake (fast bake enabled) sweeps frames
+    exporter = duke_export.DukeExport()
+    assert exporter.fast_bake_blocker(scene, rig.armature,
+        rig.bones) == 'mesh bone parent'
+    poses = duke_export.run_steps(exporter.iter_bake(scene, rig.armature,
+        rig.bones))
+    serial = exporter.bake_animation(scene, rig.armature, rig.bones)
+    assert np.array_equal(poses, serial)
+    assert not np.allclose(poses[0, 1], poses[-1, 1])
+
+
+@pytest.mark.parametrize('reason, change', BLOCKERS)
+def test_fast_bake_blockers_fall_back_to_scene_evaluation(reason, change):
+    scene, rig = make_scene(frames=6)
+    change(rig)
+    exporter = duke_export.DukeExport()
+    assert exporter.fast_bake_blocker(scene, rig.armature, rig.bones) == reason
+    assert not exporter.use_fast_bake(scene, rig.armature, rig.bones)
+    
+    # falls back to the per-frame bake (scene evaluation)
+    calls = []
+    frame_set = scene.frame_set
+    scene.frame_set = lambda frame : calls.append(frame) or frame_set(frame)
+    poses = duke_export.run_steps(exporter.iter_bake(scene, rig.armature,
+        rig.bones))
+    assert calls == list(range(1, 7))
+    assert poses.shape[0] == 6
@@ -0,0 +1,80 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - text output byte compatibility with the original exporter
+#
+# The golden files in 'golden/' were written by the original (per-vertex,
+# per-face, per-value) exporter from golden_scene(); default text exports must
+# stay byte for byte identical, as PuppetScan.m and PuppetAnimScan.m read them.
+
+# import
+import os
+import sys
+import pytest
+import duke_bench
+import duke_export
+
+
+# golden file directory
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+
+# golden scene; a small rig with shape keys, ngons, several materials, and
+# non-deformation bones, whose polygons and shape key vertices can also be
+# iterated per item (as the original exporter read them), animated over frames
+# 0 to 3
+def golden_scene():
+    
+    rig = duke_bench.Rig(vertices=12, shapes=2, bones=6, weights=2,
+        materials=3, meshes=2, seed=7)
+    for c in rig.armature.children:
+        
+        # polygons
+        polygons = c.data.polygons.arrays
+        loops = c.data.loops.arrays['vertex_index']
+        c.data.polygons.factory = (lambda p : lambda i : duke_bench.Block(
+            vertices=[int(v) for v in loops[p['loop_start'][i] :
+                p['loop_start'][i] + p['loop_total'][i]]],
+            material_index=int(p['material_index'][i])))(polygons)
+        
+        # shape key vertices
+        for block in c.data.shape_keys.key_blocks:
+            block.data.factory = (lambda co : lambda i : duke_bench.Block(
+                co=duke_bench.Vector(co[i])))(block.data.arrays['co'])
+    
+    scene = duke_bench.Scene('Scene', rig, 3)
+    scene.frame_start = 0
+    scene.frame_current = 0
+    
+    return scene, rig
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+@pytest.mark.parametrize('bulk', [True, False])
+def test_text_output_matches_golden_files(tmp_path, monkeypatch, workers,
+    bulk):
+    
+    # shape key vertices without bulk access take the per-vertex path
+    scene, rig = golden_scene()
+    if not bulk:
+        for c in rig.armature.children:
+            for block in c.data.shape_keys.key_blocks:
+                block.data = list(block.data)
+    
+    # export defaults
+    monkeypatch.setattr(sys.modules['bpy'].data, 'materials',
+        duke_bench.Collection(rig.materials))
+    scene.duke = duke_bench.Block(**{k : v for k, v in
+        vars(duke_export.DukeData).items() if not k.startswith('_')})
+    scene.duke.puppet_path = str(tmp_path / 'puppet.txt')
+    scene.duke.animation_path = str(tmp_path / 'animation.txt')
+    scene.duke.format_workers = workers
+    duke_export.DukeExport().export(scene, rig.armature)
+    
+    for name in ('puppet.txt', 'animation.txt'):
+        with open(os.path.join(GOLDEN, name), 'rb') as f:
+            expected = f.read()
+        with open(str(tmp_path / name), 'rb') as f:
+            assert f.read() == expected, name
@@ -0,0 +1,70 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - key frame tracks (compression and expansion)
+
+# import
+import numpy as np
+import pytest
+import duke_export
+import duke_reader
+
+
+# [n,3,4] poses rotating about z by angles under a [3,3] parent matrix
+def rotating(angles, parent=np.eye(3)):
+    poses = np.zeros((len(angles), 3, 4))
+    c, s = np.cos(angles), np.sin(angles)
+    R = np.zeros((len(angles), 3, 3))
+    R[:, 0, 0], R[:, 0, 1], R[:, 1, 0], R[:, 1, 1], R[:, 2, 2] = c, -s, s, c, 1
+    poses[:, :, :3] = np.matmul(parent, R)
+    poses[:, :, 3] = angles[:, None]
+    return poses
+
+
+# [n,3,4] poses shearing x into y linearly
+def shearing(n):
+    poses = np.zeros((n, 3, 4))
+    poses[:, :, :3] = np.eye(3)
+    poses[:, 1, 0] = np.linspace(0.0, 1.0, n)
+    return poses
+
+
+# compress, expand, and check a track against its tolerance
+def roundtrip(poses, tolerance):
+    keys = duke_reader.compress_track(poses, tolerance)
+    dense = duke_reader.expand_track(keys, poses[keys], len(poses))
+    assert np.abs(dense - poses).max() <= tolerance
+    return keys
+
+
+def test_export_shares_reader_pose_functions():
+    for name in ('decompose_poses', 'compose_poses', 'interpolate_poses',
+        'compress_track'):
+        assert getattr(duke_export, name) is getattr(duke_reader, name)
+
+
+def test_decompose_flags_shear():
+    sheared = duke_reader.decompose_poses(shearing(5))[3]
+    assert not sheared[0] and sheared[1:].all()
+    rotated = duke_reader.decompose_poses(rotating(np.linspace(0, 1, 5)))[3]
+    assert not rotated.any()
+
+
+def test_rotation_track_keys_ends():
+    keys = roundtrip(rotating(np.linspace(0.0, 1.0, 50)), 1e-3)
+    assert list(keys) == [0, 49]
+
+
+def test_shear_track_lerps_matrix():
+    keys = roundtrip(shearing(50), 1e-3)
+    assert list(keys) == [0, 49]
+
+
+@pytest.mark.parametrize('tolerance', [1e-2, 1e-3])
+def test_sheared_rotation_track_is_compressed(tolerance):
+    parent = np.diag([2.0, 1.0, 1.0])
+    poses = rotating(np.linspace(0.0, np.pi / 2, 100), parent)
+    keys = roundtrip(poses, tolerance)
+    assert len(keys) < len(poses) // 2
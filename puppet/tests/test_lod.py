@@ -0,0 +1,132 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - levels of detail (vertex clustering decimation)
+
+# import
+import sys
+import numpy as np
+import pytest
+import duke_bench
+import duke_export
+import duke_reader
+
+
+# level of detail face ratios
+RATIOS = [0.5, 0.1]
+
+
+# export a puppet with levels of detail and read it back
+def export_puppet(tmp_path, monkeypatch, file_format):
+    
+    rig = duke_bench.Rig(vertices=200, shapes=0, bones=4, weights=2,
+        materials=3, meshes=2, seed=4)
+    monkeypatch.setattr(sys.modules['bpy'].data, 'materials',
+        duke_bench.Collection(rig.materials))
+    scene = duke_bench.Scene('Scene', rig, 4)
+    scene.duke = duke_bench.Block(**{k : v for k, v in
+        vars(duke_export.DukeData).items() if not k.startswith('_')})
+    scene.duke.file_format = file_format
+    scene.duke.animation_enable = False
+    scene.duke.lod_enable = True
+    scene.duke.lod_ratios = ' '.join(map(repr, RATIOS))
+    scene.duke.puppet_path = str(tmp_path / 'puppet.out')
+    duke_export.DukeExport().export(scene, rig.armature)
+    if file_format == 'TEXT':
+        puppet = duke_reader.read_text(scene.duke.puppet_path, cache=False)
+    else:
+        puppet = duke_reader.read_binary(scene.duke.puppet_path)
+    
+    return rig, puppet
+
+
+# grid resolution chosen by decimate() (the coarsest grid keeping the target
+# number of triangles, bisected independently of iter_decimate())
+def resolution(co, triangles, ratio):
+    
+    target = max(int(round(ratio * len(triangles))), 1)
+    lo, hi = 1, duke_export.LOD_GRID
+    while lo < hi:
+        r = (lo + hi) // 2
+        if len(duke_export.cluster_grid(co, triangles, r)[1]) >= target:
+            hi = r
+        else:
+            lo = r + 1
+    
+    return lo
+
+
+# check that every cluster fits in one grid cell of resolution r
+def check_bounds(co, labels, r):
+    
+    size = float((co.max(axis=0) - co.min(axis=0)).max()) / r
+    for k in range(int(labels.max()) + 1):
+        cluster = co[labels == k]
+        assert len(cluster)
+        assert np.all(cluster.max(axis=0) - cluster.min(axis=0) <=
+            size * (1.0 + 1e-9))
+
+
+@pytest.mark.parametrize('r', [1, 2, 3, 8, 50])
+def test_cluster_grid_bounds(r):
+    
+    rng = np.random.default_rng(r)
+    co = rng.uniform(-1.0, 1.0, (300, 3)) * [3.0, 1.0, 0.5]
+    triangles = rng.integers(0, len(co), (400, 3)).astype(np.int32)
+    labels, keep = duke_export.cluster_grid(co, triangles, r)
+    
+    # clusters fit in a grid cell, and there are at most r^3 of them
+    assert labels.min() == 0 and labels.max() < r ** 3
+    check_bounds(co, labels, r)
+    
+    # kept triangles are non-degenerate, unique, and in order
+    t = labels[triangles[keep]]
+    assert np.all(np.diff(keep) > 0)
+    assert np.all((t[:, 0] != t[:, 1]) & (t[:, 1] != t[:, 2]) &
+        (t[:, 2] != t[:, 0]))
+    assert len(np.unique(np.sort(t, axis=1), axis=0)) == len(t)
+
+
+@pytest.mark.parametrize('file_format', ['TEXT', 'BINARY'])
+def test_lods_match_clusters(tmp_path, monkeypatch, file_format):
+    
+    rig, puppet = export_puppet(tmp_path, monkeypatch, file_format)
+    exporter = duke_export.DukeExport()
+    for c, mesh in zip(rig.armature.children, puppet['meshes']):
+        co = c.data.vertices.arrays['co'].astype(np.float64)
+        triangles, _ = exporter.get_loop_triangles(c.data)
+        
+        assert [lod['ratio'] for lod in mesh['lods']] == RATIOS
+        for lod in mesh['lods']:
+            vertices, lut = lod['vertices'], lod['map']
+            n = len(vertices)
+            assert n < len(co)
+            
+            # lod vertices are distinct ascending mesh vertices, each its own
+            # cluster representative
+            assert np.all(np.diff(vertices) > 0)
+            assert 0 <= vertices[0] and vertices[-1] < len(co)
+            assert len(lut) == len(co)
+            assert lut.min() == 0 and lut.max() == n - 1
+            assert np.array_equal(lut[vertices], np.arange(n))
+            
+            # clusters are the grid cells of the chosen resolution
+            r = resolution(co, triangles, lod['ratio'])
+            labels, keep = duke_export.cluster_grid(co, triangles, r)
+            check_bounds(co, lut, r)
+            assert len(np.unique(np.column_stack((labels, lut)),
+                axis=0)) == n
+            
+            # lod faces index lod vertices, and are the kept triangles
+            faces = lod['faces']
+            assert faces.shape == (len(keep), 3)
+            assert faces.min() >= 0 and faces.max() < n
+            assert np.array_equal(faces, lut[triangles[keep]])
+            assert len(faces) >= round(lod['ratio'] * len(triangles))
+            
+            # lod face materials are the materials of their source faces
+            assert np.array_equal(lod['materials'],
+                exporter.get_triangles(c.data, {m.name : i for i, m in
+                enumerate(rig.materials)})[1][keep])
@@ -0,0 +1,75 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - batch export manifests
+
+# import
+import json
+import os
+import stat
+import sys
+import duke_export
+
+
+# stub blender (runs a job by writing each job and option path with its size
+# in bytes, and reports them as outputs)
+BLENDER = '''#!{python}
+import json
+import sys
+args = sys.argv[sys.argv.index('--') + 1 :]
+with open(args[args.index('--job') + 1]) as f:
+    job = json.load(f)
+paths = [job['puppet_path'], job['animation_path']]
+paths += [v for k, v in sorted(job['options'].items()) if k.endswith('_path')]
+for size, path in enumerate(paths, 10):
+    with open(path, 'w') as f:
+        f.write('x' * size)
+with open(args[args.index('--output') + 1], 'w') as f:
+    json.dump({{'status' : 'ok', 'outputs' : paths}}, f)
+'''
+
+
+# write manifest of one job with relative paths
+def write_manifest(tmp_path):
+    path = tmp_path / 'jobs' / 'manifest.json'
+    path.parent.mkdir()
+    path.write_text(json.dumps({'jobs' : [{
+        'blend'          : 'scene.blend',
+        'armature'       : 'Armature',
+        'puppet_path'    : 'puppet.out',
+        'animation_path' : 'animation.out',
+        'options'        : {'points_enable' : True,
+            'points_path' : 'points.json', 'profile_path' : 'profile.json',
+            'bake_command' : 'worker {start} {end}'}
+        }]}))
+    return str(path)
+
+
+def test_manifest_option_paths_are_relative_to_manifest(tmp_path):
+    root = str(tmp_path / 'jobs')
+    job = duke_export.load_manifest(write_manifest(tmp_path))[0]
+    assert job['puppet_path'] == os.path.join(root, 'puppet.out')
+    assert job['options']['points_path'] == os.path.join(root, 'points.json')
+    assert job['options']['profile_path'] == os.path.join(root,
+        'profile.json')
+    assert job['options']['bake_command'] == 'worker {start} {end}'
+
+
+def test_manifest_summary_counts_all_outputs(tmp_path):
+    
+    # stub blender executable
+    blender = tmp_path / 'blender'
+    blender.write_text(BLENDER.format(python=sys.executable))
+    blender.chmod(blender.stat().st_mode | stat.S_IEXEC)
+    
+    # run manifest
+    manifest = write_manifest(tmp_path)
+    report = duke_export.run_manifest(manifest, 1,
+        str(tmp_path / 'summary.json'), str(blender))
+    assert report['failures'] == 0
+    record = report['jobs'][0]
+    assert len(record['bytes']) == 4
+    assert report['bytes'] == 10 + 11 + 12 + 13
+    assert 'outputs' not in record
@@ -0,0 +1,150 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - modal export (ui steps, cancelling, and profiling)
+
+# import
+import os
+import sys
+import time
+import duke_bench
+import duke_export
+
+
+# export button recording its reports
+class Button(duke_export.DukeExportButton):
+    
+    latency = 0.0
+    
+    def __init__(self):
+        self.reports = []
+    
+    def report(self, kind, message):
+        self.reports.append((kind, message))
+
+
+# ui context stand-in (a window manager running no timers)
+def make_context(scene, armature):
+    wm = duke_bench.Block(event_timer_add=lambda dt, window : 'timer',
+        event_timer_remove=lambda timer : None,
+        modal_handler_add=lambda operator : None)
+    return duke_bench.Block(scene=scene, object=armature, window_manager=wm,
+        window=None, screen=duke_bench.Block(areas=[]))
+
+
+# puppet and animation export of a small rig (CHUNK lowered, so shapes and
+# weights take several steps)
+def make_scene(tmp_path, monkeypatch, file_format='TEXT'):
+    
+    rig = duke_bench.Rig(vertices=40, shapes=2, bones=6, weights=2,
+        materials=2, meshes=2, seed=0)
+    monkeypatch.setattr(sys.modules['bpy'].data, 'materials',
+        duke_bench.Collection(rig.materials))
+    monkeypatch.setattr(duke_export, 'CHUNK', 16)
+    scene = duke_bench.Scene('Scene', rig, 8)
+    scene.frame_current = 3
+    scene.duke = duke_bench.Block(**{k : v for k, v in
+        vars(duke_export.DukeData).items() if not k.startswith('_')})
+    scene.duke.file_format = file_format
+    scene.duke.puppet_enable = True
+    scene.duke.animation_enable = True
+    scene.duke.lod_enable = True
+    scene.duke.puppet_path = str(tmp_path / 'puppet.out')
+    scene.duke.animation_path = str(tmp_path / 'animation.out')
+    
+    return scene, rig
+
+
+def test_modal_steps_match_count(tmp_path, monkeypatch):
+    
+    scene, rig = make_scene(tmp_path, monkeypatch)
+    context = make_context(scene, rig.armature)
+    button = Button()
+    assert button.invoke(context, None) == {'RUNNING_MODAL'}
+    
+    # one step per timer event (zero latency target)
+    timer = duke_bench.Block(type='TIMER')
+    events = 0
+    while button.modal(context, timer) == {'RUNNING_MODAL'}:
+        events += 1
+    assert events == button.step == button.total
+    assert duke_export.DukeExportPanel.progress is None
+    assert all(os.path.exists(path) for path in button.paths)
+
+
+def test_modal_cancel_removes_outputs(tmp_path, monkeypatch):
+    for file_format in ('TEXT', 'BINARY'):
+        
+        scene, rig = make_scene(tmp_path, monkeypatch, file_format)
+        context = make_context(scene, rig.armature)
+        button = Button()
+        button.invoke(context, None)
+        
+        # run into the animation, then cancel
+        timer = duke_bench.Block(type='TIMER')
+        for _ in range(button.total - 2):
+            assert button.modal(context, timer) == {'RUNNING_MODAL'}
+        assert os.path.exists(button.paths[0])
+        escape = duke_bench.Block(type='ESC')
+        assert button.modal(context, escape) == {'CANCELLED'}
+        
+        # outputs removed, frame recalled, panel reset
+        assert not any(os.path.exists(path) for path in button.paths)
+        assert scene.frame_current == 3
+        assert duke_export.DukeExportPanel.progress is None
+
+
+def test_profiler_excludes_time_between_steps(tmp_path, monkeypatch):
+    
+    scene, rig = make_scene(tmp_path, monkeypatch)
+    scene.duke.profile_enable = True
+    scene.duke.profile_path = str(tmp_path / 'profile.json')
+    
+    # idle between steps (as the ui does)
+    steps = duke_export.DukeExport().iter_export(scene, rig.armature)
+    idle = 0.0
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            profiler = stop.value
+            break
+        time.sleep(0.005)
+        idle += 0.005
+    
+    # stages and total exclude idle time
+    report = profiler.report()
+    assert report['time'] < idle
+    assert sum(s['time'] for s in report['stages'].values()) < idle
+    assert report['stages']['mesh']['time'] < report['time']
+
+
+def test_profiler_counts_encoded_bytes(tmp_path, monkeypatch):
+    
+    scene, rig = make_scene(tmp_path, monkeypatch)
+    rig.materials[0].name = 'Matériau'
+    scene.duke.animation_enable = False
+    scene.duke.lod_enable = False
+    scene.duke.profile_enable = True
+    scene.duke.profile_path = str(tmp_path / 'profile.json')
+    
+    # section bytes (all but the puppet header)
+    def export(workers):
+        scene.duke.format_workers = workers
+        profiler = duke_export.DukeExport().export(scene, rig.armature)
+        with open(scene.duke.puppet_path, 'rb') as f:
+            data = f.read()
+        nbytes = sum(s['bytes'] for s in profiler.report()['stages'].values())
+        return nbytes, len(data) - data.index(b'\n\n') - 2, data
+    
+    # serial stages count every encoded section byte
+    nbytes, expected, data = export(0)
+    assert len(data) > len(data.decode('utf-8'))
+    assert nbytes == expected
+    
+    # pooled stages count the batches written so far
+    nbytes, expected, pooled = export(2)
+    assert pooled == data
+    assert 0 < nbytes <= expected
@@ -0,0 +1,51 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - text reader (section index and section reads)
+
+# import
+import gzip
+import pytest
+import duke_reader
+
+
+# duke text file of n bone sections
+def text(n):
+    return ''.join('type : bone\nname : Bone_%03d\n%i 0 0\n%i 1 1\n\n' % (
+        i, i, i) for i in range(n))
+
+
+def test_compressed_sections_decompress_once(tmp_path, monkeypatch):
+    
+    # write plain and compressed copies
+    plain = tmp_path / 'puppet.out'
+    plain.write_text(text(50))
+    compressed = str(plain) + '.gz'
+    with gzip.open(compressed, 'wt') as f:
+        f.write(text(50))
+    
+    # count decompressing opens
+    opens = []
+    def open_gzip(path, mode):
+        opens.append(path)
+        return gzip.open(path, mode)
+    monkeypatch.setitem(duke_reader.DECOMPRESSORS, '.gz', open_gzip)
+    
+    # read every section (index build, then one decompression)
+    expected = duke_reader.DukeTextReader(str(plain), cache=False)
+    reader = duke_reader.DukeTextReader(compressed, cache=False)
+    assert reader.keys() == expected.keys()
+    for key in reader.keys():
+        assert reader.lines(key) == expected.lines(key)
+    assert len(opens) == 2
+
+
+def test_duplicate_sections_raise(tmp_path):
+    
+    # distinct blender names renamed alike ('Bone.001' and 'Bone 001')
+    path = tmp_path / 'puppet.out'
+    path.write_text(text(3) + text(1).replace('Bone_000', 'Bone_001'))
+    with pytest.raises(ValueError, match='bone/Bone_001'):
+        duke_reader.DukeTextReader(str(path), cache=False)
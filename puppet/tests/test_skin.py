@@ -0,0 +1,84 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - sparse skinning matrices (CSR layout)
+
+# import
+import sys
+import numpy as np
+import pytest
+import duke_bench
+import duke_export
+import duke_reader
+
+
+# export a puppet with skinning matrices and read it back
+def export_puppet(tmp_path, monkeypatch, file_format):
+    
+    rig = duke_bench.Rig(vertices=40, shapes=0, bones=10, weights=3,
+        materials=2, meshes=2, seed=5)
+    monkeypatch.setattr(sys.modules['bpy'].data, 'materials',
+        duke_bench.Collection(rig.materials))
+    scene = duke_bench.Scene('Scene', rig, 4)
+    scene.duke = duke_bench.Block(**{k : v for k, v in
+        vars(duke_export.DukeData).items() if not k.startswith('_')})
+    scene.duke.file_format = file_format
+    scene.duke.animation_enable = False
+    scene.duke.skin_enable = True
+    scene.duke.puppet_path = str(tmp_path / 'puppet.out')
+    duke_export.DukeExport().export(scene, rig.armature)
+    if file_format == 'TEXT':
+        puppet = duke_reader.read_text(scene.duke.puppet_path, cache=False)
+    else:
+        puppet = duke_reader.read_binary(scene.duke.puppet_path)
+    
+    return rig, puppet
+
+
+@pytest.mark.parametrize('file_format', ['TEXT', 'BINARY'])
+def test_skin_matches_dense_weights(tmp_path, monkeypatch, file_format):
+    
+    rig, puppet = export_puppet(tmp_path, monkeypatch, file_format)
+    
+    # exported bones are the deformation bones (the skin columns)
+    rename = duke_export.DukeExport().rename
+    deform = [rename(b.name) for b in rig.bones if b.bone.use_deform]
+    assert [b['name'] for b in puppet['bones']] == deform
+    assert len(deform) < len(rig.bones)
+    
+    for k, mesh in enumerate(puppet['meshes']):
+        nvertices = len(mesh['shapes'][0]['vertices'])
+        
+        # dense weights from the vertex groups (non-deformation bone groups
+        # are dropped)
+        c = rig.armature.children[k]
+        columns = {rename(g.name) : j for j, g in enumerate(c.vertex_groups)}
+        groups = np.zeros((nvertices, len(rig.bones)), dtype=np.float32)
+        for i in range(nvertices):
+            for g in c.data.vertices[i].groups:
+                groups[i, g.group] = g.weight
+        groups = groups[:, [columns[name] for name in deform]]
+        
+        # dense weights from the per-bone weights sections
+        dense = np.zeros((nvertices, len(deform)), dtype=np.float32)
+        for j, b in enumerate(puppet['bones']):
+            dense[b['indices'][k], j] = b['weights'][k]
+        assert np.array_equal(dense, groups)
+        
+        # dense weights from the skinning matrix
+        skin = mesh['skin']
+        pointers = skin['pointers']
+        assert len(pointers) == nvertices + 1
+        assert pointers[0] == 0 and pointers[-1] == len(skin['bones'])
+        assert np.all(np.diff(pointers) >= 0)
+        assert len(skin['weights']) == len(skin['bones'])
+        assert np.all((0 <= skin['bones']) & (skin['bones'] < len(deform)))
+        csr = np.zeros((nvertices, len(deform)), dtype=np.float32)
+        rows = np.repeat(np.arange(nvertices), np.diff(pointers))
+        np.add.at(csr, (rows, skin['bones']), skin['weights'])
+        assert np.array_equal(csr, dense)
+        
+        # one entry per nonzero weight
+        assert len(skin['bones']) == np.count_nonzero(dense)
@@ -0,0 +1,76 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - mesh topology (edges, vertex face adjacency, and normals)
+
+# import
+import sys
+import numpy as np
+import pytest
+import duke_bench
+import duke_export
+import duke_reader
+
+
+# export a puppet with topology and read its meshes back
+def export_meshes(tmp_path, monkeypatch, file_format, triangulate):
+    
+    rig = duke_bench.Rig(vertices=30, shapes=0, bones=4, weights=2,
+        materials=2, meshes=2, seed=0)
+    monkeypatch.setattr(sys.modules['bpy'].data, 'materials',
+        duke_bench.Collection(rig.materials))
+    scene = duke_bench.Scene('Scene', rig, 4)
+    scene.duke = duke_bench.Block(**{k : v for k, v in
+        vars(duke_export.DukeData).items() if not k.startswith('_')})
+    scene.duke.file_format = file_format
+    scene.duke.animation_enable = False
+    scene.duke.topology_enable = True
+    scene.duke.triangulate = triangulate
+    scene.duke.puppet_path = str(tmp_path / 'puppet.out')
+    duke_export.DukeExport().export(scene, rig.armature)
+    if file_format == 'TEXT':
+        puppet = duke_reader.read_text(scene.duke.puppet_path, cache=False)
+    else:
+        puppet = duke_reader.read_binary(scene.duke.puppet_path)
+    
+    return rig, puppet['meshes']
+
+
+@pytest.mark.parametrize('file_format', ['TEXT', 'BINARY'])
+@pytest.mark.parametrize('triangulate', [False, True])
+def test_topology_matches_faces(tmp_path, monkeypatch, file_format,
+    triangulate):
+    
+    rig, meshes = export_meshes(tmp_path, monkeypatch, file_format,
+        triangulate)
+    for c, mesh in zip(rig.armature.children, meshes):
+        topology = mesh['topology']
+        faces = mesh['faces']
+        
+        # edges are the unique face sides (the mesh edges of polygons)
+        sides = set()
+        for face in faces:
+            face = face[face >= 0]
+            for a, b in zip(face, np.roll(face, -1)):
+                sides.add((min(a, b), max(a, b)))
+        edges = topology['edges']
+        assert sorted(map(tuple, edges.tolist())) == sorted(sides)
+        if not triangulate:
+            assert np.array_equal(edges, c.data.edges.arrays['vertices'])
+        
+        # vertex face adjacency
+        pointers = topology['pointers']
+        for v in range(len(pointers) - 1):
+            adjacent = topology['faces'][pointers[v] : pointers[v + 1]]
+            assert list(adjacent) == sorted(np.nonzero((faces == v).any(
+                axis=1))[0])
+        
+        # face normals (of the source polygon of each face)
+        normals = c.data.polygons.arrays['normal']
+        if triangulate:
+            _, polygons = duke_export.DukeExport().get_loop_triangles(c.data)
+            normals = normals[polygons]
+        assert np.array_equal(topology['face_normals'], normals)
+        assert np.allclose(np.linalg.norm(normals, axis=1), 1.0)
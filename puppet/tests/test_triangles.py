@@ -0,0 +1,116 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - triangulated faces (loop triangles and fan fallback)
+
+# import
+import numpy as np
+import pytest
+import duke_bench
+import duke_export
+
+
+# polygon sizes (triangles, quads, and ngons)
+SIZES = [3, 4, 5, 4, 6, 8, 3, 7]
+
+
+# build planar convex polygons (regular polygons in the z = 0 plane, with their
+# own vertices) and material slots, optionally with loop triangles
+def make_data(loop_triangles):
+    
+    rng = np.random.default_rng(2)
+    
+    # vertices and loops (counter-clockwise about +z)
+    co = []
+    loops = []
+    for i, n in enumerate(SIZES):
+        angles = 2.0 * np.pi * np.arange(n) / n + rng.uniform(0.0, 1.0)
+        radius = rng.uniform(0.5, 2.0)
+        for a in angles:
+            loops.append(len(co))
+            co.append((i * 5.0 + radius * np.cos(a), radius * np.sin(a), 0.0))
+    co = np.array(co, dtype=np.float32)
+    loops = np.array(loops, dtype=np.int32)
+    
+    # polygons (material slots cycle through the mesh materials)
+    totals = np.array(SIZES, dtype=np.int32)
+    starts = np.zeros(len(SIZES), dtype=np.int32)
+    np.cumsum(totals[: -1], out=starts[1 :])
+    slots = (np.arange(len(SIZES)) % 3).astype(np.int32)
+    materials = [duke_bench.Block(name='Material.%03d' % i) for i in range(3)]
+    data = duke_bench.Block(name='Mesh.data',
+        vertices=duke_bench.Collection(arrays={'co' : co}, length=len(co)),
+        polygons=duke_bench.Collection(length=len(SIZES), arrays={
+            'loop_start' : starts, 'loop_total' : totals,
+            'material_index' : slots}),
+        loops=duke_bench.Collection(length=len(loops),
+            arrays={'vertex_index' : loops}),
+        materials=duke_bench.Collection(materials[:: -1]))
+    
+    # loop triangles (blender 2.8+), fanned from the last polygon vertex so they
+    # differ from the fan fallback
+    if loop_triangles:
+        def calc_loop_triangles():
+            triangles = []
+            polygons = []
+            for i, (s, n) in enumerate(zip(starts, totals)):
+                for j in range(n - 2):
+                    triangles.append((loops[s + n - 1], loops[s + j],
+                        loops[s + j + 1]))
+                    polygons.append(i)
+            data.loop_triangles = duke_bench.Collection(
+                length=len(polygons), arrays={
+                'vertices' : np.array(triangles, dtype=np.int32),
+                'polygon_index' : np.array(polygons, dtype=np.int32)})
+        data.loop_triangles = duke_bench.Collection(length=0)
+        data.calc_loop_triangles = calc_loop_triangles
+    
+    return data, co, loops, starts, totals, slots
+
+
+@pytest.mark.parametrize('loop_triangles', [True, False])
+def test_triangles_cover_polygons(loop_triangles):
+    
+    data, co, loops, starts, totals, slots = make_data(loop_triangles)
+    table = {'Material.%03d' % i : i for i in range(3)}
+    table['default'] = 3
+    exporter = duke_export.DukeExport()
+    triangles, polygons = exporter.get_loop_triangles(data)
+    _, materials = exporter.get_triangles(data, table)
+    
+    # n - 2 triangles per polygon, in polygon order
+    assert triangles.shape == (int(np.sum(totals - 2)), 3)
+    assert np.array_equal(polygons, np.repeat(np.arange(len(SIZES)),
+        totals - 2))
+    
+    # triangle vertices are distinct vertices of their polygon
+    for t, p in zip(triangles, polygons):
+        assert len(set(t)) == 3
+        assert set(t) <= set(loops[starts[p] : starts[p] + totals[p]])
+    
+    # triangles tile their polygon (signed areas about +z sum to the polygon
+    # area, so every triangle keeps the polygon winding)
+    a, b, c = co[triangles[:, 0]], co[triangles[:, 1]], co[triangles[:, 2]]
+    areas = 0.5 * np.cross(b - a, c - a)[:, 2]
+    assert np.all(areas > 0.0)
+    for p, (s, n) in enumerate(zip(starts, totals)):
+        x, y = co[loops[s : s + n], 0], co[loops[s : s + n], 1]
+        area = 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+        assert np.isclose(areas[polygons == p].sum(), area, rtol=1e-5)
+    
+    # materials are carried per triangle (slots map through the reversed mesh
+    # materials to global indices)
+    assert np.array_equal(materials, (2 - slots)[polygons])
+
+
+def test_loop_triangles_differ_from_fan():
+    
+    exporter = duke_export.DukeExport()
+    loop, _ = exporter.get_loop_triangles(make_data(True)[0])
+    fan, _ = exporter.get_loop_triangles(make_data(False)[0])
+    
+    # same triangle count, different triangulation of the quads and ngons
+    assert loop.shape == fan.shape
+    assert not np.array_equal(loop, fan)
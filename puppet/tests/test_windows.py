@@ -0,0 +1,99 @@
+#==============================================================================#
+# Duke University                                                              #
+# K. P. Trofatter                                                              #
+# kpt2@duke.edu                                                                #
+#==============================================================================#
+# Duke tests - animation frame windows (manifest track offsets)
+
+# import
+import json
+import os
+import numpy as np
+import pytest
+import duke_bench
+import duke_export
+import duke_reader
+
+
+# write text animation windows of random poses (returns the manifest); the
+# first bone name is not ascii, so byte and character offsets differ
+def write_windows(tmp_path, compression, frames=10, size=4):
+    
+    rig = duke_bench.Rig(vertices=8, shapes=0, bones=6, weights=2,
+        materials=1, meshes=2, seed=0)
+    rig.bones[0].name = 'Bône'
+    scene = duke_bench.Scene('Scene', rig, frames)
+    scene.duke = duke_bench.Block(**{k : v for k, v in
+        vars(duke_export.DukeData).items() if not k.startswith('_')})
+    scene.duke.file_format = 'TEXT'
+    scene.duke.animation_path = str(tmp_path / 'animation.out')
+    scene.duke.window_frames = size
+    scene.duke.compression = compression
+    
+    ntracks = 1 + len(rig.armature.children) + sum(b.bone.use_deform
+        for b in rig.bones)
+    poses = np.random.default_rng(0).normal(size=(frames, ntracks, 3, 4))
+    duke_export.run_steps(duke_export.DukeExport().iter_windows(scene,
+        rig.armature, rig.bones, poses=poses))
+    
+    with open(duke_export.window_manifest(scene.duke.animation_path)) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('compression',
+    ['NONE'] + list(duke_export.COMPRESSORS))
+def test_window_offsets_locate_tracks(tmp_path, compression):
+    manifest = write_windows(tmp_path, compression)
+    assert [w['frames'] for w in manifest['windows']] == [4, 4, 2]
+    for window in manifest['windows']:
+        path = os.path.join(str(tmp_path), window['path'])
+        with duke_reader.open_file(path, 'rb') as f:
+            data = f.read()
+        assert len(window['offsets']) == len(manifest['tracks'])
+        for offset, track in zip(window['offsets'], manifest['tracks']):
+            kind, name = track.split('/')
+            assert data[offset :].startswith(('type : %s\nname : %s\n' % (
+                kind, name)).encode('utf-8'))
+
+
+def test_window_offsets_match_across_compressors(tmp_path):
+    offsets = []
+    for compression in ['NONE'] + list(duke_export.COMPRESSORS):
+        directory = tmp_path / compression
+        directory.mkdir()
+        manifest = write_windows(directory, compression)
+        offsets.append([w['offsets'] for w in manifest['windows']])
+    assert all(o == offsets[0] for o in offsets)
+
+
+@pytest.mark.parametrize('compression',
+    ['NONE'] + list(duke_export.COMPRESSORS))
+def test_read_window_seeks_to_offsets(tmp_path, compression, monkeypatch):
+    
+    write_windows(tmp_path, compression)
+    path = duke_export.window_manifest(str(tmp_path / 'animation.out'))
+    
+    # record the sections indexed
+    offsets = []
+    index_text = duke_reader.index_text
+    def record(path, indexed=None):
+        offsets.append(indexed)
+        return index_text(path, indexed)
+    monkeypatch.setattr(duke_reader, 'index_text', record)
+    
+    # windows read at the manifest offsets match full reads
+    manifest = duke_reader.read_windows(path)
+    for window in manifest['windows']:
+        animation = duke_reader.read_window(path, window['first'])
+        assert offsets[-1] == [0] + window['offsets']
+        expected = duke_reader.read_text(os.path.join(str(tmp_path),
+            window['path']), cache=False)
+        assert animation['first'] == window['first']
+        assert animation['name'] == expected['name']
+        assert animation['frames'] == expected['frames'] == window['frames']
+        assert np.array_equal(animation['A'], expected['A'])
+        for kind in ('meshes', 'bones'):
+            assert [t['name'] for t in animation[kind]] == [t['name']
+                for t in expected[kind]]
+            for t, u in zip(animation[kind], expected[kind]):
+                assert np.array_equal(t['A'], u['A'])